@@ -0,0 +1,302 @@
+import os
+import io
+import re
+import argparse
+import json
+import hashlib
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+
+from font_mapper import FontMapper
+from pack_script import build_script, load_text_entries, merge_text_entries
+from dialog_layout import load_glyph_widths
+from pack_spirit import repack_spirit
+from parse_script import make_text_key, split_text_key
+from translation_store import is_store, open_store, store_texts, script_digest
+from translation_memory import TranslationMemory
+from check_encoding import add_text_characters, find_unencodable, print_failures
+
+CACHE_FILE = ".batch_pack.json"
+SCRIPT_FILE_RE = re.compile(r'^file_(\d+)\.(dialog|scenario)$')
+
+font_map = None
+
+def find_script_files(spirit_dir):
+    """
+    Finds every file_<id>.dialog/.scenario in the unpacked SPIRIT tree.
+    Returns a mapping of file id -> path.
+    """
+    scripts = {}
+    for root, _, files in os.walk(spirit_dir):
+        for name in files:
+            match = SCRIPT_FILE_RE.match(name)
+            if match:
+                scripts[int(match.group(1))] = os.path.join(root, name)
+    return scripts
+
+def load_translation_map(filename):
+    """
+    Loads the mapping of script ids to translation sources.
+
+    {
+        "123": "translations/file_123.xlsx",
+        "456": {"json": "dumps/file_456.json", "text": "translations/file_456.xlsx", "fixes": true, "reflow": true, "widths": "font/widths.json", "pool": true}
+    }
+
+    Relative paths are resolved against the directory of the mapping file.
+    Without "json" the parsed dump next to the script file (file_<id>.json) is used.
+    """
+    with open(filename, 'r', encoding='utf-8') as f:
+        raw = json.load(f)
+
+    base_dir = os.path.dirname(os.path.abspath(filename))
+    mapping = {}
+    for script_id, source in raw.items():
+        if isinstance(source, str):
+            source = {"text": source}
+        source = dict(source)
+        for key in ("json", "text", "widths"):
+            if source.get(key):
+                source[key] = os.path.join(base_dir, source[key])
+        mapping[int(script_id)] = source
+    return mapping
+
+def file_digest(hasher, path):
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            hasher.update(chunk)
+
+def input_digest(job, font_table, ascii_table):
+    """
+    Hash of everything a packed script depends on: JSON dump, text source, font tables, glyph widths
+    and fixes/reflow/pool flags.
+    For a translation store only the rows of this script are hashed.
+    """
+    hasher = hashlib.sha1()
+    text_source = job.get("text")
+    if text_source and is_store(text_source):
+        conn = open_store(text_source)
+        hasher.update(script_digest(conn, job["id"]).encode('utf-8'))
+        conn.close()
+        text_source = None
+
+    for path in (job["json"], text_source, font_table, ascii_table, job.get("widths") if job.get("reflow") else None):
+        if path:
+            hasher.update(os.path.basename(path).encode('utf-8'))
+            file_digest(hasher, path)
+    hasher.update(b'fixes' if job.get("fixes") else b'')
+    hasher.update(b'reflow' if job.get("reflow") else b'')
+    hasher.update(b'pool' if job.get("pool") else b'')
+    if job.get("memory"):
+        hasher.update(json.dumps(job["memory"], sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    return hasher.hexdigest()
+
+def output_digest(path):
+    """Hash of a packed script on disk, None if it is missing"""
+    if not os.path.exists(path):
+        return None
+    hasher = hashlib.sha1()
+    file_digest(hasher, path)
+    return hasher.hexdigest()
+
+def is_unchanged(cached, digest, path):
+    """A script is skipped only if its inputs are unchanged and the file on disk is the one written last time"""
+    return isinstance(cached, dict) and cached.get("input") == digest and cached.get("output") == output_digest(path)
+
+def load_job_texts(job, table_entries):
+    """
+    Returns the table entries of a job with its translation source
+    (and translation memory fills) applied.
+    """
+    text_source = job.get("text")
+    if text_source and is_store(text_source):
+        conn = open_store(text_source)
+        table_entries = merge_text_entries(table_entries, store_texts(conn, job["id"]))
+        conn.close()
+    elif text_source:
+        table_entries = merge_text_entries(table_entries, load_text_entries(text_source, job["id"]))
+
+    if job.get("memory"):
+        table_entries = merge_text_entries(table_entries, {int(i): text for i, text in job["memory"].items()})
+    return table_entries
+
+def fill_from_memory(jobs):
+    """
+    Translates untranslated duplicates of translated entries across all jobs.
+    Only the scripts of the jobs are indexed: they are the only entries the batch packs,
+    databases and unmapped scripts are neither filled nor counted.
+    The fills are stored in job["memory"] as table index -> text.
+    """
+    memory = TranslationMemory()
+
+    translations = {}
+    for job in jobs:
+        with open(job["json"], 'r', encoding='utf-8') as f:
+            sources = json.load(f)['block_3']['table_entries']
+        for index, source in enumerate(sources):
+            memory.add(make_text_key(job["id"], index), source)
+        for index, text in enumerate(load_job_texts(job, sources)):
+            if index < len(sources) and text and text != sources[index]:
+                translations[make_text_key(job["id"], index)] = text
+
+    filled = memory.fill(translations)
+    jobs_by_id = {str(job["id"]): job for job in jobs}
+    for key, text in filled.items():
+        script_id, index = split_text_key(key)
+        jobs_by_id[script_id].setdefault("memory", {})[str(index)] = text
+
+    print(f"[+] Translation memory filled {len(filled)} entries")
+
+def check_jobs_encoding(jobs, font_table, ascii_table):
+    """
+    Checks every character of the translated entries of all jobs against the font in one pass,
+    so a build doesn't stop at the first unencodable character. Returns the failures.
+    """
+    characters = {}
+    for job in jobs:
+        with open(job["json"], 'r', encoding='utf-8') as f:
+            sources = json.load(f)['block_3']['table_entries']
+        for index, text in enumerate(load_job_texts(job, sources)):
+            add_text_characters(characters, job.get("text") or job["json"], make_text_key(job["id"], index), text)
+    return find_unencodable(characters, FontMapper(ascii_table, font_table))
+
+def init_worker(ascii_table, font_table):
+    global font_map
+    font_map = FontMapper(ascii_table, font_table)
+
+def pack_job(job):
+    with open(job["json"], 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    originals = data['block_3']['table_entries']
+    data['block_3']['table_entries'] = load_job_texts(job, originals)
+    widths = load_glyph_widths(job["widths"]) if job.get("widths") else None
+
+    # Builders print block sizes for every script, keep the batch log readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        bin_data = build_script(data, font_map, None, job.get("fixes", False), reflow=job.get("reflow", False),
+                                pool=job.get("pool", False), widths=widths, originals=originals)
+    return job["id"], bin_data
+
+def make_jobs(spirit_dir, mapping, fixes=False, reflow=False, pool=False, widths=None):
+    """
+    Resolves the translation mapping against the unpacked tree.
+    Returns a job per script: its mapping entry with "id", "path" of the script file
+    and "json" dump (next to the script unless mapped), "fixes", "reflow" and "pool" flags
+    and the "widths" file of the reflow.
+    """
+    script_files = find_script_files(spirit_dir)
+    all_jobs = []
+    for script_id, source in sorted(mapping.items()):
+        script_path = script_files.get(script_id)
+        if script_path is None:
+            print(f"[!] Script file_{script_id} not found in {spirit_dir}")
+            continue
+
+        job = dict(source)
+        job["id"] = script_id
+        job["path"] = script_path
+        job.setdefault("json", os.path.splitext(script_path)[0] + ".json")
+        job.setdefault("fixes", fixes)
+        job.setdefault("reflow", reflow)
+        job.setdefault("pool", pool)
+        if widths:
+            job.setdefault("widths", widths)
+        all_jobs.append(job)
+    return all_jobs
+
+def batch_pack_scripts(spirit_dir, mapping, font_table, ascii_table, jobs=None, fixes=False, force=False, write=True,
+                       memory=False, reflow=False, check=False, pool=False, widths=None):
+    """
+    Packs every script of the mapping in parallel.
+
+    With write=True the results replace file_<id>.dialog/.scenario in the unpacked tree and
+    scripts whose inputs did not change since the last run are skipped, as long as the file
+    on disk is still the one written then (a re-extracted tree is packed again).
+    With memory=True untranslated duplicates of translated entries are filled from the translation memory.
+    With reflow=True English entries are rewrapped to the window of their original text with the glyph
+    advances of the widths file, each worker lays out repeated strings once.
+    With pool=True consecutive identical entries of a script share one copy of their text.
+    With check=True nothing is packed if any character of the translations can't be encoded.
+    Returns a mapping of file id -> packed data for every built script.
+    """
+    cache_path = os.path.join(spirit_dir, CACHE_FILE)
+    cache = {}
+    if write and not force and os.path.exists(cache_path):
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+
+    all_jobs = make_jobs(spirit_dir, mapping, fixes, reflow, pool, widths)
+
+    if memory:
+        fill_from_memory(all_jobs)
+
+    if check:
+        failures = check_jobs_encoding(all_jobs, font_table, ascii_table)
+        if failures:
+            print_failures(failures)
+            raise ValueError(f"{len(failures)} character(s) cannot be encoded")
+
+    pending = []
+    digests = {}
+    for job in all_jobs:
+        script_id = job["id"]
+        digest = input_digest(job, font_table, ascii_table)
+        digests[script_id] = digest
+        if write and is_unchanged(cache.get(str(script_id)), digest, job["path"]):
+            continue
+        pending.append(job)
+
+    print(f"[+] Scripts to pack: {len(pending)} (unchanged: {len(digests) - len(pending)})")
+
+    results = {}
+    paths = {job["id"]: job["path"] for job in pending}
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                             initargs=(ascii_table, font_table)) as pool:
+        for script_id, bin_data in pool.map(pack_job, pending):
+            results[script_id] = bin_data
+            if write:
+                with open(paths[script_id], 'wb') as f:
+                    f.write(bin_data)
+                cache[str(script_id)] = {"input": digests[script_id],
+                                         "output": hashlib.sha1(bin_data).hexdigest()}
+            print(f"[+] Packed file_{script_id}: {len(bin_data)} bytes")
+
+    if write:
+        with open(cache_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, indent=2)
+
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack all translated scripts into the unpacked SPIRIT directory")
+    parser.add_argument("spirit_dir", help="Extracted SPIRIT directory")
+    parser.add_argument("translations", help="JSON mapping of script ids to translation sources")
+    parser.add_argument("--jobs", type=int, help="Number of worker processes (default: CPU count)")
+    parser.add_argument("--fixes", help="Apply various font fixes to the scripts", action="store_true")
+    parser.add_argument("--force", help="Pack all scripts even if their inputs are unchanged", action="store_true")
+    parser.add_argument("--no_write", help="Do not write packed scripts into the SPIRIT directory", action="store_true")
+    parser.add_argument("--memory", help="Fill untranslated duplicates of translated entries from the translation memory",
+                        action="store_true")
+    parser.add_argument("--reflow", help="Rewrap English text to the window of each entry", action="store_true")
+    parser.add_argument("--widths", help="JSON file with glyph advances in pixels used by --reflow")
+    parser.add_argument("--check", help="Check that every character can be encoded before packing", action="store_true")
+    parser.add_argument("--pool", help="Write consecutive identical entries of a script only once", action="store_true")
+    parser.add_argument("--repack", nargs=3, metavar=("OUTPUT_SPIRIT", "SLPM_FILE", "OUTPUT_SLPM"),
+                        help="Repack SPIRIT.DAT with the packed scripts")
+    parser.add_argument("--font_table", default="./font/font-table.txt", help="Path to font-table.txt")
+    parser.add_argument("--ascii_table", default="./font/ascii-table.bin", help="Path to ascii-table.bin")
+    args = parser.parse_args()
+
+    mapping = load_translation_map(args.translations)
+    results = batch_pack_scripts(args.spirit_dir, mapping, args.font_table, args.ascii_table,
+                                 args.jobs, args.fixes, args.force, not args.no_write, args.memory, args.reflow,
+                                 args.check, args.pool, args.widths)
+
+    if args.repack:
+        # Scripts written into the tree are picked up from disk, in-memory results are handed over directly
+        overrides = results if args.no_write else None
+        repack_spirit(args.spirit_dir, *args.repack, overrides=overrides)
+
+if __name__ == '__main__':
+    main()
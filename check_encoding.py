@@ -0,0 +1,104 @@
+import re
+import sys
+import time
+import argparse
+
+from font_mapper import FontMapper
+from pack_script import normalize_text
+from parse_script import make_text_key
+from translation_store import iter_source_texts
+
+TOKEN_RE = re.compile(r'\[([^\]]*)\]')
+
+# Token parameters written byte by byte through ascii-table.bin
+PARAM_TOKENS = ("IMG:", "KEYWORD:")
+# Dakuten marks have their own single-byte codes in database text
+DATABASE_MARKS = {'゛': 0xDE, '゜': 0xDF}
+
+def text_characters(text):
+    """
+    Yields (position, character, context) of every character the packers encode:
+    "text" for printed characters, "param" for [IMG:..]/[KEYWORD:..] parameters
+    which must have single-byte codes.
+    """
+    position = 0
+    for match in TOKEN_RE.finditer(text):
+        for i in range(position, match.start()):
+            if text[i] != '\n':
+                yield i, text[i], "text"
+        token = match.group(1)
+        if token.startswith(PARAM_TOKENS):
+            start = match.start(1) + token.index(':') + 1
+            for i in range(start, match.end(1)):
+                yield i, text[i], "param"
+        position = match.end()
+    for i in range(position, len(text)):
+        if text[i] != '\n':
+            yield i, text[i], "text"
+
+def is_encodable(ch, context, database, font_map: FontMapper):
+    """Same lookups as pack_script_text/pack_database_text"""
+    if database and ch in DATABASE_MARKS and context == "text":
+        return True
+    ch = normalize_text(ch)
+    if font_map.get_ascii_code(ch):
+        return True
+    return context == "text" and bool(font_map.get_code(ch))
+
+def add_text_characters(characters, source, key, text, database=False):
+    """Records the location of every character of one text entry"""
+    for position, ch, context in text_characters(text):
+        characters.setdefault((ch, context, database), []).append((source, key, position))
+
+def collect_characters(sources):
+    """
+    Reads every translation source once.
+    Returns a mapping of (character, context, database) -> list of (source, key, position).
+    """
+    characters = {}
+    for source in sources:
+        for script_id, index, text in iter_source_texts(source):
+            add_text_characters(characters, source, make_text_key(script_id, index), text, not isinstance(index, int))
+    return characters
+
+def find_unencodable(characters, font_map: FontMapper):
+    """
+    Tests every distinct character once.
+    Returns a list of (character, context, locations) that can't be encoded.
+    """
+    failures = []
+    for (ch, context, database), locations in sorted(characters.items()):
+        if not is_encodable(ch, context, database, font_map):
+            failures.append((ch, context, locations))
+    return failures
+
+def print_failures(failures, max_locations=10):
+    for ch, context, locations in failures:
+        label = " in token parameter" if context == "param" else ""
+        print(f"[!] '{ch}' U+{ord(ch):04X}{label}: {len(locations)} occurrence(s)")
+        shown = locations if not max_locations else locations[:max_locations]
+        for source, key, position in shown:
+            print(f"      {source} {key} @{position}")
+        if len(shown) < len(locations):
+            print(f"      ... {len(locations) - len(shown)} more")
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that every character of the translations can be encoded")
+    parser.add_argument("sources", nargs='+', help="Translation sources (.sqlite/.db, .po/.xlf/.tsv, .xlsx)")
+    parser.add_argument("--max_locations", type=int, default=10, help="Locations to print per character (0 - all)")
+    parser.add_argument("--font_table", default="./font/font-table.txt", help="Path to font-table.txt")
+    parser.add_argument("--ascii_table", default="./font/ascii-table.bin", help="Path to ascii-table.bin")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    characters = collect_characters(args.sources)
+    failures = find_unencodable(characters, FontMapper(args.ascii_table, args.font_table))
+    elapsed = time.perf_counter() - start
+
+    print_failures(failures, args.max_locations)
+    print(f"[+] Checked {len(characters)} distinct characters in {elapsed:.2f} s | unencodable: {len(failures)}")
+    if failures:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+import time
+import argparse
+
+from parse_script import make_text_key
+from translation_store import iter_source_texts
+from dialog_layout import GEOMETRIES, load_glyph_widths, layout_text
+
+def check_layout(sources, columns, rows, widths=None):
+    """
+    Lays out every translated entry of the sources.
+    Returns a list of (key, windows, issues) for entries that overflow and the number of checked entries.
+    """
+    problems = []
+    checked = 0
+    for source in sources:
+        for script_id, index, text in iter_source_texts(source):
+            # Database entries are laid out by database_pages
+            if not isinstance(index, int):
+                continue
+            checked += 1
+            windows, issues = layout_text(text, columns, rows, widths)
+            if issues:
+                problems.append((make_text_key(script_id, index), windows, issues))
+    return problems, checked
+
+def main():
+    parser = argparse.ArgumentParser(description="Report translated lines and windows that overflow the dialog window")
+    parser.add_argument("sources", nargs='+', help="Translation sources (.sqlite/.db, .po/.xlf/.tsv, .xlsx)")
+    parser.add_argument("--window", choices=GEOMETRIES, default="dialog", help="Window geometry to check against")
+    parser.add_argument("--columns", type=int, help="Override the window width in columns")
+    parser.add_argument("--rows", type=int, help="Override the window height in rows")
+    parser.add_argument("--widths", help="JSON file with glyph advances in pixels")
+    parser.add_argument("--show", help="Print the windows of overflowing entries", action="store_true")
+    args = parser.parse_args()
+
+    columns, rows = GEOMETRIES[args.window]
+    columns = args.columns or columns
+    rows = args.rows or rows
+    widths = load_glyph_widths(args.widths) if args.widths else None
+
+    start = time.perf_counter()
+    problems, checked = check_layout(args.sources, columns, rows, widths)
+    elapsed = time.perf_counter() - start
+
+    line_overflows = window_overflows = 0
+    for key, windows, issues in problems:
+        for kind, window_index, line_index in issues:
+            window = windows[window_index] if window_index < len(windows) else ()
+            line = window[line_index] if line_index < len(window) else ""
+            print(f"{key:>12}  {kind:<6}  window {window_index + 1}, line {line_index + 1}: {line}")
+            if kind == "line":
+                line_overflows += 1
+            else:
+                window_overflows += 1
+        if args.show:
+            for window in windows:
+                print("              +" + "-" * columns + "+")
+                for line in window:
+                    print(f"              |{line:<{columns}}|")
+            print("              +" + "-" * columns + "+")
+
+    print(f"[+] Checked {checked} entries in {elapsed:.2f} s | {columns}x{rows or '-'} window")
+    print(f"[+] Overflowing entries: {len(problems)} | lines: {line_overflows} | windows: {window_overflows}")
+
+if __name__ == '__main__':
+    main()
@@ -1,44 +1,85 @@
 import os
 import argparse
 from pathlib import Path
-import struct
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
 
-from parse_model import parse_ps1_model_data, convert_to_obj
+from parse_model import parse_ps1_model_arrays, write_obj
+from export_glb import write_glb
+from model_materials import model_atlas, write_textured_obj
 
-def convert_all_models(input_dir, output_dir):
+def find_model_files(input_dir):
+    """.model files of a directory and all its subdirectories (e.g. an unpacked SPIRIT tree)"""
+    return sorted(Path(input_dir).rglob("*.model"))
+
+def convert_model(model_path, output_path, textures=False):
+    """
+    Converts one model to .obj or .glb (by the suffix of output_path),
+    with textures=True textured primitives are bound to the TIMs of the model's container
+    (.obj is written with .mtl and the atlas .png).
+    Returns (model path, number of primitives, error).
+    Errors are returned instead of raised so one broken model doesn't stop the batch.
+    """
+    try:
+        with open(model_path, "rb") as f:
+            data = f.read()
+        model_data = parse_ps1_model_arrays(data)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        atlas = model_atlas(model_data, model_path.parent) if textures else None
+        if output_path.suffix == ".glb":
+            write_glb(model_data, output_path, model_path.stem, atlas)
+        elif textures:
+            write_textured_obj(model_data, output_path, atlas)
+        else:
+            write_obj(model_data, output_path)
+        return model_path, model_data['num_primitives'], None
+    except Exception as e:
+        return model_path, 0, str(e)
+
+def convert_all_models(input_dir, output_dir, jobs=None, glb=False, textures=False):
+    """
+    Converts every .model under input_dir in a process pool (to .glb with glb=True).
+    With textures=True textures are bound from the TIMs of each model's container,
+    workers keep the decoded TIM pages of the containers they have seen (model_materials.container_vram).
+    The directory layout below input_dir is kept in output_dir.
+    """
     input_dir = Path(input_dir)
     output_dir = Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    model_files = list(input_dir.glob("*.model"))
+    model_files = find_model_files(input_dir)
 
     if not model_files:
         print("No .model files found.")
         return
 
-    for model_path in model_files:
-        print(f"Processing: {model_path.name}")
+    output_paths = [output_dir / model_path.relative_to(input_dir).with_suffix(".glb" if glb else ".obj") for model_path in model_files]
 
-        with open(model_path, "rb") as f:
-            data = f.read()
-
-        model_data = parse_ps1_model_data(data)
+    failed = 0
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for model_path, num_primitives, error in pool.map(convert_model, model_files, output_paths, repeat(textures),
+                                                           chunksize=8):
+            if error:
+                failed += 1
+                print(f"[!] {model_path}: {error}")
+            else:
+                print(f"[+] {model_path.relative_to(input_dir)}: {num_primitives} primitives")
 
-        output_path = output_dir / (model_path.stem + ".obj")
-        convert_to_obj(model_data, output_path)
-
-    print(f"\nConversion completed. Files saved: {len(model_files)}")
+    print(f"\nConversion completed. Files saved: {len(model_files) - failed} (failed: {failed})")
 
 
 def main():
     parser = argparse.ArgumentParser(description="Converter for PS1 .model files to OBJ format")
-    parser.add_argument("input_dir", type=str, help="Path to folder with .model files")
-    parser.add_argument("output_dir", type=str, help="Path to folder where .obj files will be saved")
+    parser.add_argument("input_dir", type=str, help="Path to folder with .model files (searched recursively)")
+    parser.add_argument("output_dir", type=str, help="Path to folder where .obj/.glb files will be saved")
+    parser.add_argument("--jobs", type=int, help="Number of worker processes (default: CPU count)")
+    parser.add_argument("--glb", help="Convert to binary glTF with vertex colors and texcoords", action="store_true")
+    parser.add_argument("--textures", help="Bind textures from the TIM images of each model's container",
+                        action="store_true")
 
     args = parser.parse_args()
-    convert_all_models(args.input_dir, args.output_dir)
+    convert_all_models(args.input_dir, args.output_dir, args.jobs, args.glb, args.textures)
 
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,136 @@
+import mmap
+import time
+import argparse
+from functools import lru_cache
+
+from font_mapper import FontMapper
+from parse_script import table_entry_sizes
+from parse_database import (DatabaseParseContext, parse_database_text, parse_offsets, parse_info_entry,
+                            parse_table_offsets, sorted_positions, parse_topic_entry, parse_keyword_entry,
+                            keyword_type, parse_search_entry)
+
+INFO_ENTRY_SIZE = 22
+
+class DatabaseFile:
+    """
+    Random-access reader of a .database file over mmap.
+    Only the five offsets of the header and the offset tables are read on open,
+    topics, keywords and search entries are decoded on demand and kept in an LRU cache.
+    Entries are the same dicts as in the tables of parse_database.
+    """
+    def __init__(self, path, font_map: FontMapper, cache_size=256):
+        self.path = path
+        self.font_map = font_map
+        self._file = open(path, 'rb')
+        self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.offsets = parse_offsets(self.data)
+        self.topic_offsets = parse_table_offsets(self.data, self.offsets[1] + 4)
+        self.keyword_offsets = parse_table_offsets(self.data, self.offsets[2])
+        self.search_offsets = parse_table_offsets(self.data, self.offsets[3])
+
+        self._topic_sizes = table_entry_sizes(self.topic_offsets, self.offsets[2])
+        self._keyword_sizes = table_entry_sizes(self.keyword_offsets, self.offsets[3])
+        self._search_sizes = table_entry_sizes(self.search_offsets, self.offsets[4])
+        self._positions = sorted_positions(self.topic_offsets)
+        self._keywords = None
+
+        self.topic = lru_cache(maxsize=cache_size)(self._topic)
+        self.keyword = lru_cache(maxsize=cache_size)(self._keyword)
+        self.search = lru_cache(maxsize=cache_size)(self._search)
+
+    def close(self):
+        self.data.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def info_count(self):
+        return (self.offsets[1] - self.offsets[0]) // INFO_ENTRY_SIZE
+
+    def info(self, index):
+        """Entry of the entries info table"""
+        if not 0 <= index < self.info_count:
+            raise IndexError(f"Info entry {index} out of range")
+        return parse_info_entry(self.data, self.offsets[0] + index * INFO_ENTRY_SIZE)
+
+    def raw_topic(self, index):
+        return self.data[self.topic_offsets[index]:self.topic_offsets[index] + self._topic_sizes[index]]
+
+    def raw_keyword(self, index):
+        return self.data[self.keyword_offsets[index]:self.keyword_offsets[index] + self._keyword_sizes[index]]
+
+    def raw_search(self, index):
+        return self.data[self.search_offsets[index]:self.search_offsets[index] + self._search_sizes[index]]
+
+    def sorted_index(self, index):
+        """1-based position of a topic in file order, topics sharing their data share it"""
+        return self._positions[self.topic_offsets[index]] + 1
+
+    def _topic(self, index):
+        return parse_topic_entry(self.raw_topic(index), self.sorted_index(index), DatabaseParseContext(self.font_map))
+
+    def _keyword(self, index):
+        entry = parse_keyword_entry(index, self.raw_keyword(index), DatabaseParseContext(self.font_map))
+        return keyword_type(entry, self.keyword_links())
+
+    def _search(self, index):
+        return parse_search_entry(self.raw_search(index), DatabaseParseContext(self.font_map))
+
+    def keyword_links(self):
+        """
+        Keyword links (X -> Z of [KEYWORD:(X,Y,Z)]) of all topics and keywords.
+        Needed for the type of a keyword entry, collected by one pass over the text on first use.
+        """
+        if self._keywords is None:
+            keywords = {}
+            for i in range(len(self.topic_offsets)):
+                parse_database_text(self.raw_topic(i), self.font_map, False, keywords)
+            for i in range(len(self.keyword_offsets)):
+                parse_database_text(self.raw_keyword(i), self.font_map, False, keywords)
+            self._keywords = keywords
+        return self._keywords
+
+    def to_dict(self):
+        """Decodes every table, same result as parse_database"""
+        return {
+            "offsets": self.offsets,
+            "entries_table": [self.info(i) for i in range(self.info_count)],
+            "topics_table": {"offsets": self.topic_offsets,
+                             "entries": [self._topic(i) for i in range(len(self.topic_offsets))]},
+            "keywords_table": {"offsets": self.keyword_offsets,
+                               "entries": [self._keyword(i) for i in range(len(self.keyword_offsets))]},
+            "search_table": {"offsets": self.search_offsets,
+                             "entries": [self._search(i) for i in range(len(self.search_offsets))]},
+            "end_raw_data": self.data[self.offsets[4]:].hex(),
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description="Print single entries of a database file without parsing all of it")
+    parser.add_argument("file", help="Input .database file")
+    parser.add_argument("--topic", type=int, action="append", default=[], help="Topic index to print")
+    parser.add_argument("--keyword", type=int, action="append", default=[], help="Keyword index to print")
+    parser.add_argument("--search", type=int, action="append", default=[], help="Search entry index to print")
+    parser.add_argument("--font_table", default="./font/font-table.txt", help="Path to font-table.txt")
+    parser.add_argument("--ascii_table", default="./font/ascii-table.bin", help="Path to ascii-table.bin")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    with DatabaseFile(args.file, FontMapper(args.ascii_table, args.font_table)) as database:
+        print(f"[+] Topics: {len(database.topic_offsets)} | keywords: {len(database.keyword_offsets)} | "
+              f"search entries: {len(database.search_offsets)}")
+        for index in args.topic:
+            print(f"topics.{index}: {database.topic(index)}")
+        for index in args.keyword:
+            print(f"keywords.{index}: {database.keyword(index)}")
+        for index in args.search:
+            print(f"search.{index}: {database.search(index)}")
+    print(f"[+] Done in {time.perf_counter() - start:.3f} s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import re
+from functools import lru_cache
+
+from fix_dialog_font import FONT_WIDTH
+from dialog_layout import is_reflowable, wrap_words
+
+# Database viewer geometry of the "dbfix"/"notefix" presets of translation-checker.html (columns, rows)
+DATABASE_COLUMNS = 29
+DATABASE_ROWS = 10
+NOTE_ROWS = 5
+# Text rows an inline [IMG:..] picture takes below the row it is on
+IMAGE_ROWS = 4
+
+CLUT_RE = re.compile(r'\[CLUT:(\d+)\]')
+IMG_RE = re.compile(r'\[IMG:[^\]]*\]')
+
+def active_clut(text, clut):
+    """Palette index in effect after text"""
+    for match in CLUT_RE.finditer(text):
+        clut = int(match.group(1))
+    return clut
+
+def page_rows(page, max_width, glyph_widths, keywords):
+    """Word wrapped rows of one page, every \\n starts a new row (an empty paragraph is an empty row)"""
+    rows = []
+    for paragraph in page.split('\n'):
+        rows.extend(wrap_words(paragraph, max_width, glyph_widths, keywords) or [''])
+    return rows
+
+def row_height(row, image_rows):
+    """Rows a wrapped row takes in the viewer, with the rows reserved for its pictures"""
+    return 1 + image_rows * len(IMG_RE.findall(row))
+
+def split_rows(lines, rows, image_rows):
+    """Splits wrapped rows into pages of at most rows viewer rows (a taller row gets its own page)"""
+    chunks = []
+    used = rows
+    for line in lines:
+        height = row_height(line, image_rows)
+        if used + height > rows:
+            chunks.append([])
+            used = 0
+        chunks[-1].append(line)
+        used += height
+    return chunks
+
+@lru_cache(maxsize=None)
+def _paginate_text(text, columns, rows, keywords, widths, merge, image_rows):
+    keyword_texts = dict(keywords)
+    glyph_widths = dict(widths or ())
+    max_width = columns * FONT_WIDTH
+
+    body = text[:-len("[END]")] if text.endswith("[END]") else text
+    end = text[len(body):]
+
+    pages = []
+    clut = 0
+    for page in body.split("[END_PAGE]"):
+        page_clut = clut
+        clut = active_clut(page, clut)
+        lines = page_rows(page, max_width, glyph_widths, keyword_texts)
+        if not any(lines):
+            continue
+
+        height = sum(row_height(line, image_rows) for line in lines)
+        if merge and pages and sum(row_height(line, image_rows) for line in pages[-1]) + height <= rows:
+            pages[-1].extend(lines)
+            continue
+
+        # Split an overflowing page, the colour of a [CLUT:..] span that crosses the split is set again
+        line_clut = page_clut
+        for i, chunk in enumerate(split_rows(lines, rows, image_rows)):
+            if i and line_clut:
+                chunk[0] = f"[CLUT:{line_clut}]" + chunk[0]
+            line_clut = active_clut(''.join(chunk), line_clut)
+            pages.append(chunk)
+
+    return "[END_PAGE]".join('\n'.join(page) for page in pages) + end
+
+def paginate_text(text, columns=DATABASE_COLUMNS, rows=DATABASE_ROWS, keywords=None, widths=None, merge=False,
+                  image_rows=IMAGE_ROWS):
+    """
+    Rewraps English database text to the viewer width and splits pages that have more rows
+    than fit the viewer at [END_PAGE]. With merge=True short consecutive pages that fit
+    together are joined. [IMG:..], [KEYWORD:..] and [CLUT:..] tokens are never split from
+    their word, keywords give the text shown for each [KEYWORD:(X,Y,Z)]. Every [IMG:..]
+    reserves image_rows rows of its page for the picture.
+    Japanese text is returned unchanged.
+    """
+    if not is_reflowable(text):
+        return text
+    return _paginate_text(text, columns, rows, tuple(sorted((keywords or {}).items())), widths, merge,
+                          image_rows)
+
+def paginate_database(data, keywords, widths=None, merge=False):
+    """
+    Paginates the pages of every topic and the text of every keyword definition
+    (shown in the smaller note window). Returns the number of changed texts.
+    """
+    changed = 0
+    for entry in data["topics_table"]["entries"]:
+        pages = paginate_text(entry["pages"], DATABASE_COLUMNS, DATABASE_ROWS, keywords, widths, merge)
+        changed += pages != entry["pages"]
+        entry["pages"] = pages
+
+    for entry in data["keywords_table"]["entries"]:
+        if entry["definition_id"]:
+            continue
+        text = paginate_text(entry["text"], DATABASE_COLUMNS, NOTE_ROWS, keywords, widths, merge)
+        changed += text != entry["text"]
+        entry["text"] = text
+
+    return changed
@@ -0,0 +1,253 @@
+import re
+import json
+import argparse
+from itertools import groupby
+
+from font_mapper import FontMapper
+from pack_script import normalize_text
+from dialog_layout import is_reflowable
+
+TOKEN_RE = re.compile(r'\[[^\]]*\]')
+
+# Topic search keys are 4-byte records
+SEARCH_KEY_SIZE = 4
+# key_offset and count are single bytes
+MAX_SEARCH_VALUE = 0xFF
+# Bucket of keys that don't start with a Latin letter, sorted before "A"
+OTHER_BUCKET = "#"
+# How key positions map to topics, see ordered_topics
+KEY_ORDERS = ("sorted", "table")
+
+def plain_text(text):
+    return TOKEN_RE.sub('', text).replace('\n', ' ').strip()
+
+def make_search_key(title):
+    """Search key of an English title: its first letters and digits in upper case, padded with spaces"""
+    letters = [ch.upper() for ch in plain_text(title) if ch.isascii() and ch.isalnum()]
+    return ''.join(letters[:SEARCH_KEY_SIZE]).ljust(SEARCH_KEY_SIZE)
+
+def search_bucket(search_key):
+    first = search_key[:1].upper()
+    return first if 'A' <= first <= 'Z' else OTHER_BUCKET
+
+def search_keys(text):
+    """Keys of a search entry, every key ends with [END] (text after the last one is not a key)"""
+    return text.split("[END]")[:-1]
+
+def packed_key_size(key, font_map: FontMapper):
+    """Bytes of a key as written by pack_database_text"""
+    size = 0
+    position = 0
+    for match in TOKEN_RE.finditer(key + "[]"):
+        for ch in key[position:match.start()]:
+            # Dakuten marks have their own single-byte codes in database text
+            single = ch in '゛゜' or font_map.get_ascii_code(normalize_text(ch))
+            size += 1 if single else 2
+        token = match.group(0)
+        if token.startswith("[SP:"):
+            size += int(token[4:-1])
+        position = match.end()
+    return size
+
+def english_search_keys(data):
+    """
+    Sets the search key of every topic with an English title from the title.
+    Returns the number of changed topics.
+    """
+    changed = 0
+    for topic in data["topics_table"]["entries"]:
+        title = plain_text(topic["title"])
+        if title and is_reflowable(title):
+            search_key = make_search_key(title)
+            if topic["search_key"] != search_key:
+                topic["search_key"] = search_key
+                changed += 1
+    return changed
+
+def ordered_topics(topics, order):
+    """
+    Topics in the order the search keys point to them (key N -> topic N), shared topics once.
+    order is "sorted" - by sorted_index (file order of the topic data) or "table" - by topics table position.
+    """
+    if order == "sorted":
+        topics = sorted(topics, key=lambda topic: topic["sorted_index"])
+    seen = set()
+    ordered = []
+    for topic in topics:
+        if topic["sorted_index"] in seen:
+            continue
+        seen.add(topic["sorted_index"])
+        ordered.append(topic)
+    return ordered
+
+def key_topic_mismatches(entries, topics, order):
+    """(position, key, topic) of every key that isn't the search key of the topic at its position"""
+    keys = [key for entry in entries for key in search_keys(entry["keys"])]
+    return [(j, key, topic) for j, (key, topic) in enumerate(zip(keys, ordered_topics(topics, order)))
+            if key != topic["search_key"]]
+
+def key_topic_order(entries, topics):
+    """Order of ordered_topics the keys of a search table follow: the one with fewer mismatches, "sorted" on a tie"""
+    return min(KEY_ORDERS, key=lambda order: len(key_topic_mismatches(entries, topics, order)))
+
+def search_order(topic):
+    """Sort key of a topic in the search table: OTHER_BUCKET first, then by (search key, title)"""
+    return search_bucket(topic["search_key"]) != OTHER_BUCKET, topic["search_key"], plain_text(topic["title"])
+
+def renumber_entries(entries, renumbered):
+    """
+    Moves the entries_table along with renumbered topics: entries.<id> is the topic with
+    sorted_index == id, so ids and the 8 reference ids go through the same mapping.
+    A table kept in id order stays in id order.
+    """
+    in_order = [entry["id"] for entry in entries] == sorted(entry["id"] for entry in entries)
+    for entry in entries:
+        entry["id"] = renumbered.get(entry["id"], entry["id"])
+        entry["topics"] = [renumbered.get(reference, reference) if reference else 0 for reference in entry["topics"]]
+    if in_order:
+        entries.sort(key=lambda entry: entry["id"])
+
+def build_search_table(topics, entries=None):
+    """
+    Search table of the topics: keys are sorted by search_order and grouped into one
+    entry per first letter (OTHER_BUCKET first). key_offset of an entry is the position of its
+    first key in the sorted list, count the number of its keys.
+    Topics sharing their data (same sorted_index) are listed once.
+    Key N must still point to the Nth topic by sorted_index, so the sorted_index values are
+    permuted to the new key order (they only set the file order of the topic data), the topics
+    table keeps its order and text keys. With entries (entries_table) ids and references follow.
+    Returns the search table entries.
+    """
+    unique = ordered_topics(topics, "sorted")
+    values = [topic["sorted_index"] for topic in unique]
+    unique.sort(key=search_order)
+    renumbered = {topic["sorted_index"]: value for topic, value in zip(unique, values)}
+    for topic in topics:
+        topic["sorted_index"] = renumbered[topic["sorted_index"]]
+    if entries is not None:
+        renumber_entries(entries, renumbered)
+
+    search_entries = []
+    position = 0
+    for _, bucket in groupby(unique, key=lambda topic: search_bucket(topic["search_key"])):
+        bucket_keys = [topic["search_key"] for topic in bucket]
+        search_entries.append({
+            "key_offset": position,
+            "count": len(bucket_keys),
+            "keys": ''.join(f"{search_key}[END]" for search_key in bucket_keys)
+        })
+        position += len(bucket_keys)
+    return search_entries
+
+def key_sizes(entries, font_map: FontMapper):
+    return {packed_key_size(key, font_map) for entry in entries for key in search_keys(entry["keys"])}
+
+def check_search_table(entries, font_map: FontMapper = None, key_size=None):
+    """
+    Structure of a search table: every key_offset is the running sum of the preceding counts,
+    count is the number of [END] terminated keys and both fit a byte.
+    With font_map and key_size every key must pack into key_size bytes.
+    Returns a list of (entry index, problem).
+    """
+    problems = []
+    position = 0
+    for i, entry in enumerate(entries):
+        keys = search_keys(entry["keys"])
+        if entry["key_offset"] != position:
+            problems.append((i, f"key_offset {entry['key_offset']}, expected {position}"))
+        if entry["count"] != len(keys):
+            problems.append((i, f"count {entry['count']}, {len(keys)} key(s)"))
+        if not entry["keys"].endswith("[END]"):
+            problems.append((i, "keys don't end with [END]"))
+        if entry["key_offset"] > MAX_SEARCH_VALUE or entry["count"] > MAX_SEARCH_VALUE:
+            problems.append((i, f"key_offset/count over {MAX_SEARCH_VALUE}"))
+        if font_map and key_size:
+            wrong = [key for key in keys if packed_key_size(key, font_map) != key_size]
+            if wrong:
+                problems.append((i, f"{len(wrong)} key(s) don't pack into {key_size} bytes, e.g. '{wrong[0]}'"))
+        position = entry["key_offset"] + entry["count"]
+    return problems
+
+def compare_search_tables(original, rebuilt, font_map: FontMapper = None, topics=None):
+    """
+    Structural differences of a rebuilt search table against the original one.
+    With topics every rebuilt key must point to its topic (the Nth by sorted_index).
+    """
+    differences = []
+    if font_map:
+        original_sizes = key_sizes(original, font_map)
+        rebuilt_sizes = key_sizes(rebuilt, font_map)
+        if original_sizes != rebuilt_sizes:
+            differences.append(f"key sizes: {sorted(original_sizes)} -> {sorted(rebuilt_sizes)}")
+    if len(original) != len(rebuilt):
+        differences.append(f"entries: {len(original)} -> {len(rebuilt)}")
+    original_keys = sum(len(search_keys(entry["keys"])) for entry in original)
+    rebuilt_keys = sum(len(search_keys(entry["keys"])) for entry in rebuilt)
+    if original_keys != rebuilt_keys:
+        differences.append(f"keys: {original_keys} -> {rebuilt_keys}")
+    if topics is not None:
+        mismatches = key_topic_mismatches(rebuilt, topics, "sorted")
+        if mismatches:
+            j, key, topic = mismatches[0]
+            differences.append(f"{len(mismatches)} key(s) don't point to their topic, "
+                               f"e.g. key {j} '{key}' -> '{plain_text(topic['title'])}'")
+    return differences
+
+def rebuild_search_table(data, font_map: FontMapper = None):
+    """
+    Replaces the search table of a parsed database with one built from its topics
+    (sorted_index and entries_table ids are permuted, see build_search_table).
+    The rebuilt table is checked against the structure of the original one: if all original
+    keys pack into the same number of bytes, the rebuilt keys must too.
+    If the keys of the original table follow the topics table order instead of sorted_index
+    (see key_topic_order), sorting them would need the topics to move, so the table is kept.
+    Returns (problems of the rebuilt table, differences to the original, problems of the original).
+    """
+    original = data["search_table"]["entries"]
+    topics = data["topics_table"]["entries"]
+    if key_topic_order(original, topics) == "table":
+        return [], ["keys follow the topics table order, search table kept"], check_search_table(original)
+
+    rebuilt = build_search_table(topics, data["entries_table"])
+    data["search_table"]["entries"] = rebuilt
+
+    key_size = None
+    if font_map:
+        sizes = key_sizes(original, font_map)
+        key_size = sizes.pop() if len(sizes) == 1 else None
+    return (check_search_table(rebuilt, font_map, key_size), compare_search_tables(original, rebuilt, font_map, topics),
+            check_search_table(original))
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the search table of a parsed database from its topics")
+    parser.add_argument("input_json", help="Parsed database (.json)")
+    parser.add_argument("--out", help="Write the database JSON with the rebuilt search table")
+    parser.add_argument("--english_keys", help="Derive search keys of English topics from their titles",
+                        action="store_true")
+    parser.add_argument("--font_table", default="./font/font-table.txt", help="Path to font-table.txt")
+    parser.add_argument("--ascii_table", default="./font/ascii-table.bin", help="Path to ascii-table.bin")
+    args = parser.parse_args()
+
+    with open(args.input_json, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    if args.english_keys:
+        print(f"[+] Search keys from English titles: {english_search_keys(data)}")
+
+    problems, differences, original_problems = rebuild_search_table(data, FontMapper(args.ascii_table, args.font_table))
+    for i, problem in original_problems:
+        print(f"[!] original search.{i}: {problem}")
+    for difference in differences:
+        print(f"[+] {difference}")
+    for i, problem in problems:
+        print(f"[!] search.{i}: {problem}")
+    for i, entry in enumerate(data["search_table"]["entries"]):
+        print(f"    search.{i}: {entry['key_offset']:>3} +{entry['count']:<3} {entry['keys']}")
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as out:
+            json.dump(data, out, indent=2, ensure_ascii=False)
+        print("[+] JSON saved to:", args.out)
+
+if __name__ == '__main__':
+    main()
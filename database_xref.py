@@ -0,0 +1,171 @@
+import os
+import re
+import json
+import argparse
+from collections import defaultdict
+
+from font_mapper import FontMapper
+from parse_script import script_id_from_path
+from parse_database import DATABASE_TABLES, database_text_units
+from pack_database import load_database_texts, apply_database_texts
+from translation_store import is_store, open_store, store_texts
+from database_file import DatabaseFile
+
+KEYWORD_RE = re.compile(r'\[KEYWORD:\(([^)]*)\)\]')
+
+def parse_keyword_link(params):
+    """(X, Y, Z) of a [KEYWORD:(X,Y,Z)] token or None if it is malformed"""
+    parts = params.split(',')
+    if len(parts) != 3:
+        return None
+    try:
+        return tuple(int(part.strip()) for part in parts)
+    except ValueError:
+        return None
+
+class DatabaseXref:
+    """
+    Cross-reference index of a parsed database.
+    Nodes are named like text keys: topics.<index>, keywords.<index> and entries.<id> (entries_table).
+    Edges:
+        topics/keywords text -> keywords.X   through [KEYWORD:(X,Y,Z)] ("keyword")
+        keywords.X           -> keywords.Z   the definition of a linked keyword ("definition")
+        entries.<id>         -> topics.<i>   topics with sorted_index == id ("topic")
+        entries.<id>         -> entries.<r>  the 8 reference ids, 0 is unused ("reference")
+    The index and all link problems are built in one pass over the tables.
+    """
+    def __init__(self, data):
+        self.data = data
+        self.links = defaultdict(list)
+        self.backlinks = defaultdict(list)
+        self.problems = []
+
+        topics = data["topics_table"]["entries"]
+        keywords = data["keywords_table"]["entries"]
+        entries = data["entries_table"]
+        topic_by_id = defaultdict(list)
+        for i, topic in enumerate(topics):
+            topic_by_id[topic["sorted_index"]].append(i)
+        entry_ids = {entry["id"] for entry in entries}
+
+        definitions = {}
+        for index, text in database_text_units(data):
+            table, i, field = index.split('.')
+            if table == "search":
+                continue
+            source = f"{table}.{i}"
+            for match in KEYWORD_RE.finditer(text):
+                link = parse_keyword_link(match.group(1))
+                if link is None:
+                    self.problems.append(("malformed", index, match.group(0)))
+                    continue
+                x, _, z = link
+                if not 0 <= x < len(keywords):
+                    self.problems.append(("dangling", index, f"keywords.{x}"))
+                    continue
+                self.add(source, f"keywords.{x}", "keyword", index)
+                if not 0 <= z < len(keywords):
+                    self.problems.append(("dangling", index, f"keywords.{z}"))
+                    continue
+                # The parser keeps the last definition of a keyword
+                if definitions.get(x, z) != z:
+                    self.problems.append(("conflict", index, f"keywords.{x} -> keywords.{definitions[x]}/{z}"))
+                definitions[x] = z
+                self.add(f"keywords.{x}", f"keywords.{z}", "definition", index)
+
+        for i, keyword in enumerate(keywords):
+            linked = definitions.get(i, "")
+            if linked != keyword["definition_id"]:
+                self.problems.append(("changed", f"keywords.{i}.text",
+                                      f"links give definition {linked!r}, the dump has {keyword['definition_id']!r}"))
+            if i not in definitions and f"keywords.{i}" not in self.backlinks:
+                self.problems.append(("orphaned", f"keywords.{i}.text", "definition not linked from any text"))
+        for z in sorted(set(definitions.values())):
+            if z in definitions:
+                self.problems.append(("chained", f"keywords.{z}.text", "definition is itself a linked keyword"))
+
+        for entry in entries:
+            source = f"entries.{entry['id']}"
+            for i in topic_by_id.get(entry["id"], []):
+                self.add(source, f"topics.{i}", "topic")
+            if entry["id"] not in topic_by_id:
+                self.problems.append(("dangling", source, f"no topic with sorted_index {entry['id']}"))
+            for reference in entry["topics"]:
+                if not reference:
+                    continue
+                if reference in entry_ids:
+                    self.add(source, f"entries.{reference}", "reference")
+                else:
+                    self.problems.append(("dangling", source, f"entries.{reference}"))
+
+        for i in range(len(topics)):
+            if f"topics.{i}" not in self.backlinks:
+                self.problems.append(("unreachable", f"topics.{i}", "no entries_table entry"))
+
+    def add(self, source, target, kind, location=None):
+        self.links[source].append((target, kind, location))
+        self.backlinks[target].append((source, kind, location))
+
+    def links_here(self, node):
+        """(source, kind, text index) of every link to a node"""
+        return self.backlinks.get(node, [])
+
+    def links_from(self, node):
+        """(target, kind, text index) of every link of a node"""
+        return self.links.get(node, [])
+
+def load_database(filename, font_map: FontMapper = None):
+    """Parsed database from a JSON dump or a .database file"""
+    if filename.lower().endswith(".json"):
+        with open(filename, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    with DatabaseFile(filename, font_map) as database:
+        return database.to_dict()
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate keyword/topic links of a database and list what links to an entry")
+    parser.add_argument("database", help="Parsed database (.json) or .database file")
+    parser.add_argument("--text", help="Translated database text (.po/.xlf/.tsv/.sqlite) to check instead of the original")
+    parser.add_argument("--script_id", help="Database id used in text keys (default: file id of database)")
+    parser.add_argument("--links", action="append", default=[],
+                        help="Node to list the links of, e.g. keywords.12, topics.3 or entries.5")
+    parser.add_argument("--font_table", default="./font/font-table.txt", help="Path to font-table.txt")
+    parser.add_argument("--ascii_table", default="./font/ascii-table.bin", help="Path to ascii-table.bin")
+    args = parser.parse_args()
+
+    font_map = None
+    if not args.database.lower().endswith(".json"):
+        font_map = FontMapper(args.ascii_table, args.font_table)
+    data = load_database(args.database, font_map)
+
+    if args.text:
+        script_id = args.script_id or script_id_from_path(args.database)
+        if is_store(args.text):
+            conn = open_store(args.text)
+            texts = store_texts(conn, script_id)
+            conn.close()
+        else:
+            texts = load_database_texts(args.text, script_id)
+        apply_database_texts(data, texts)
+
+    xref = DatabaseXref(data)
+
+    for node in args.links:
+        table = node.split('.', 1)[0]
+        if table not in DATABASE_TABLES and table != "entries":
+            parser.error(f"unknown node: {node}")
+        print(f"[+] {node}")
+        for source, kind, location in xref.links_here(node):
+            print(f"    <- {source:<14} {kind:<10} {location or ''}")
+        for target, kind, location in xref.links_from(node):
+            print(f"    -> {target:<14} {kind:<10} {location or ''}")
+
+    counts = defaultdict(int)
+    for kind, location, detail in xref.problems:
+        counts[kind] += 1
+        print(f"[!] {kind:<11} {location}: {detail}")
+    summary = ", ".join(f"{kind}: {count}" for kind, count in sorted(counts.items())) or "none"
+    print(f"[+] {os.path.basename(args.database)}: {sum(len(v) for v in xref.links.values())} links | problems: {summary}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+import re
+import json
+import unicodedata
+from functools import lru_cache
+
+from fix_dialog_font import WINDOW_COLUMNS, FONT_WIDTH
+
+# Window geometry after fix_dialog_font.py (columns, rows)
+WINDOW_ROWS = 3
+HIGH_WINDOW_ROWS = 12
+# Frames of 0x0f columns are widened to 0x1a by pack_script.fix_script_dialog_window
+CHOICE_COLUMNS = 0x1a
+
+# rows None - the window grows with its content, only line widths are checked
+GEOMETRIES = {
+    "dialog": (WINDOW_COLUMNS, WINDOW_ROWS),
+    "high": (WINDOW_COLUMNS, HIGH_WINDOW_ROWS),
+    "choice": (CHOICE_COLUMNS, None),
+}
+
+TOKEN_RE = re.compile(r'\[([A-Z_0-9]+)(?::([^\]]*))?\]|\n|.', re.S)
+
+# Tokens that close the current window
+WINDOW_BREAKS = {"CLEAR", "END", "END_PAGE"}
+
+# Hard breaks kept by the reflow, everything between them is rewrapped
+HARD_BREAK_RE = re.compile(r'(\[WAIT_1\]|\[CLEAR\]|\[END\]|\[END_PAGE\])')
+# Words are split on spaces and line breaks only, [TOKEN]s stay glued to their word
+WORD_SPLIT_RE = re.compile(r'[ \n]+')
+
+def load_glyph_widths(filename):
+    """
+    Loads per-glyph advances in pixels from a JSON object {"i": 4, "W": 10, ...}.
+    Glyphs missing from the file advance by FONT_WIDTH.
+    Returned as a tuple of pairs so it can be part of a layout cache key.
+    """
+    with open(filename, 'r', encoding='utf-8') as f:
+        return tuple(sorted(json.load(f).items()))
+
+def parse_layout_tokens(text, keywords=None):
+    """
+    Splits script text into layout tokens, the Python counterpart of parseScript
+    in translation-checker.html:
+        ("char", ch)  - printed glyph, [SP:X] gives X spaces, [KEYWORD:(X,Y,Z)] the text keywords["(X,Y,Z)"]
+        ("break", "\\n" | "WAIT_1") - new line
+        ("window", "CLEAR" | "END" | "END_PAGE") - start a new window
+        ("indent", None) - indent the following lines to the current position
+    Tokens without effect on the layout (DELAY, FUNC_ID, RAW, CLUT, ...) are dropped.
+    """
+    tokens = []
+    for match in TOKEN_RE.finditer(text):
+        name, param = match.group(1), match.group(2)
+        if name is None:
+            ch = match.group(0)
+            if ch == '\n':
+                tokens.append(("break", "\n"))
+            elif ch != '\r':
+                tokens.append(("char", ch))
+        elif name == "WAIT_1":
+            tokens.append(("break", "WAIT_1"))
+        elif name in WINDOW_BREAKS:
+            tokens.append(("window", name))
+        elif name == "INDENT":
+            tokens.append(("indent", None))
+        elif name == "SP":
+            tokens.extend(("char", ' ') for _ in range(int(param)))
+        elif name == "KEYWORD":
+            tokens.extend(("char", ch) for ch in (keywords or {}).get(param, "??KEYWORD??"))
+    return tokens
+
+@lru_cache(maxsize=None)
+def layout_text(text, columns=WINDOW_COLUMNS, rows=WINDOW_ROWS, widths=None, folded_breaks=False):
+    """
+    Lays text out into windows the way buildWindows in translation-checker.html does,
+    measuring lines in pixels (FONT_WIDTH per glyph unless widths overrides it).
+
+    Returns (windows, issues):
+        windows - tuple of windows, each a tuple of its lines
+        issues  - tuple of (kind, window index, line index):
+                  "line"   - the line is wider than the window and wraps on its own
+                  "window" - text continues past the last row without [WAIT_1]/[CLEAR],
+                             the player never gets to read the scrolled-out lines
+    Repeated strings are laid out once.
+    """
+    glyph_widths = dict(widths or ())
+    max_width = columns * FONT_WIDTH
+
+    windows = []
+    issues = []
+    lines = [[]]
+    line_width = 0
+    indent = 0
+    last_break = False
+    # Kind of the issue to report if more text follows a window that was closed for lack of space
+    pending_overflow = None
+
+    def flush():
+        nonlocal lines, line_width
+        window = [''.join(line).rstrip() for line in lines]
+        while window and not window[-1]:
+            window.pop()
+        if any(line.strip() for line in window):
+            windows.append(tuple(window))
+        lines = [[]]
+        line_width = 0
+
+    def new_line():
+        nonlocal line_width
+        lines.append([])
+        line_width = 0
+        if rows is not None and len(lines) > rows:
+            flush()
+            return False
+        lines[-1].extend(' ' * (indent // FONT_WIDTH))
+        line_width = indent
+        return True
+
+    for kind, value in parse_layout_tokens(text):
+        if kind == "window":
+            flush()
+            pending_overflow = None
+            last_break = False
+            continue
+
+        if kind == "indent":
+            indent = line_width
+            continue
+
+        if kind == "break":
+            if value == "WAIT_1":
+                pending_overflow = None
+            if last_break and not (folded_breaks and value == "\n"):
+                continue
+            last_break = True
+            if not lines[-1]:
+                if pending_overflow and value == "\n":
+                    pending_overflow = "window"
+                continue
+            if not new_line() and value == "\n":
+                pending_overflow = "window"
+            continue
+
+        last_break = False
+        advance = glyph_widths.get(value, FONT_WIDTH)
+        if line_width + advance > max_width:
+            issues.append(("line", len(windows), len(lines) - 1))
+            new_line()
+
+        if pending_overflow and value.strip():
+            issues.append((pending_overflow, len(windows), len(lines) - 1))
+            pending_overflow = None
+
+        lines[-1].append(value)
+        line_width += advance
+
+        # The last row is full, the line can only continue in the next window
+        if rows is not None and len(lines) == rows and line_width + FONT_WIDTH > max_width:
+            flush()
+            pending_overflow = "line"
+
+    flush()
+    return tuple(windows), tuple(issues)
+
+def analyze_layout(text, columns=WINDOW_COLUMNS, rows=WINDOW_ROWS, widths=None):
+    """
+    Layout statistics of a text like analyze in translation-checker.html.
+    """
+    windows, issues = layout_text(text, columns, rows, widths)
+    capacity = len(windows) * columns * (rows or max((len(w) for w in windows), default=0))
+    return {
+        "windows": len(windows),
+        "occupancy": sum(len(''.join(window).strip()) for window in windows),
+        "capacity": capacity,
+        "line_overflows": sum(1 for kind, _, _ in issues if kind == "line"),
+        "window_overflows": sum(1 for kind, _, _ in issues if kind == "window"),
+    }
+
+def is_reflowable(text):
+    """
+    Only English text is rewrapped: Japanese has no spaces to break at and
+    [INDENT] blocks depend on the hand-made line breaks.
+    """
+    if "[INDENT]" in text:
+        return False
+    return not any(unicodedata.east_asian_width(ch) in 'WF' for ch in text)
+
+def word_width(word, glyph_widths, keywords=None):
+    return sum(glyph_widths.get(value, FONT_WIDTH)
+               for kind, value in parse_layout_tokens(word, keywords) if kind == "char")
+
+def wrap_words(paragraph, max_width, glyph_widths, keywords=None):
+    """Greedy word wrap of one paragraph, returns its lines"""
+    space = glyph_widths.get(' ', FONT_WIDTH)
+    lines = []
+    line = []
+    line_width = 0
+    for word in WORD_SPLIT_RE.split(paragraph.strip(' \n')):
+        if not word:
+            continue
+        width = word_width(word, glyph_widths, keywords)
+        if line and line_width + space + width > max_width:
+            lines.append(' '.join(line))
+            line = []
+            line_width = 0
+        line_width += (space if line else 0) + width
+        line.append(word)
+    if line:
+        lines.append(' '.join(line))
+    return lines
+
+def entry_window(original):
+    """
+    Window of GEOMETRIES an entry is shown in, guessed from the layout of its original (Japanese) text:
+    "high" - more rows between two breaks than the dialog window has, "dialog" otherwise.
+    Choice boxes can't be told from short dialog by the text alone, they are laid out as dialog
+    so a long line still gets its window breaks.
+    """
+    segments = [segment.strip('\n') for segment in HARD_BREAK_RE.split(original)[::2]]
+    rows = max((len(segment.split('\n')) for segment in segments if segment), default=0)
+    return "high" if rows > WINDOW_ROWS else "dialog"
+
+@lru_cache(maxsize=None)
+def reflow_text(text, columns=WINDOW_COLUMNS, rows=WINDOW_ROWS, widths=None):
+    """
+    Rewraps English text to the window geometry.
+
+    Hand-made line breaks (\\n) are treated as spaces and the text is word wrapped
+    to the window width. [WAIT_1], [CLEAR], [END] and [END_PAGE] are kept, and a
+    [WAIT_1] is put after every full window so no line scrolls out unread.
+    In a window without rows (choices) every line is an item, line breaks are kept
+    and each line is wrapped on its own.
+    Control tokens are never split from the word they are attached to.
+    Text that can't be reflowed is returned unchanged, repeated strings are rewrapped once.
+    """
+    if not is_reflowable(text):
+        return text
+
+    glyph_widths = dict(widths or ())
+    max_width = columns * FONT_WIDTH
+
+    output = []
+    row = 0
+    need_break = False
+    for part in HARD_BREAK_RE.split(text):
+        if HARD_BREAK_RE.fullmatch(part):
+            output.append(part)
+            # [WAIT_1] moves to the next row, or to a new window after the last one
+            if part != "[WAIT_1]" or (rows is not None and row >= rows):
+                row = 0
+            need_break = False
+            continue
+
+        paragraphs = part.split('\n') if rows is None else [part]
+        lines = [line for paragraph in paragraphs for line in wrap_words(paragraph, max_width, glyph_widths)]
+        for line in lines:
+            if need_break:
+                if rows is not None and row >= rows:
+                    output.append("[WAIT_1]")
+                    row = 0
+                else:
+                    output.append("\n")
+            output.append(line)
+            row += 1
+            need_break = True
+
+    return ''.join(output)
+
+def reflow_entry(text, original, widths=None):
+    """Rewraps an English entry to the window its original text is shown in (see entry_window)"""
+    columns, rows = GEOMETRIES[entry_window(original)]
+    return reflow_text(text, columns, rows, widths)
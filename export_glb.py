@@ -0,0 +1,159 @@
+import json
+import struct
+import argparse
+
+import numpy as np
+
+from parse_model import parse_ps1_model_arrays, model_triangles, triangle_group_keys, triangle_groups
+
+GLB_MAGIC = 0x46546C67
+GLB_VERSION = 2
+CHUNK_JSON = 0x4E4F534A
+CHUNK_BIN = 0x004E4942
+
+# glTF constants
+FLOAT = 5126
+UNSIGNED_BYTE = 5121
+ARRAY_BUFFER = 34962
+TRIANGLES_MODE = 4
+NEAREST = 9728
+CLAMP_TO_EDGE = 33071
+
+# Texcoords are texels of a 256x256 texpage
+TEXPAGE_SIZE = 256
+
+def corner_colors(triangles):
+    """
+    RGBA of every triangle corner (m * 3, 4) as glTF vertex colors.
+    Textured colors are PS1 blend factors (0x80 - unchanged texture), raw textures are white.
+    """
+    colors = triangles["colors"].reshape(-1, 3).astype(np.uint16)
+    textured = np.repeat(triangles["textured"], 3)
+    raw_texture = np.repeat(triangles["raw_texture"], 3)
+    colors[textured] = np.minimum(colors[textured] * 2, 255)
+    colors[raw_texture] = 255
+    return np.column_stack((colors, np.full(len(colors), 255))).astype(np.uint8)
+
+def group_name(key):
+    if key < 0:
+        return "untextured"
+    return f"tpage_{key >> 16:04X}_clut_{key & 0xFFFF:04X}"
+
+def model_arrays_to_glb(model, name="model", atlas=None):
+    """
+    Binary glTF of a model parsed by parse_ps1_model_arrays.
+    Triangles are grouped into one mesh per texpage/CLUT (untextured primitives share one mesh),
+    every corner gets its own position, vertex color and texcoord (texel / 256 of its texpage).
+    With an atlas of model_materials.build_atlas the PNG is embedded, textured meshes use it and
+    their texcoords point into its regions.
+    PS1 y and z point down/into the screen, they are flipped to the y-up glTF axes.
+    """
+    gltf = {
+        "asset": {"version": "2.0", "generator": "export_glb.py"},
+        "scene": 0,
+        "scenes": [{"name": name, "nodes": []}],
+        "nodes": [], "meshes": [], "materials": [], "accessors": [], "bufferViews": [], "buffers": [],
+    }
+    chunks = []
+    length = 0
+
+    def add_buffer_view(data, target=None):
+        nonlocal length
+        view = {"buffer": 0, "byteOffset": length, "byteLength": len(data)}
+        if target:
+            view["target"] = target
+        gltf["bufferViews"].append(view)
+        chunks.append(data + b'\0' * (-len(data) % 4))
+        length += len(data) + (-len(data) % 4)
+        return len(gltf["bufferViews"]) - 1
+
+    def add_accessor(array, component_type, accessor_type, normalized=False, bounds=False):
+        accessor = {"bufferView": add_buffer_view(np.ascontiguousarray(array).tobytes(), ARRAY_BUFFER),
+                    "componentType": component_type,
+                    "count": len(array), "type": accessor_type}
+        if normalized:
+            accessor["normalized"] = True
+        if bounds:
+            accessor["min"] = array.min(axis=0).tolist()
+            accessor["max"] = array.max(axis=0).tolist()
+        gltf["accessors"].append(accessor)
+        return len(gltf["accessors"]) - 1
+
+    triangles = model_triangles(model)
+    if triangles is not None:
+        if triangles["vertices"].max() >= model['num_vertices']:
+            raise Exception(f"Vertex index out of range: {triangles['vertices'].max()} >= {model['num_vertices']}")
+
+        vertices = model['vertices']
+        points = np.column_stack((vertices['x'], vertices['y'], vertices['z'])).astype(np.float32) * (1, -1, -1)
+        positions = points[triangles["vertices"].reshape(-1)].astype(np.float32)
+        colors = corner_colors(triangles)
+        texels = triangles["texcoords"].reshape(-1, 2).astype(np.float32)
+
+        keys = triangle_group_keys(triangles)
+        if atlas and atlas["regions"]:
+            gltf["images"] = [{"bufferView": add_buffer_view(atlas["png"]), "mimeType": "image/png"}]
+            gltf["samplers"] = [{"magFilter": NEAREST, "minFilter": NEAREST, "wrapS": CLAMP_TO_EDGE, "wrapT": CLAMP_TO_EDGE}]
+            gltf["textures"] = [{"sampler": 0, "source": 0}]
+        for key, indices in triangle_groups(keys):
+            corners = (indices[:, None] * 3 + np.arange(3)).reshape(-1)
+            attributes = {
+                "POSITION": add_accessor(positions[corners], FLOAT, "VEC3", bounds=True),
+                "COLOR_0": add_accessor(colors[corners], UNSIGNED_BYTE, "VEC4", normalized=True),
+            }
+            material = {
+                "name": group_name(key),
+                "doubleSided": True,
+                "pbrMetallicRoughness": {"baseColorFactor": [1, 1, 1, 1], "metallicFactor": 0, "roughnessFactor": 1},
+            }
+            if key >= 0:
+                if atlas and key in atlas["regions"]:
+                    x, y, u0, v0 = atlas["regions"][key]
+                    texcoords = (texels[corners] - (u0, v0) + (x, y)) / (atlas["width"], atlas["height"])
+                    material["pbrMetallicRoughness"]["baseColorTexture"] = {"index": 0}
+                    # Texel 0000h is transparent on the PS1
+                    material["alphaMode"] = "MASK"
+                else:
+                    texcoords = texels[corners] / TEXPAGE_SIZE
+                attributes["TEXCOORD_0"] = add_accessor(texcoords.astype(np.float32), FLOAT, "VEC2")
+            gltf["materials"].append(material)
+            gltf["meshes"].append({"name": group_name(key), "primitives": [
+                {"attributes": attributes, "material": len(gltf["materials"]) - 1, "mode": TRIANGLES_MODE}]})
+            gltf["nodes"].append({"name": group_name(key), "mesh": len(gltf["meshes"]) - 1})
+            gltf["scenes"][0]["nodes"].append(len(gltf["nodes"]) - 1)
+
+    if length:
+        gltf["buffers"].append({"byteLength": length})
+    # glTF doesn't allow empty top-level arrays
+    gltf = {key: value for key, value in gltf.items() if value != []}
+
+    json_chunk = json.dumps(gltf, separators=(',', ':')).encode('utf-8')
+    json_chunk += b' ' * (-len(json_chunk) % 4)
+    bin_chunk = b''.join(chunks)
+
+    total = 12 + 8 + len(json_chunk) + (8 + len(bin_chunk) if bin_chunk else 0)
+    out = [struct.pack('<III', GLB_MAGIC, GLB_VERSION, total), struct.pack('<II', len(json_chunk), CHUNK_JSON), json_chunk]
+    if bin_chunk:
+        out += [struct.pack('<II', len(bin_chunk), CHUNK_BIN), bin_chunk]
+    return b''.join(out)
+
+def write_glb(model, output_filepath, name="model", atlas=None):
+    """Writes a model parsed by parse_ps1_model_arrays as .glb"""
+    with open(output_filepath, 'wb') as f:
+        f.write(model_arrays_to_glb(model, name, atlas))
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a .model file to binary glTF with vertex colors and texcoords")
+    parser.add_argument("file", help="Input .model file")
+    parser.add_argument("out", help="Path to write the .glb model")
+    args = parser.parse_args()
+
+    with open(args.file, 'rb') as f:
+        data = f.read()
+
+    model = parse_ps1_model_arrays(data)
+    write_glb(model, args.out)
+    print(f"[+] {args.out}: {model['num_primitives']} primitives")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+import json
+import struct
+import argparse
+from collections import Counter
+
+from font_mapper import FontMapper
+from pack_script import normalize_text
+from parse_script import make_text_key, split_text_key, script_id_from_path
+from translation_formats import find_dump_files, dump_text_units
+from translation_store import iter_source_texts
+from check_encoding import DATABASE_MARKS, text_characters
+
+FIRST_SLOT = 0x20
+SLOT_COUNT = 0x100 - FIRST_SLOT
+
+# Single-byte values with a meaning of their own (codes below FIRST_SLOT are all control bytes):
+# 0x20 is packed as [SP:X] runs, 0x25 is the "%" format code of scripts,
+# 0xDE/0xDF are the dakuten marks of database text
+RESERVED_SLOTS = {0x20, 0x25, 0xDE, 0xDF}
+# The byte after a format code is read as is, e.g. "%d"
+FORMAT_CHAR = '%'
+
+# Database fields packed into fixed-size records, their glyphs must keep their byte width
+FIXED_WIDTH_FIELDS = ("search_key", "keys")
+
+def corpus_texts(sources, dumps_root=None):
+    """
+    Texts of every entry that gets packed: translations from the sources,
+    original text from the JSON dumps under dumps_root for untranslated entries.
+    Returns a mapping of key -> text.
+    """
+    texts = {}
+    if dumps_root:
+        for dump_file in find_dump_files(dumps_root):
+            with open(dump_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            texts.update(dump_text_units(data, script_id_from_path(dump_file)))
+    for source in sources:
+        for script_id, index, text in iter_source_texts(source):
+            texts[make_text_key(script_id, index)] = text
+    return texts
+
+def load_keep_glyphs(filename):
+    """Glyphs of a text file that must keep their single-byte slot (e.g. strings embedded in the SLPM)"""
+    with open(filename, 'r', encoding='utf-8') as f:
+        return {normalize_text(ch) for ch in f.read() if not ch.isspace()}
+
+def count_glyphs(texts):
+    """
+    Counts printed glyphs (after normalize_text) of the corpus.
+    Returns (frequencies, pinned, frozen):
+        pinned - glyphs of [IMG]/[KEYWORD] parameters and format directives after "%",
+                 they must stay single-byte
+        frozen - glyphs of fixed-size database fields, they must keep their byte width
+    """
+    frequencies = Counter()
+    pinned = set()
+    frozen = set()
+    for key, text in texts.items():
+        index = split_text_key(key)[1]
+        database = not isinstance(index, int)
+        fixed = database and index.endswith(FIXED_WIDTH_FIELDS)
+        previous = None
+        for position, ch, context in text_characters(text):
+            directive = previous == position - 1
+            previous = position if ch == FORMAT_CHAR and context == "text" else None
+            if database and ch in DATABASE_MARKS:
+                continue
+            ch = normalize_text(ch)
+            if context == "param" or directive:
+                pinned.add(ch)
+            elif fixed:
+                frozen.add(ch)
+            elif ch != ' ':
+                frequencies[ch] += 1
+    return frequencies, pinned, frozen
+
+def load_slots(filename):
+    with open(filename, 'rb') as f:
+        data = f.read()
+    return list(struct.unpack(f'<{len(data) // 2}H', data))
+
+def save_slots(slots, filename):
+    with open(filename, 'wb') as f:
+        f.write(struct.pack(f'<{len(slots)}H', *slots))
+
+def propose_slots(slots, frequencies, pinned, frozen, font_map: FontMapper):
+    """
+    Moves the most frequent two-byte glyphs to single-byte slots.
+    Every slot keeps its glyph unless a candidate saving more bytes needs it: a glyph moved to a
+    single-byte code saves one byte per occurrence, the evicted glyph costs one byte per occurrence.
+    Empty slots are filled first, then the slots of the least frequent glyphs are taken.
+    Reserved slots and slots of pinned/frozen single-byte glyphs never change, glyphs of reserved slots
+    and pinned glyphs are not moved.
+    frequencies must cover the whole packed corpus (original text of untranslated entries included),
+    glyphs used elsewhere (e.g. strings of the SLPM) belong in pinned.
+    Returns the new slot list.
+    """
+    current = single_byte_glyphs(slots, font_map)
+    reserved = {font_map.get_char(code) for i, code in enumerate(slots) if code and FIRST_SLOT + i in RESERVED_SLOTS}
+
+    # (bytes lost by evicting the occupant, slot index) of every slot that can change, empty slots cost nothing
+    open_slots = []
+    for i, code in enumerate(slots):
+        if FIRST_SLOT + i in RESERVED_SLOTS:
+            continue
+        ch = font_map.get_char(code) if code else None
+        if ch in current and font_map.get_code(ch) == code:
+            if ch in pinned or ch in frozen:
+                continue
+            open_slots.append((frequencies.get(ch, 0), i))
+        else:
+            open_slots.append((-1, i))
+    open_slots.sort()
+
+    candidates = sorted(((count, ch) for ch, count in frequencies.items()
+                         if ch not in current and ch not in reserved and ch not in pinned and ch not in frozen
+                         and font_map.get_code(ch)),
+                        key=lambda item: (-item[0], font_map.get_code(item[1])))
+
+    proposed = list(slots)
+    for (count, ch), (cost, i) in zip(candidates, open_slots):
+        if count <= cost:
+            break
+        proposed[i] = font_map.get_code(ch)
+    return proposed
+
+def packed_size(frequencies, single_byte):
+    return sum(count * (1 if ch in single_byte else 2) for ch, count in frequencies.items())
+
+def single_byte_glyphs(slots, font_map: FontMapper):
+    """Glyphs the packers would write with one byte, a slot only counts if it holds the glyph's own font code"""
+    glyphs = set()
+    for i, code in enumerate(slots):
+        ch = font_map.get_char(code) if code else None
+        if ch and FIRST_SLOT + i not in RESERVED_SLOTS and font_map.get_code(ch) == code:
+            glyphs.add(ch)
+    return glyphs
+
+def main():
+    parser = argparse.ArgumentParser(description="Glyph frequencies and single-byte slot allocation of ascii-table.bin")
+    parser.add_argument("dumps", help="Directory with the JSON dumps of every script and database, "
+                                      "untranslated entries are counted with their original text")
+    parser.add_argument("sources", nargs='*', help="Translation sources (.sqlite/.db, .po/.xlf/.tsv, .xlsx)")
+    parser.add_argument("--keep", action="append", default=[],
+                        help="Text file with glyphs used outside the dumps (e.g. SLPM strings) that keep their slot")
+    parser.add_argument("--top", type=int, default=20, help="Number of gains/losses to list")
+    parser.add_argument("--out", help="Write the proposed ascii-table.bin")
+    parser.add_argument("--font_table", default="./font/font-table.txt", help="Path to font-table.txt")
+    parser.add_argument("--ascii_table", default="./font/ascii-table.bin", help="Path to ascii-table.bin")
+    args = parser.parse_args()
+
+    font_map = FontMapper(args.ascii_table, args.font_table)
+    slots = load_slots(args.ascii_table)
+    frequencies, pinned, frozen = count_glyphs(corpus_texts(args.sources, args.dumps))
+    for filename in args.keep:
+        pinned |= load_keep_glyphs(filename)
+
+    missing = [ch for ch in frequencies if not font_map.get_code(ch) and not font_map.get_ascii_code(ch)]
+    for ch in missing:
+        frequencies.pop(ch)
+    if missing:
+        print(f"[!] Glyphs missing from the font (see check_encoding.py): {''.join(sorted(missing))}")
+
+    current = single_byte_glyphs(slots, font_map)
+    proposed_slots = propose_slots(slots, frequencies, pinned, frozen, font_map)
+    proposed = single_byte_glyphs(proposed_slots, font_map)
+
+    # Savings of every possible move: a two-byte glyph given a slot saves its frequency,
+    # a single-byte glyph losing its slot costs as much
+    gains = sorted(((count, ch) for ch, count in frequencies.items() if ch not in current), reverse=True)
+    losses = sorted(((count, ch) for ch, count in frequencies.items() if ch in current and ch not in proposed))
+
+    print(f"[+] Distinct glyphs: {len(frequencies)} | occurrences: {sum(frequencies.values())}")
+    print("[+] Best two-byte glyphs for a single-byte slot:")
+    for count, ch in gains[:args.top]:
+        mark = "*" if ch in proposed else " "
+        print(f"    {mark} '{ch}' 0x{font_map.get_code(ch):03X}: -{count} bytes")
+    if losses:
+        print("[+] Single-byte glyphs losing their slot:")
+        for count, ch in losses[:args.top]:
+            print(f"      '{ch}' 0x{font_map.get_code(ch):03X}: +{count} bytes")
+
+    size = packed_size(frequencies, current)
+    new_size = packed_size(frequencies, proposed)
+    print(f"[+] Text bytes: {size} -> {new_size} ({new_size - size:+d})")
+
+    if args.out:
+        save_slots(proposed_slots, args.out)
+        print(f"[+] Proposed ascii table written to: {args.out} (rebuild every script and the database with it)")
+
+if __name__ == '__main__':
+    main()
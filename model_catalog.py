@@ -0,0 +1,187 @@
+import os
+import json
+import hashlib
+import argparse
+from pathlib import Path
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from parse_model import PRIMITIVE_CLASSES, parse_ps1_model_arrays
+from convert_models import find_model_files, convert_model
+
+CATALOG_FILE = ".model_catalog.json"
+CATALOG_VERSION = 1
+
+# Command byte -> primitive class name
+COMMAND_CLASSES = {command: name for name, (commands, _, _, _, _) in PRIMITIVE_CLASSES.items() for command in commands}
+
+def command_tags(command):
+    """
+    Words a query term can use for a primitive command: its hex code, class name,
+    triangles/quads, textured, shaded, semi (semi-transparent) and raw (raw texture).
+    """
+    name = COMMAND_CLASSES[command]
+    _, _, vertex_count, shader_slice, texture_slice = PRIMITIVE_CLASSES[name]
+    tags = {f"{command:#04x}", name, "quads" if vertex_count == 4 else "triangles"}
+    if texture_slice:
+        tags.add("textured")
+        if command & 1:
+            tags.add("raw")
+    if shader_slice:
+        tags.add("shaded")
+    if command & 2:
+        tags.add("semi")
+    return tags
+
+def model_stats(data):
+    """Vertex/primitive counts, bounding box [min x, y, z, max x, y, z] and command histogram of a model"""
+    model = parse_ps1_model_arrays(data)
+    vertices = model['vertices']
+    bbox = None
+    if len(vertices):
+        points = np.column_stack((vertices['x'], vertices['y'], vertices['z']))
+        bbox = points.min(axis=0).tolist() + points.max(axis=0).tolist()
+
+    histogram = {}
+    for primitive in model['primitives'].values():
+        commands, counts = np.unique(primitive['command'], return_counts=True)
+        for command, count in zip(commands.tolist(), counts.tolist()):
+            histogram[f"{command:#04x}"] = count
+    return {
+        "vertices": model['num_vertices'],
+        "primitives": model['num_primitives'],
+        "bbox": bbox,
+        "commands": dict(sorted(histogram.items())),
+    }
+
+def scan_model(path):
+    """(stats or None, error) of a model file, errors are returned so one broken model doesn't stop the scan"""
+    try:
+        with open(path, 'rb') as f:
+            return model_stats(f.read()), None
+    except Exception as e:
+        return None, str(e)
+
+def load_catalog(filename):
+    if not os.path.exists(filename):
+        return None
+    with open(filename, 'r', encoding='utf-8') as f:
+        catalog = json.load(f)
+    return catalog if catalog.get("version") == CATALOG_VERSION else None
+
+def save_catalog(catalog, filename):
+    # One model per line keeps the index small and still diffable
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write('{"version":%d,"models":{\n' % catalog["version"])
+        f.write(',\n'.join(f"{json.dumps(digest)}:{json.dumps(entry, separators=(',', ':'))}"
+                           for digest, entry in catalog["models"].items()))
+        f.write('\n}}\n')
+
+def build_catalog(spirit_dir, catalog=None, jobs=None):
+    """
+    Content-hashed index of every .model of the unpacked SPIRIT tree (the files find_signature typed as "model").
+    Returns {"version", "models": sha1 -> entry}, an entry holds the model_stats of the blob
+    (or "error") and "files", the paths of all its copies relative to spirit_dir.
+    Only blobs missing from the previous catalog are parsed, in a process pool.
+    """
+    known = catalog["models"] if catalog else {}
+
+    files = {}
+    for path in find_model_files(spirit_dir):
+        with open(path, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        files.setdefault(digest, []).append(path.relative_to(spirit_dir).as_posix())
+
+    pending = [digest for digest in files if digest not in known]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        scanned = dict(zip(pending, pool.map(scan_model, [Path(spirit_dir) / files[d][0] for d in pending], chunksize=8)))
+
+    models = {}
+    for digest, paths in sorted(files.items(), key=lambda item: item[1][0]):
+        if digest in scanned:
+            stats, error = scanned[digest]
+            entry = dict(stats) if stats else {"error": error}
+        else:
+            entry = {key: value for key, value in known[digest].items() if key != "files"}
+        entry["files"] = paths
+        models[digest] = entry
+
+    return {"version": CATALOG_VERSION, "models": models}
+
+def find_models(catalog, terms):
+    """
+    Digests of the models matching every query term.
+    A term is a comma-separated list of command_tags that one command of the model must all have,
+    e.g. "textured,quads" - models with textured quads, "0x2c" - models with command 2Ch.
+    """
+    required = [set(term.lower().split(',')) for term in terms]
+    tags = {}
+    matches = []
+    for digest, entry in catalog["models"].items():
+        commands = [int(command, 16) for command in entry.get("commands", {})]
+        for command in commands:
+            if command not in tags:
+                tags[command] = command_tags(command)
+        if all(any(term <= tags[command] for command in commands) for term in required):
+            matches.append(digest)
+    return matches
+
+def convert_unique(catalog, spirit_dir, output_dir, digests, jobs=None, glb=False, textures=False):
+    """
+    Converts every model of digests once, from its first copy, keeping its path below spirit_dir.
+    Copies in other containers are not converted again (with textures the TIMs of the first container are used).
+    """
+    sources = [Path(spirit_dir) / catalog["models"][digest]["files"][0] for digest in digests
+               if "error" not in catalog["models"][digest]]
+    outputs = [Path(output_dir) / source.relative_to(spirit_dir).with_suffix(".glb" if glb else ".obj")
+               for source in sources]
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for model_path, _, error in pool.map(convert_model, sources, outputs, repeat(textures), chunksize=8):
+            if error:
+                failed += 1
+                print(f"[!] {model_path}: {error}")
+    print(f"[+] Converted {len(sources) - failed} unique models to {output_dir} (failed: {failed})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Index the models of the unpacked SPIRIT tree by content hash")
+    parser.add_argument("spirit_dir", help="Extracted SPIRIT directory")
+    parser.add_argument("--catalog", help=f"Catalog file (default: <spirit_dir>/{CATALOG_FILE})")
+    parser.add_argument("--force", help="Parse every model even if it is in the catalog", action="store_true")
+    parser.add_argument("--has", action="append", default=[],
+                        help="Only models with a command having all these comma-separated tags, e.g. textured,quads "
+                             "(tags: class name, 0x2c, triangles, quads, textured, shaded, semi, raw)")
+    parser.add_argument("--convert", metavar="OUTPUT_DIR", help="Convert every unique (matching) model once")
+    parser.add_argument("--glb", help="Convert to binary glTF", action="store_true")
+    parser.add_argument("--textures", help="Bind textures from the TIM images of each model's container",
+                        action="store_true")
+    parser.add_argument("--jobs", type=int, help="Number of worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    catalog_file = args.catalog or os.path.join(args.spirit_dir, CATALOG_FILE)
+    catalog = build_catalog(args.spirit_dir, None if args.force else load_catalog(catalog_file), args.jobs)
+    save_catalog(catalog, catalog_file)
+
+    models = catalog["models"]
+    copies = sum(len(entry["files"]) for entry in models.values())
+    errors = sum(1 for entry in models.values() if "error" in entry)
+    print(f"[+] Models: {copies} files | unique: {len(models)} | duplicates: {copies - len(models)} | errors: {errors}")
+
+    digests = list(models)
+    if args.has:
+        digests = find_models(catalog, args.has)
+        for digest in digests:
+            entry = models[digest]
+            commands = " ".join(f"{command}:{count}" for command, count in entry["commands"].items())
+            print(f"    {digest[:12]} v{entry['vertices']:<5} p{entry['primitives']:<5} x{len(entry['files'])} "
+                  f"{entry['files'][0]} | {commands}")
+        print(f"[+] Matching models: {len(digests)}")
+
+    if args.convert:
+        convert_unique(catalog, args.spirit_dir, args.convert, digests, args.jobs, args.glb, args.textures)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,308 @@
+import io
+import os
+import re
+import math
+import struct
+import argparse
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image
+
+from parse_model import parse_ps1_model_arrays, model_triangles, triangle_group_keys, triangle_groups
+from export_glb import group_name, write_glb
+
+VRAM_WIDTH = 1024
+VRAM_HEIGHT = 512
+PAGE_SIZE = 256
+
+TIM_MAGIC = 0x10
+TIM_HAS_CLUT = 0x08
+TIM_FILE_RE = re.compile(r'^file_(\d+)\.tim$')
+
+# Texpage color depth: (halfwords per page row, texels per halfword), 3 is reserved and read as 15-bit
+PAGE_DEPTHS = {0: (64, 4), 1: (128, 2), 2: (256, 1), 3: (256, 1)}
+# Texpage bits that change the decoded page: x, y and color depth (not semi-transparency)
+TEXPAGE_DECODE_MASK = 0x19F
+
+def decode_texpage(tpage):
+    """(x, y, semi-transparency, color depth) of a texpage word, x/y in VRAM halfwords"""
+    return (tpage & 0xF) * 64, ((tpage >> 4) & 1) * 256, (tpage >> 5) & 3, (tpage >> 7) & 3
+
+def decode_clut(clut):
+    """(x, y) of a CLUT word in VRAM halfwords"""
+    return (clut & 0x3F) * 16, (clut >> 6) & 0x1FF
+
+def parse_tim(data):
+    """
+    Parses a TIM image.
+    Returns {"mode": pixel mode, "clut": block or None, "image": block},
+    a block is (x, y, halfwords) with x/y in VRAM and halfwords as a (height, width) array.
+    """
+    magic, flags = struct.unpack_from('<II', data, 0)
+    if magic != TIM_MAGIC:
+        raise Exception(f"Not a TIM image: {magic:#x}")
+
+    offset = 8
+    blocks = []
+    for _ in range(2 if flags & TIM_HAS_CLUT else 1):
+        length, x, y, width, height = struct.unpack_from('<IHHHH', data, offset)
+        halfwords = np.frombuffer(data, dtype='<u2', count=width * height, offset=offset + 12).reshape(height, width)
+        blocks.append((x, y, halfwords))
+        offset += length
+
+    return {"mode": flags & 7, "clut": blocks[0] if len(blocks) == 2 else None, "image": blocks[-1]}
+
+def rgba_from_15bit(colors):
+    """RGBA of PS1 15-bit colors (BGR555), 0000h is transparent"""
+    rgba = np.empty(colors.shape + (4,), dtype=np.uint8)
+    for i, shift in enumerate((0, 5, 10)):
+        channel = ((colors >> shift) & 0x1F).astype(np.uint8)
+        rgba[..., i] = (channel << 3) | (channel >> 2)
+    rgba[..., 3] = np.where(colors == 0, 0, 255)
+    return rgba
+
+class Vram:
+    """
+    PS1 VRAM (1024x512 halfwords) filled with TIM images.
+    Texture pages are decoded the way the GPU reads them: the texpage gives the page position
+    and color depth, the CLUT the position of the palette.
+    Decoded pages are cached, primitives sharing a texpage/CLUT decode it only once.
+    """
+    def __init__(self):
+        self.data = np.zeros((VRAM_HEIGHT, VRAM_WIDTH), dtype=np.uint16)
+        self.blocks = []
+        self.pages = {}
+
+    def rows_cols(self, x, y, width, height):
+        # Reads and writes past the VRAM edge wrap around
+        return np.ix_((y + np.arange(height)) % VRAM_HEIGHT, (x + np.arange(width)) % VRAM_WIDTH)
+
+    def upload(self, x, y, halfwords, name=None):
+        height, width = halfwords.shape
+        self.data[self.rows_cols(x, y, width, height)] = halfwords
+        self.blocks.append((name, x, y, width, height))
+        self.pages.clear()
+
+    def load_tim(self, tim, name=None):
+        if tim["clut"]:
+            self.upload(*tim["clut"], name)
+        self.upload(*tim["image"], name)
+
+    def read(self, x, y, width, height):
+        return self.data[self.rows_cols(x, y, width, height)]
+
+    def page_rects(self, tpage, clut):
+        """VRAM rectangles (x, y, width, height) a texture page is read from: the page and its palette"""
+        x, y, _, depth = decode_texpage(tpage)
+        width, per_halfword = PAGE_DEPTHS[depth]
+        rects = [(x, y, width, PAGE_SIZE)]
+        if per_halfword > 1:
+            clut_x, clut_y = decode_clut(clut)
+            rects.append((clut_x, clut_y, 1 << (16 // per_halfword), 1))
+        return rects
+
+    def sources(self, tpage, clut):
+        """Names of the uploaded blocks overlapping the page (and palette) of a texpage/CLUT"""
+        names = []
+        for x, y, width, height in self.page_rects(tpage, clut):
+            for name, block_x, block_y, block_width, block_height in self.blocks:
+                if (x < block_x + block_width and block_x < x + width and y < block_y + block_height
+                        and block_y < y + height and name not in names):
+                    names.append(name)
+        return names
+
+    def page(self, tpage, clut):
+        """RGBA (256, 256, 4) of the texture page seen by primitives with this texpage/CLUT"""
+        _, _, _, depth = decode_texpage(tpage)
+        width, per_halfword = PAGE_DEPTHS[depth]
+        key = (tpage & TEXPAGE_DECODE_MASK, clut if per_halfword > 1 else 0)
+        if key in self.pages:
+            return self.pages[key]
+
+        page_rect, *clut_rect = self.page_rects(tpage, clut)
+        halfwords = self.read(*page_rect)
+        if per_halfword > 1:
+            # 4/8-bit texels are packed from the low bits, each one is a palette index
+            bits = 16 // per_halfword
+            indices = (halfwords[..., None] >> (np.arange(per_halfword) * bits)) & ((1 << bits) - 1)
+            colors = self.read(*clut_rect[0])[0][indices.reshape(PAGE_SIZE, PAGE_SIZE)]
+        else:
+            colors = halfwords
+
+        page = rgba_from_15bit(colors)
+        self.pages[key] = page
+        return page
+
+def find_tim_files(directory):
+    """file_<id>.tim files of a directory in file id order"""
+    files = []
+    for name in os.listdir(directory):
+        match = TIM_FILE_RE.match(name)
+        if match:
+            files.append((int(match.group(1)), os.path.join(directory, name)))
+    return [path for _, path in sorted(files)]
+
+@lru_cache(maxsize=16)
+def container_vram(directory, extra_tims=()):
+    """
+    VRAM with every TIM of a container (directory of the unpacked tree) uploaded in file order,
+    extra TIM files are uploaded last. Models of the same container share the VRAM and its decoded pages.
+    """
+    vram = Vram()
+    for path in find_tim_files(directory) + list(extra_tims):
+        with open(path, 'rb') as f:
+            vram.load_tim(parse_tim(f.read()), os.path.basename(path))
+    return vram
+
+def build_atlas(vram, triangles):
+    """
+    Texture atlas of a model: the texel rectangle used by every texpage/CLUT group of model_triangles
+    is cut from its decoded page and the rectangles are packed in rows, tallest first.
+    Returns None without textured triangles, otherwise a dict with:
+        image   - RGBA array, png - the image as PNG, width, height
+        regions - group key -> (atlas x, atlas y, u0, v0), texel (u, v) is at atlas (u - u0 + x, v - v0 + y)
+        missing - group keys whose page and palette no TIM was uploaded to, they get no region
+    """
+    keys = triangle_group_keys(triangles)
+    crops = {}
+    missing = []
+    for key, indices in triangle_groups(keys):
+        if key < 0:
+            continue
+        tpage, clut = key >> 16, key & 0xFFFF
+        if not vram.sources(tpage, clut):
+            missing.append(key)
+            continue
+        texels = triangles["texcoords"][indices].reshape(-1, 2)
+        u0, v0 = texels.min(axis=0).tolist()
+        u1, v1 = texels.max(axis=0).tolist()
+        crops[key] = (u0, v0, vram.page(tpage, clut)[v0:v1 + 1, u0:u1 + 1])
+
+    if not crops:
+        if not missing:
+            return None
+        return {"image": None, "png": None, "width": 0, "height": 0, "regions": {}, "missing": missing}
+
+    area = sum(crop.shape[0] * crop.shape[1] for _, _, crop in crops.values())
+    width = max(max(crop.shape[1] for _, _, crop in crops.values()), math.ceil(math.sqrt(area)))
+
+    regions = {}
+    x = y = row_height = 0
+    for key, (u0, v0, crop) in sorted(crops.items(), key=lambda item: -item[1][2].shape[0]):
+        height, crop_width = crop.shape[:2]
+        if x + crop_width > width:
+            x, y, row_height = 0, y + row_height, 0
+        regions[key] = (x, y, u0, v0)
+        x += crop_width
+        row_height = max(row_height, height)
+    height = y + row_height
+
+    image = np.zeros((height, width, 4), dtype=np.uint8)
+    for key, (x, y, _, _) in regions.items():
+        crop = crops[key][2]
+        image[y:y + crop.shape[0], x:x + crop.shape[1]] = crop
+
+    png = io.BytesIO()
+    Image.fromarray(image, 'RGBA').save(png, format='PNG')
+    return {"image": image, "png": png.getvalue(), "width": width, "height": height,
+            "regions": regions, "missing": missing}
+
+def model_atlas(model, directory, extra_tims=()):
+    """Atlas of a parsed model from the TIMs of its container directory, None for untextured models"""
+    triangles = model_triangles(model)
+    if triangles is None:
+        return None
+    return build_atlas(container_vram(str(directory), tuple(extra_tims)), triangles)
+
+def write_textured_obj(model, output_filepath, atlas=None):
+    """
+    Writes a model parsed by parse_ps1_model_arrays as OBJ + MTL (+ the atlas as PNG) next to each other.
+    Faces are the triangles of model_triangles with one material per texpage/CLUT group,
+    textured corners get their own texcoords in the atlas.
+    """
+    base = os.path.splitext(output_filepath)[0]
+    mtl_name = os.path.basename(base) + ".mtl"
+    png_name = os.path.basename(base) + ".png"
+
+    out = io.StringIO()
+    out.write(f"# Vertices: {model['num_vertices']}\n")
+    out.write(f"# Primitives: {model['num_primitives']}\n")
+    out.write(f"mtllib {mtl_name}\n\n")
+    vertices = model['vertices']
+    if len(vertices):
+        np.savetxt(out, np.column_stack((vertices['x'], vertices['y'], vertices['z'])), fmt="v %d %d %d")
+
+    mtl = io.StringIO()
+    triangles = model_triangles(model)
+    if triangles is not None:
+        texels = triangles["texcoords"].reshape(-1, 2).astype(np.float64)
+        texcoord_count = 0
+        for key, indices in triangle_groups(triangle_group_keys(triangles)):
+            faces = triangles["vertices"][indices].astype(np.int64) + 1
+            name = group_name(key)
+            out.write(f"\nusemtl {name}\n")
+            mtl.write(f"newmtl {name}\nKd 1.000 1.000 1.000\n")
+
+            if key < 0:
+                np.savetxt(out, faces, fmt="f %d %d %d")
+                mtl.write("\n")
+                continue
+
+            corners = (indices[:, None] * 3 + np.arange(3)).reshape(-1)
+            if atlas and key in atlas["regions"]:
+                x, y, u0, v0 = atlas["regions"][key]
+                texcoords = (texels[corners] - (u0, v0) + (x, y)) / (atlas["width"], atlas["height"])
+                mtl.write(f"map_Kd {png_name}\n")
+            else:
+                texcoords = texels[corners] / PAGE_SIZE
+            mtl.write("\n")
+            # OBJ texcoords start at the bottom of the image
+            texcoords[:, 1] = 1 - texcoords[:, 1]
+            np.savetxt(out, texcoords, fmt="vt %.6f %.6f")
+
+            texcoord_indices = texcoord_count + 1 + np.arange(len(corners)).reshape(-1, 3)
+            texcoord_count += len(corners)
+            np.savetxt(out, np.stack((faces, texcoord_indices), axis=2).reshape(-1, 6), fmt="f %d/%d %d/%d %d/%d")
+
+    with open(output_filepath, 'w') as f:
+        f.write(out.getvalue())
+    with open(base + ".mtl", 'w') as f:
+        f.write(mtl.getvalue())
+    if atlas and atlas["png"]:
+        with open(base + ".png", 'wb') as f:
+            f.write(atlas["png"])
+
+def main():
+    parser = argparse.ArgumentParser(description="Bind the textures of a .model from the TIM images of its container")
+    parser.add_argument("file", help="Input .model file (in the unpacked SPIRIT tree)")
+    parser.add_argument("out", help="Output .glb, or .obj (written with .mtl and the atlas .png)")
+    parser.add_argument("--tim", action="append", default=[], help="Extra TIM file to upload after the container TIMs")
+    args = parser.parse_args()
+
+    with open(args.file, 'rb') as f:
+        model = parse_ps1_model_arrays(f.read())
+
+    directory = os.path.dirname(os.path.abspath(args.file))
+    vram = container_vram(directory, tuple(args.tim))
+    atlas = model_atlas(model, directory, args.tim)
+
+    if atlas:
+        for key in sorted(list(atlas["regions"]) + atlas["missing"]):
+            tpage, clut = key >> 16, key & 0xFFFF
+            x, y, semi, depth = decode_texpage(tpage)
+            sources = ", ".join(vram.sources(tpage, clut)) or "no TIM"
+            print(f"    {group_name(key)}: page {x},{y} depth {depth} semi {semi} | clut {decode_clut(clut)} | {sources}")
+        print(f"[+] Atlas {atlas['width']}x{atlas['height']} | groups: {len(atlas['regions'])} "
+              f"(without TIM: {len(atlas['missing'])})")
+    else:
+        print("[+] The model has no textured primitives")
+
+    if args.out.lower().endswith(".glb"):
+        write_glb(model, args.out, os.path.splitext(os.path.basename(args.file))[0], atlas)
+    else:
+        write_textured_obj(model, args.out, atlas)
+    print(f"[+] Saved to {args.out}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+import os
+import math
+import argparse
+from pathlib import Path
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from parse_model import parse_ps1_model_arrays, model_triangles
+from export_glb import corner_colors
+from model_catalog import CATALOG_FILE, load_catalog, save_catalog, build_catalog, find_models
+
+# Canonical views: (name, yaw, pitch) in degrees
+VIEWS = [("front", 0, 0), ("side", 90, 0), ("top", 0, 90), ("iso", 45, 30)]
+BACKGROUND = (40, 40, 48)
+MARGIN = 4
+LABEL_HEIGHT = 14
+# Candidate pixels rasterized at once, bounds the memory of a batch
+RASTER_BATCH = 1 << 20
+
+def view_rotation(yaw, pitch):
+    yaw, pitch = math.radians(yaw), math.radians(pitch)
+    rotate_y = np.array([[math.cos(yaw), 0, math.sin(yaw)], [0, 1, 0], [-math.sin(yaw), 0, math.cos(yaw)]])
+    rotate_x = np.array([[1, 0, 0], [0, math.cos(pitch), -math.sin(pitch)], [0, math.sin(pitch), math.cos(pitch)]])
+    return rotate_x @ rotate_y
+
+def edge_coefficients(a, b, area):
+    """(A, B, C) of the edge function of a -> b divided by the triangle area: A * x + B * y + C"""
+    dx = (b[:, 0] - a[:, 0]) / area
+    dy = (b[:, 1] - a[:, 1]) / area
+    return np.column_stack((-dy, dx, dy * a[:, 0] - dx * a[:, 1]))
+
+def rasterize(points, depths, colors, size, flat=False):
+    """
+    Draws triangles with a z-buffer.
+    points (m, 3, 2) are pixel coordinates, depths (m, 3) - smaller is nearer, colors (m, 3, 3) corner RGB.
+    Barycentric weights and depth are linear in the pixel position, their coefficients are computed
+    per triangle and every triangle is expanded to the pixels of its bounding box at once.
+    Gouraud shading interpolates the corner colors, flat shading uses their mean.
+    Returns a (size, size, 3) uint8 image.
+    """
+    image = np.empty((size * size, 3), dtype=np.uint8)
+    image[:] = BACKGROUND
+    zbuffer = np.full(size * size, np.inf)
+
+    x0 = np.clip(np.floor(points[..., 0].min(axis=1)), 0, size - 1).astype(np.int64)
+    x1 = np.clip(np.ceil(points[..., 0].max(axis=1)), 0, size - 1).astype(np.int64)
+    y0 = np.clip(np.floor(points[..., 1].min(axis=1)), 0, size - 1).astype(np.int64)
+    y1 = np.clip(np.ceil(points[..., 1].max(axis=1)), 0, size - 1).astype(np.int64)
+    a, b, c = points[:, 0], points[:, 1], points[:, 2]
+    area = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0])
+    valid = np.abs(area) > 1e-9
+    area = np.where(valid, area, 1)
+    widths = x1 - x0 + 1
+    counts = np.where(valid, widths * (y1 - y0 + 1), 0)
+
+    # Weights of corners a and b, weight of c is 1 - w0 - w1; z = z_c + w0 * (z_a - z_c) + w1 * (z_b - z_c)
+    w0 = edge_coefficients(b, c, area)
+    w1 = edge_coefficients(c, a, area)
+    z = w0 * (depths[:, 0] - depths[:, 2])[:, None] + w1 * (depths[:, 1] - depths[:, 2])[:, None]
+    z[:, 2] += depths[:, 2]
+    if flat:
+        colors = np.repeat(colors.mean(axis=1, keepdims=True), 3, axis=1)
+
+    # Batches of whole triangles with at most RASTER_BATCH candidate pixels (a bigger triangle gets its own batch)
+    ends = np.cumsum(counts)
+    start = 0
+    while start < len(counts):
+        stop = max(int(np.searchsorted(ends, (ends[start - 1] if start else 0) + RASTER_BATCH, side='right')), start + 1)
+        triangles = np.arange(start, stop)
+        start = stop
+        batch_counts = counts[triangles]
+        total = int(batch_counts.sum())
+        if not total:
+            continue
+
+        triangle = np.repeat(triangles, batch_counts)
+        local = np.arange(total) - np.repeat(np.cumsum(batch_counts) - batch_counts, batch_counts)
+        row, column = np.divmod(local, widths[triangle])
+        px = x0[triangle] + column
+        py = y0[triangle] + row
+        cx, cy = px + 0.5, py + 0.5
+
+        weight_a = w0[triangle, 0] * cx + w0[triangle, 1] * cy + w0[triangle, 2]
+        weight_b = w1[triangle, 0] * cx + w1[triangle, 1] * cy + w1[triangle, 2]
+        # Either winding is drawn, models are double sided
+        inside = (weight_a >= 0) & (weight_b >= 0) & (weight_a + weight_b <= 1)
+        triangle, weight_a, weight_b = triangle[inside], weight_a[inside], weight_b[inside]
+        cx, cy = cx[inside], cy[inside]
+        pixels = py[inside] * size + px[inside]
+
+        depth = z[triangle, 0] * cx + z[triangle, 1] * cy + z[triangle, 2]
+        np.minimum.at(zbuffer, pixels, depth)
+        # Candidates at the depth left in the z-buffer are visible (equal depths - any of them)
+        visible = depth <= zbuffer[pixels]
+        triangle = triangle[visible]
+        weights = np.column_stack((weight_a[visible], weight_b[visible], 1 - weight_a[visible] - weight_b[visible]))
+        shaded = (weights[:, :, None] * colors[triangle]).sum(axis=1)
+        image[pixels[visible]] = np.clip(shaded, 0, 255).astype(np.uint8)
+
+    return image.reshape(size, size, 3)
+
+def render_view(model, triangles, yaw, pitch, size, flat=False, light=True):
+    """
+    Orthographic view of a model, fitted to a size x size image.
+    With light the corner colors are scaled by the facing of the triangle to the viewer.
+    """
+    if triangles is None:
+        image = np.empty((size, size, 3), dtype=np.uint8)
+        image[:] = BACKGROUND
+        return image
+
+    vertices = model['vertices']
+    # PS1 y and z point down/into the screen, views are y-up like the GLB export
+    points = np.column_stack((vertices['x'], vertices['y'], vertices['z'])).astype(np.float64) * (1, -1, -1)
+    view = points @ view_rotation(yaw, pitch).T
+    corners = view[triangles["vertices"]]
+
+    low = corners[..., :2].reshape(-1, 2).min(axis=0)
+    high = corners[..., :2].reshape(-1, 2).max(axis=0)
+    scale = (size - 2 * MARGIN) / max((high - low).max(), 1e-9)
+    center = (low + high) / 2
+    screen = np.empty(corners.shape[:2] + (2,))
+    screen[..., 0] = (corners[..., 0] - center[0]) * scale + size / 2
+    screen[..., 1] = (center[1] - corners[..., 1]) * scale + size / 2
+
+    colors = corner_colors(triangles)[:, :3].reshape(-1, 3, 3).astype(np.float64)
+    if light:
+        normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+        lengths = np.linalg.norm(normals, axis=1)
+        facing = np.abs(normals[:, 2]) / np.where(lengths > 0, lengths, 1)
+        colors *= (0.35 + 0.65 * facing)[:, None, None]
+
+    # The viewer looks along -z, larger z is nearer
+    return rasterize(screen, -corners[..., 2], colors, size, flat)
+
+def render_thumbnail(model, size=96, flat=False, light=True, views=VIEWS):
+    """Views of a parsed model side by side, (size, size * len(views), 3) uint8"""
+    triangles = model_triangles(model)
+    if triangles is not None and triangles["vertices"].max() >= model['num_vertices']:
+        raise Exception(f"Vertex index out of range: {triangles['vertices'].max()} >= {model['num_vertices']}")
+    return np.hstack([render_view(model, triangles, yaw, pitch, size, flat, light) for _, yaw, pitch in views])
+
+def render_file(model_path, output_path, size=96, flat=False, light=True):
+    """Renders and saves the thumbnail of a model file, returns (thumbnail, error)"""
+    try:
+        with open(model_path, 'rb') as f:
+            thumbnail = render_thumbnail(parse_ps1_model_arrays(f.read()), size, flat, light)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        Image.fromarray(thumbnail).save(output_path)
+        return thumbnail, None
+    except Exception as e:
+        return None, str(e)
+
+def contact_sheet(tiles, columns=4):
+    """Contact sheet of (label, thumbnail) tiles, thumbnails of the same size"""
+    height, width = tiles[0][1].shape[:2]
+    rows = math.ceil(len(tiles) / columns)
+    sheet = Image.new('RGB', (columns * width, rows * (height + LABEL_HEIGHT)), (0, 0, 0))
+    draw = ImageDraw.Draw(sheet)
+    for i, (label, thumbnail) in enumerate(tiles):
+        x, y = i % columns * width, i // columns * (height + LABEL_HEIGHT)
+        draw.text((x + 2, y + 1), label, fill=(220, 220, 220))
+        sheet.paste(Image.fromarray(thumbnail), (x, y + LABEL_HEIGHT))
+    return sheet
+
+def render_catalog(spirit_dir, output_dir, catalog, digests, jobs=None, size=96, flat=False, light=True, columns=4):
+    """
+    Renders every model of digests once (from its first copy) to output_dir, keeping its path below spirit_dir,
+    and writes contact_sheet.png with all of them. Returns the number of failed models.
+    """
+    models = catalog["models"]
+    digests = [digest for digest in digests if "error" not in models[digest]]
+    sources = [Path(spirit_dir) / models[digest]["files"][0] for digest in digests]
+    outputs = [Path(output_dir) / source.relative_to(spirit_dir).with_suffix(".png") for source in sources]
+
+    tiles = []
+    failed = 0
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        results = pool.map(render_file, sources, outputs, repeat(size), repeat(flat), repeat(light), chunksize=4)
+        for digest, source, (thumbnail, error) in zip(digests, sources, results):
+            if error:
+                failed += 1
+                print(f"[!] {source}: {error}")
+                continue
+            entry = models[digest]
+            tiles.append((f"{source.stem} x{len(entry['files'])} p{entry['primitives']}", thumbnail))
+
+    if tiles:
+        contact_sheet(tiles, columns).save(os.path.join(output_dir, "contact_sheet.png"))
+    print(f"[+] Thumbnails: {len(tiles)} (failed: {failed}) | views: {', '.join(name for name, _, _ in VIEWS)}")
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description="Render thumbnails of the unique models of the unpacked SPIRIT tree")
+    parser.add_argument("spirit_dir", help="Extracted SPIRIT directory")
+    parser.add_argument("output_dir", help="Folder for the thumbnails and contact_sheet.png")
+    parser.add_argument("--catalog", help=f"Catalog file (default: <spirit_dir>/{CATALOG_FILE})")
+    parser.add_argument("--has", action="append", default=[], help="Only models matching a query (see model_catalog.py)")
+    parser.add_argument("--size", type=int, default=96, help="Size of a view in pixels")
+    parser.add_argument("--flat", help="Flat shading instead of Gouraud", action="store_true")
+    parser.add_argument("--no_light", help="Vertex colors only, without shading by facing", action="store_true")
+    parser.add_argument("--columns", type=int, default=4, help="Models per row of the contact sheet")
+    parser.add_argument("--jobs", type=int, help="Number of worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    catalog_file = args.catalog or os.path.join(args.spirit_dir, CATALOG_FILE)
+    catalog = build_catalog(args.spirit_dir, load_catalog(catalog_file), args.jobs)
+    save_catalog(catalog, catalog_file)
+
+    digests = find_models(catalog, args.has) if args.has else list(catalog["models"])
+    os.makedirs(args.output_dir, exist_ok=True)
+    render_catalog(args.spirit_dir, args.output_dir, catalog, digests, args.jobs, args.size, args.flat,
+                   not args.no_light, args.columns)
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,20 @@
+import os
 import struct
 import argparse
 import json
+import hashlib
 from openpyxl import load_workbook
 
 from font_mapper import FontMapper
 from unpack_spirit import align_4
 
-from pack_script import normalize_text
+from pack_script import normalize_text, layout_payloads
+from parse_script import script_id_from_path
+from parse_database import DATABASE_TABLES
+from translation_formats import FORMAT_EXTENSIONS, load_translations
+from database_pages import paginate_database
+from dialog_layout import load_glyph_widths
+from database_search import english_search_keys, rebuild_search_table
 
 def pack_database_text(text, font_map: FontMapper):
     """
@@ -110,7 +118,65 @@ def pack_database_text(text, font_map: FontMapper):
                 
     return bytes(output)
 
-def build_database(data, font_map: FontMapper):
+# Bump when pack_database_text changes its output
+ENCODER_VERSION = 1
+
+def font_table_version(font_map: FontMapper):
+    """Hash of both font tables, packed bytes depend on nothing else"""
+    hasher = hashlib.sha1(f"encoder {ENCODER_VERSION}\n".encode('utf-8'))
+    hasher.update(repr(sorted(font_map.ascii_table.items())).encode('utf-8'))
+    hasher.update(repr(sorted(font_map.font_table.items())).encode('utf-8'))
+    return hasher.hexdigest()
+
+class EncodeCache:
+    """
+    Packed bytes of database texts keyed by the SHA-1 of the text.
+    The cache file is only used with the font tables it was written with,
+    entries not packed by the last build are dropped on save.
+    """
+    def __init__(self, font_map: FontMapper, filename=None):
+        self.font_map = font_map
+        self.filename = filename
+        self.version = font_table_version(font_map)
+        self.entries = {}
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+
+        if filename and os.path.exists(filename):
+            with open(filename, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+            if cache.get("version") == self.version:
+                self.entries = {key: bytes.fromhex(packed) for key, packed in cache["entries"].items()}
+
+    def pack(self, text):
+        key = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        self.used.add(key)
+        packed = self.entries.get(key)
+        if packed is None:
+            packed = pack_database_text(text, self.font_map)
+            self.entries[key] = packed
+            self.misses += 1
+        else:
+            self.hits += 1
+        return packed
+
+    def save(self):
+        if not self.filename:
+            return
+        entries = {key: self.entries[key].hex() for key in sorted(self.used)}
+        with open(self.filename, 'w', encoding='utf-8') as f:
+            json.dump({"version": self.version, "entries": entries}, f)
+
+def build_database(data, font_map: FontMapper, pool=False, cache: EncodeCache = None):
+    """
+    Builds a database file from parsed JSON data.
+    With pool=True identical topics, keywords and search entries of a table share one copy.
+    With a cache only texts that are not in it are packed, the tables are laid out again from the cached bytes.
+    """
+    def pack_text(text):
+        return cache.pack(text) if cache else pack_database_text(text, font_map)
+
     out = bytearray()
     offsets = []
 
@@ -141,22 +207,16 @@ def build_database(data, font_map: FontMapper):
     # Step 2: Sort entries by sorted_index for writing payload in file order
     sorted_entries = sorted(topics_entries, key=lambda x: x['sorted_index'])
 
-    payload = bytearray()
-    page_offsets_by_sorted_index = []
-    current_offset = entry_pages_offset_start + pages_offset_table_size
-
+    packed_entries = []
     for entry in sorted_entries:
-        search_key = pack_database_text(entry['search_key'], font_map)
-        title = pack_database_text(entry['title'], font_map)
-        pages = pack_database_text(entry['pages'], font_map)
-
-        packed = search_key + title + pages
-        page_offsets_by_sorted_index.append((entry['sorted_index'], current_offset))
-        payload += packed
-        current_offset += len(packed)
+        search_key = pack_text(entry['search_key'])
+        title = pack_text(entry['title'])
+        pages = pack_text(entry['pages'])
+        packed_entries.append(search_key + title + pages)
+    page_offsets, payload = layout_payloads(packed_entries, entry_pages_offset_start + pages_offset_table_size, pool)
 
     # Step 3: Map sorted_index -> file offset
-    sorted_index_to_offset = dict(page_offsets_by_sorted_index)
+    sorted_index_to_offset = {entry['sorted_index']: offset for entry, offset in zip(sorted_entries, page_offsets)}
 
     # Step 4: Write offsets to table in original offset_table_index order
     # So that offset table matches the original layout
@@ -178,16 +238,12 @@ def build_database(data, font_map: FontMapper):
     kw_table_size = 4 * n_kw
     out += b'\x00' * kw_table_size
 
-    payload = bytearray()
-    kw_offsets = []
-    current_offset = kw_offset_start + kw_table_size
+    packed_entries = []
     for entry in keyword_entries:
-        search_key = pack_database_text(entry['search_key'], font_map)
-        text = pack_database_text(entry['text'], font_map)
-        packed = search_key + text
-        kw_offsets.append(current_offset)
-        payload += packed
-        current_offset += len(packed)
+        search_key = pack_text(entry['search_key'])
+        text = pack_text(entry['text'])
+        packed_entries.append(search_key + text)
+    kw_offsets, payload = layout_payloads(packed_entries, kw_offset_start + kw_table_size, pool)
 
     for i, offset_val in enumerate(kw_offsets):
         struct.pack_into('<I', out, kw_offset_start + i * 4, offset_val)
@@ -203,16 +259,12 @@ def build_database(data, font_map: FontMapper):
     search_table_size = 4 * n_search
     out += b'\x00' * search_table_size
 
-    payload = bytearray()
-    search_offsets = []
-    current_offset = search_offset_start + search_table_size
+    packed_entries = []
     for entry in search_entries:
         header = struct.pack('<BB', entry['key_offset'], entry['count'])
-        keys = pack_database_text(entry['keys'], font_map)
-        packed = header + keys
-        search_offsets.append(current_offset)
-        payload += packed
-        current_offset += len(packed)
+        keys = pack_text(entry['keys'])
+        packed_entries.append(header + keys)
+    search_offsets, payload = layout_payloads(packed_entries, search_offset_start + search_table_size, pool)
 
     for i, offset_val in enumerate(search_offsets):
         struct.pack_into('<I', out, search_offset_start + i * 4, offset_val)
@@ -242,6 +294,67 @@ def import_from_excel_unescape(filename):
 
     return entries
 
+def is_database_workbook(filename):
+    """Workbook with the sheets of parse_database.export_to_excel_stream"""
+    wb = load_workbook(filename, read_only=True)
+    sheets = set(wb.sheetnames)
+    wb.close()
+    return "topics" in sheets
+
+def import_database_excel(filename):
+    """
+    Reads the topics/keywords/search sheets of parse_database.export_to_excel_stream in read-only mode,
+    rows are streamed one by one. Row N of a sheet is entry N-1 of its table, the columns are the text
+    fields of DATABASE_TABLES, empty cells are skipped.
+    Returns a mapping of <table>.<index>.<field> -> text.
+    """
+    wb = load_workbook(filename, read_only=True)
+
+    texts = {}
+    for table, (_, fields) in DATABASE_TABLES.items():
+        if table not in wb.sheetnames:
+            continue
+        for i, row in enumerate(wb[table].iter_rows(min_row=1, max_col=len(fields), values_only=True)):
+            for field, value in zip(fields, row):
+                if value is not None:
+                    # Unescape \\n -> \n
+                    texts[f"{table}.{i}.{field}"] = str(value).replace('\\n', '\n')
+
+    wb.close()
+    return texts
+
+def load_database_texts(filename, script_id):
+    """
+    Loads translated database texts of a PO/XLIFF/TSV file or a database workbook.
+    Returns a mapping of <table>.<index>.<field> -> text.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in FORMAT_EXTENSIONS:
+        return load_translations(filename).get(str(script_id), {})
+    if ext == '.xlsx':
+        return import_database_excel(filename)
+    raise ValueError(f"Unsupported translation source: {filename}")
+
+def apply_database_texts(data, texts):
+    """
+    Writes texts keyed by <table>.<index>.<field> into the parsed database.
+    Only texts that differ from the current ones are written.
+    Returns the list of changed keys.
+    """
+    changed = []
+    for index, text in texts.items():
+        table, i, field = index.split('.')
+        table_name, fields = DATABASE_TABLES[table]
+        if field not in fields:
+            raise ValueError(f"Unknown database text field: {index}")
+        entries = data[table_name]["entries"]
+        if not 0 <= int(i) < len(entries):
+            raise ValueError(f"Database text out of range: {index} ({len(entries)} {table} entries)")
+        if entries[int(i)][field] != text:
+            entries[int(i)][field] = text
+            changed.append(index)
+    return changed
+
 def generate_keyword_table(data):
     keywords = {}
     for entry in data["keywords_table"]["entries"]:
@@ -257,21 +370,66 @@ def main():
     parser = argparse.ArgumentParser(description="Pack JSON script into game format")
     parser.add_argument("input_json", help="Input JSON file with script structure (dialog/scenario)")
     parser.add_argument("out_file", help="Output script file")
-    parser.add_argument("--excel", help="Path to excel entries sheets")
+    parser.add_argument("--excel", help="Path to the translated workbook (topics/keywords/search sheets)")
+    parser.add_argument("--text", help="Path to translated text (.po/.xlf/.tsv)")
+    parser.add_argument("--script_id", help="Database id used in text keys (default: file id of input_json)")
+    parser.add_argument("--update_json", metavar="OUTPUT_JSON",
+                        help="Save the JSON with the merged translations to a separate file (input_json is never overwritten)")
+    parser.add_argument("--paginate", help="Rewrap English pages and split those that overflow the viewer",
+                        action="store_true")
+    parser.add_argument("--merge_pages", help="With --paginate also join short pages that fit together",
+                        action="store_true")
+    parser.add_argument("--widths", help="JSON file with glyph advances in pixels used by --paginate")
+    parser.add_argument("--search_index", help="Rebuild the search table from the topics, search keys of English "
+                        "topics are derived from their titles", action="store_true")
+    parser.add_argument("--pool", help="Write identical entries of a table only once", action="store_true")
+    parser.add_argument("--cache", help="Reuse packed texts of the last build (kept in <input_json>.encoded.json)",
+                        action="store_true")
     parser.add_argument("--font_table", default="./font/font-table.txt", help="Path to font-table.txt")
     parser.add_argument("--ascii_table", default="./font/ascii-table.bin", help="Path to ascii-table.bin")
     args = parser.parse_args()
 
+    if args.update_json and os.path.abspath(args.update_json) == os.path.abspath(args.input_json):
+        parser.error("--update_json must not overwrite input_json, the parsed dump")
+
     # Load JSON
     with open(args.input_json, 'r', encoding='utf-8') as f:
         data = json.load(f)
     
     # Load and insert excel entries
-    #if args.excel:
-    #    data['block_3']['entries'] = import_from_excel_unescape(args.excel)
-    
+    if args.excel:
+        changed = apply_database_texts(data, import_database_excel(args.excel))
+        print(f"[+] Changed texts from {args.excel}: {len(changed)}")
+
+    if args.text:
+        changed = apply_database_texts(data, load_database_texts(args.text, args.script_id or script_id_from_path(args.input_json)))
+        print(f"[+] Changed texts from {args.text}: {len(changed)}")
+
+    if args.update_json:
+        with open(args.update_json, 'w', encoding='utf-8') as out:
+            json.dump(data, out, indent=2, ensure_ascii=False)
+        print(f"[+] JSON with merged translations saved to: {args.update_json}")
+
+    if args.paginate:
+        widths = load_glyph_widths(args.widths) if args.widths else None
+        changed = paginate_database(data, generate_keyword_table(data), widths, args.merge_pages)
+        print(f"[+] Paginated texts: {changed}")
+
+    font_map = FontMapper(args.ascii_table, args.font_table)
+    if args.search_index:
+        print(f"[+] Search keys from English titles: {english_search_keys(data)}")
+        problems, differences, _ = rebuild_search_table(data, font_map)
+        for difference in differences:
+            print(f"[+] Search table {difference}")
+        for i, problem in problems:
+            print(f"[!] search.{i}: {problem}")
+
     # Build binary
-    bin_data = build_database(data, FontMapper(args.ascii_table, args.font_table))
+    cache = EncodeCache(font_map, os.path.splitext(args.input_json)[0] + ".encoded.json") if args.cache else None
+    bin_data = build_database(data, font_map, args.pool, cache)
+    if cache:
+        cache.save()
+        print(f"[+] Packed texts: {cache.misses} (cached: {cache.hits})")
 
     # Write
     with open(args.out_file, 'wb') as f:
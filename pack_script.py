@@ -1,3 +1,4 @@
+import os
 import struct
 import argparse
 import json
@@ -5,6 +6,9 @@ from openpyxl import load_workbook
 
 from font_mapper import FontMapper
 from unpack_spirit import align_4
+from parse_script import split_text_key, script_id_from_path
+from translation_formats import FORMAT_EXTENSIONS, load_translations
+from dialog_layout import reflow_entry, load_glyph_widths
 
 def normalize_text(text):
     replacements = {
@@ -146,7 +150,33 @@ def pack_script_text(text, font_map: FontMapper):
     return bytes(output)
 
 
-def build_dialog(data, font_map: FontMapper):
+def layout_payloads(payloads, base_offset, pool=False, consecutive=False):
+    """
+    Places packed table entries one after another from base_offset.
+    With pool=True an entry identical to an already written one gets its offset instead of a copy,
+    with consecutive=True only runs of identical neighbours are pooled so the offsets never decrease.
+    Returns (offsets, data).
+    """
+    offsets = []
+    data = bytearray()
+    written = {}
+    previous = None
+    for packed in payloads:
+        if pool and consecutive and previous is not None and packed == previous:
+            offsets.append(offsets[-1])
+            continue
+        if pool and not consecutive and packed in written:
+            offsets.append(written[packed])
+            continue
+        offset = base_offset + len(data)
+        written.setdefault(packed, offset)
+        offsets.append(offset)
+        data += packed
+        previous = packed
+    return offsets, bytes(data)
+
+
+def build_dialog(data, font_map: FontMapper, pool=False):
     out = bytearray()
     
     # Block 1: count entries, drop trailing 0 if present
@@ -166,19 +196,14 @@ def build_dialog(data, font_map: FontMapper):
     n = len(table_entries)
     
     # offsets start after table_size (4 bytes) + n*4 bytes
+    # pooled entries must keep the offsets non-decreasing (see unpack_spirit.check_text_table)
     base_offset = 4 + 4 * n
-    offsets = []
-    current = base_offset
-    payload_bytes = []
-    for entry in table_entries:
-        offsets.append(current)
-        packed = pack_script_text(entry, font_map)
-        payload_bytes.append(packed)
-        current += len(packed)
+    payload_bytes = [pack_script_text(entry, font_map) for entry in table_entries]
+    offsets, payload = layout_payloads(payload_bytes, base_offset, pool, consecutive=True)
     
     # sizes
     table_size = 4 + 4 * n
-    payload_len = sum(len(p) for p in payload_bytes)
+    payload_len = len(payload)
     block3_size = table_size + payload_len + 4
 
     # extra add_block bytes
@@ -216,8 +241,7 @@ def build_dialog(data, font_map: FontMapper):
     out += struct.pack('<I', table_size)
     for off in offsets:
         out += struct.pack('<I', off)
-    for packed in payload_bytes:
-        out += packed
+    out += payload
     
     # Add extra block
     out += b'\00' * (align_4(len(out)) - len(out))
@@ -226,7 +250,7 @@ def build_dialog(data, font_map: FontMapper):
     out += add_block_bytes
     return out
 
-def build_scenario(data, font_map: FontMapper):
+def build_scenario(data, font_map: FontMapper, pool=False):
     out = bytearray()
     
     # Write data_1 and data_2
@@ -254,17 +278,11 @@ def build_scenario(data, font_map: FontMapper):
     n = len(table_entries)
     
     base_offset = 4 + 4 * n  # 4 bytes for table_size + n*4 bytes for offsets
-    offsets = []
-    current = base_offset
-    payload_bytes = []
-    for entry in table_entries:
-        offsets.append(current)
-        packed = pack_script_text(entry, font_map)
-        payload_bytes.append(packed)
-        current += len(packed)
+    payload_bytes = [pack_script_text(entry, font_map) for entry in table_entries]
+    offsets, payload = layout_payloads(payload_bytes, base_offset, pool, consecutive=True)
     
     table_size = 4 + 4 * n
-    payload_len = sum(len(p) for p in payload_bytes)
+    payload_len = len(payload)
     block3_size = table_size + payload_len + 4  # +4 bytes for block3_size itself
     
     # Write data
@@ -272,8 +290,7 @@ def build_scenario(data, font_map: FontMapper):
     out += struct.pack('<I', table_size)
     for off in offsets:
         out += struct.pack('<I', off)
-    for packed in payload_bytes:
-        out += packed
+    out += payload
     
     # add_block empty data
     out += b'\x00' * 4
@@ -311,17 +328,135 @@ def import_from_excel_unescape(filename):
         cell_value = row[0]
         if cell_value is not None:
             # Unescape \\n -> \n
-            unescaped_text = cell_value.replace('\\n', '\n')
+            unescaped_text = str(cell_value).replace('\\n', '\n')
             entries.append(unescaped_text)
 
     return entries
 
+def import_from_excel_stream(filename, sheet=None):
+    """
+    Same as import_from_excel_unescape, but reads the workbook in read-only mode.
+    """
+    wb = load_workbook(filename, read_only=True)
+    ws = wb[sheet] if sheet else wb.active
+
+    entries = []
+    for row in ws.iter_rows(min_row=1, max_col=1, values_only=True):
+        cell_value = row[0]
+        if cell_value is not None:
+            entries.append(str(cell_value).replace('\\n', '\n'))
+
+    wb.close()
+    return entries
+
+def import_scripts_from_excel(filename, script_ids=None):
+    """
+    Reads a workbook written by parse_script.export_scripts_to_excel in read-only mode.
+    Returns a mapping of script id -> {table index: text}.
+    """
+    wb = load_workbook(filename, read_only=True)
+
+    scripts = {}
+    for ws in wb.worksheets:
+        if script_ids is not None and ws.title not in script_ids:
+            continue
+        texts = {}
+        for key, text in ws.iter_rows(min_row=1, max_col=2, values_only=True):
+            if key is None:
+                continue
+            script_id, index = split_text_key(str(key))
+            texts[index] = ('' if text is None else str(text)).replace('\\n', '\n')
+        scripts[ws.title] = texts
+
+    wb.close()
+    return scripts
+
+def is_scripts_workbook(filename):
+    """Workbook of parse_script.export_scripts_to_excel: sheets named by script id with <script id>:<index> keys"""
+    wb = load_workbook(filename, read_only=True)
+    ws = wb.worksheets[0]
+    first = next(ws.iter_rows(min_row=1, max_row=1, max_col=1, values_only=True), (None,))[0]
+    wb.close()
+    return isinstance(first, str) and ':' in first and split_text_key(first)[0] == ws.title
+
+def load_text_entries(filename, script_id=None):
+    """
+    Loads translated text entries from a translation source.
+    The source type is selected by the file extension.
+
+    Returns a list of entries replacing the whole table, or a mapping
+    of table index -> text for keyed sources (multi-script workbooks, PO, XLIFF, TSV).
+    Only plain single-column workbooks replace the whole table, a multi-script
+    workbook without a sheet for script_id has no entries for it.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in FORMAT_EXTENSIONS:
+        return load_translations(filename).get(str(script_id), {})
+    if ext == '.xlsx':
+        if is_scripts_workbook(filename):
+            if script_id is None:
+                raise ValueError(f"Script id needed to read multi-script workbook: {filename}")
+            return import_scripts_from_excel(filename, {str(script_id)}).get(str(script_id), {})
+        return import_from_excel_stream(filename)
+    raise ValueError(f"Unsupported translation source: {filename}")
+
+def merge_text_entries(table_entries, texts):
+    """
+    Applies loaded text entries to the table entries of a script.
+    """
+    if isinstance(texts, dict):
+        entries = list(table_entries)
+        for index, text in texts.items():
+            if not isinstance(index, int) or not 0 <= index < len(entries):
+                raise ValueError(f"Text entry out of range: {index} ({len(entries)} table entries)")
+            entries[index] = text
+        return entries
+    return texts
+
+def reflow_entries(entries, originals, widths=None):
+    """
+    Rewraps English entries to the window of their original text (see dialog_layout.entry_window),
+    widths are glyph advances of dialog_layout.load_glyph_widths.
+    """
+    return [reflow_entry(text, originals[i] if i < len(originals) else text, widths)
+            for i, text in enumerate(entries)]
+
+def build_script(data, font_map: FontMapper, text_source=None, fixes=False, script_id=None, reflow=False,
+                 pool=False, widths=None, originals=None):
+    """
+    Builds a .dialog/.scenario file from parsed JSON data and an optional translation source.
+    With reflow=True English entries are rewrapped to the window of their original text
+    (originals, by default the entries before the translation source is applied).
+    With pool=True consecutive identical entries share one copy of their text.
+    """
+    if originals is None:
+        originals = data['block_3']['table_entries']
+    if text_source:
+        texts = load_text_entries(text_source, script_id)
+        data['block_3']['table_entries'] = merge_text_entries(data['block_3']['table_entries'], texts)
+
+    if reflow:
+        data['block_3']['table_entries'] = reflow_entries(data['block_3']['table_entries'], originals, widths)
+
+    if fixes:
+        data["block_2"]["entries"] = fix_script_dialog_window(data["block_2"]["entries"])
+
+    if data["script"] == "dialog":
+        return build_dialog(data, font_map, pool)
+    elif data["script"] == "scenario":
+        return build_scenario(data, font_map, pool)
+    raise ValueError(f"Unknown script type: {data['script']}")
+
 def main():
     parser = argparse.ArgumentParser(description="Pack JSON script into game format")
     parser.add_argument("input_json", help="Input JSON file with script structure (dialog/scenario)")
     parser.add_argument("out_file", help="Output script file")
-    parser.add_argument("--excel", help="Path to excel text entries")
+    parser.add_argument("--excel", "--text", dest="excel", help="Path to text entries (.xlsx/.po/.xlf/.tsv)")
+    parser.add_argument("--script_id", help="Sheet of a multi-script workbook to read (default: file id of input_json)")
     parser.add_argument("--fixes", help="Apply various font fixes to the scripts", action="store_true")
+    parser.add_argument("--reflow", help="Rewrap English text to the window of each entry", action="store_true")
+    parser.add_argument("--widths", help="JSON file with glyph advances in pixels used by --reflow")
+    parser.add_argument("--pool", help="Write consecutive identical entries only once", action="store_true")
     parser.add_argument("--font_table", default="./font/font-table.txt", help="Path to font-table.txt")
     parser.add_argument("--ascii_table", default="./font/ascii-table.bin", help="Path to ascii-table.bin")
     args = parser.parse_args()
@@ -329,19 +464,11 @@ def main():
     # Load JSON
     with open(args.input_json, 'r', encoding='utf-8') as f:
         data = json.load(f)
-    
-    # Load and insert excel entries
-    if args.excel:
-        data['block_3']['table_entries'] = import_from_excel_unescape(args.excel)
-    
-    if args.fixes:
-        data["block_2"]["entries"] = fix_script_dialog_window(data["block_2"]["entries"])
 
     # Build binary
-    if data["script"] == "dialog":
-        bin_data = build_dialog(data, FontMapper(args.ascii_table, args.font_table))
-    elif data["script"] == "scenario":
-        bin_data = build_scenario(data, FontMapper(args.ascii_table, args.font_table))
+    script_id = args.script_id or script_id_from_path(args.input_json)
+    bin_data = build_script(data, FontMapper(args.ascii_table, args.font_table), args.excel, args.fixes, script_id,
+                            args.reflow, args.pool, load_glyph_widths(args.widths) if args.widths else None)
 
     # Write
     with open(args.out_file, 'wb') as f:
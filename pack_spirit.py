@@ -6,7 +6,22 @@ import json
 
 from unpack_spirit import align_4, align_sector, get_file_format, TYPE_WITH_FILES
 
-def rebuild_packed_data(entry_info, base_source_dir):
+def read_file_data(file_entry, source_dir, overrides=None):
+    """
+    Reads a regular file of the extracted tree.
+    overrides maps file ids to in-memory data that is used instead of the file on disk.
+    Returns None if the file does not exist.
+    """
+    if overrides and file_entry["id"] in overrides:
+        return overrides[file_entry["id"]]
+
+    file_path = os.path.join(source_dir, f"file_{file_entry['id']}{get_file_format(file_entry)}")
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path, 'rb') as f:
+        return f.read()
+
+def rebuild_packed_data(entry_info, base_source_dir, overrides=None):
     """
     Rebuilds data for a 'packed' or 'tab_packed' entry.
     base_source_dir is the path to the directory containing this packed container's files.
@@ -25,17 +40,15 @@ def rebuild_packed_data(entry_info, base_source_dir):
 
         if file_entry["type"] in TYPE_WITH_FILES and file_entry.get("files"):
             # Recursively rebuild nested containers
-            rebuilt_nested_data = rebuild_nested_container(file_entry, current_container_dir)
+            rebuilt_nested_data = rebuild_nested_container(file_entry, current_container_dir, overrides)
             rebuilt_parts.append(struct.pack('<I', len(rebuilt_nested_data)))
             rebuilt_parts.append(rebuilt_nested_data)
             rebuilt_parts.append(b'\x00' * (align_4(len(rebuilt_nested_data)) - len(rebuilt_nested_data)))
         else:
-            file_path = os.path.join(current_container_dir, f"file_{file_entry['id']}{get_file_format(file_entry)}")
-            if not os.path.exists(file_path):
-                print(f"ERROR: File not found: {file_path}")
+            sub_file_data = read_file_data(file_entry, current_container_dir, overrides)
+            if sub_file_data is None:
+                print(f"ERROR: File not found: file_{file_entry['id']}{get_file_format(file_entry)} in {current_container_dir}")
                 return b"" # Or raise an exception
-            with open(file_path, 'rb') as f:
-                sub_file_data = f.read()
 
             rebuilt_parts.append(struct.pack('<I', len(sub_file_data)))
             rebuilt_parts.append(sub_file_data)
@@ -43,7 +56,7 @@ def rebuild_packed_data(entry_info, base_source_dir):
             
     return b''.join(rebuilt_parts)
 
-def rebuild_archive_data(entry_info, base_source_dir):
+def rebuild_archive_data(entry_info, base_source_dir, overrides=None):
     """
     Rebuilds data for an 'archive' entry based on its parsed structure.
     """
@@ -85,15 +98,13 @@ def rebuild_archive_data(entry_info, base_source_dir):
         rebuilt_sub_data = b""
         if file_entry["type"] in TYPE_WITH_FILES and file_entry.get("files"):
             # Recursively rebuild nested containers.
-            rebuilt_sub_data = rebuild_nested_container(file_entry, current_container_dir)
+            rebuilt_sub_data = rebuild_nested_container(file_entry, current_container_dir, overrides)
         else:
             # Read the content of a regular file
-            file_path = os.path.join(current_container_dir, f"file_{file_entry['id']}{get_file_format(file_entry)}")
-            if not os.path.exists(file_path):
-                print(f"ERROR: File not found for archive sub-entry ID {file_entry['id']}: {file_path}")
+            rebuilt_sub_data = read_file_data(file_entry, current_container_dir, overrides)
+            if rebuilt_sub_data is None:
+                print(f"ERROR: File not found for archive sub-entry ID {file_entry['id']} in {current_container_dir}")
                 return b"" # Or raise an exception for critical error
-            with open(file_path, 'rb') as f:
-                rebuilt_sub_data = f.read()
             
         files_content_parts.append(rebuilt_sub_data)
         if entry_info["sectored"]:
@@ -136,7 +147,7 @@ def rebuild_archive_data(entry_info, base_source_dir):
     return rebuilt_header + b''.join(files_content_parts)
 
 
-def rebuild_map_data(entry_info, base_source_dir):
+def rebuild_map_data(entry_info, base_source_dir, overrides=None):
     """
     Rebuilds data for a 'map' entry.
     base_source_dir is the path to the directory containing this map container's files.
@@ -156,16 +167,14 @@ def rebuild_map_data(entry_info, base_source_dir):
         offsets.append(current_offset_in_map)
         
         if file_entry["type"] in TYPE_WITH_FILES and file_entry.get("files"):
-            nested_data = rebuild_nested_container(file_entry, current_container_dir)
+            nested_data = rebuild_nested_container(file_entry, current_container_dir, overrides)
             files_content_parts.append(nested_data)
             current_offset_in_map += len(nested_data)
         else:
-            file_path = os.path.join(current_container_dir, f"file_{file_entry['id']}{get_file_format(file_entry)}")
-            if not os.path.exists(file_path):
-                print(f"ERROR: File not found: {file_path}")
+            sub_file_data = read_file_data(file_entry, current_container_dir, overrides)
+            if sub_file_data is None:
+                print(f"ERROR: File not found: file_{file_entry['id']}{get_file_format(file_entry)} in {current_container_dir}")
                 return b"" # Or raise an exception
-            with open(file_path, 'rb') as f:
-                sub_file_data = f.read()
             
             files_content_parts.append(sub_file_data)
             current_offset_in_map += len(sub_file_data)
@@ -182,32 +191,32 @@ def rebuild_map_data(entry_info, base_source_dir):
         
     return rebuilt_header + b''.join(files_content_parts)
 
-def rebuild_nested_container(container_entry, base_source_dir):
+def rebuild_nested_container(container_entry, base_source_dir, overrides=None):
     """
     Handles the rebuilding of nested 'packed' or 'archive' containers.
     base_source_dir is the parent directory where this container's specific folder (e.g., 'packed_ID') resides.
     """
     if container_entry["type"] == "packed":
-        return rebuild_packed_data(container_entry, base_source_dir)
+        return rebuild_packed_data(container_entry, base_source_dir, overrides)
     elif container_entry["type"] == "archive":
-        return rebuild_archive_data(container_entry, base_source_dir)
+        return rebuild_archive_data(container_entry, base_source_dir, overrides)
     elif container_entry["type"] == "map":
-        return rebuild_map_data(container_entry, base_source_dir)
+        return rebuild_map_data(container_entry, base_source_dir, overrides)
     else:
         # If it's not a known container type, assume it's a regular file
         # The file itself should be directly in the base_source_dir
-        file_path = os.path.join(base_source_dir, f"file_{container_entry['id']}{get_file_format(container_entry)}")
-        if not os.path.exists(file_path):
-            print(f"ERROR: Nested regular data file not found: {file_path}")
+        file_data = read_file_data(container_entry, base_source_dir, overrides)
+        if file_data is None:
+            print(f"ERROR: Nested regular data file not found: file_{container_entry['id']}{get_file_format(container_entry)} in {base_source_dir}")
             return b""
-        with open(file_path, 'rb') as f:
-            return f.read()
+        return file_data
 
 from unpack_spirit import SECTORS_OFFSET, SECTORS_NUM
 
-def repack_spirit(spirit_dir, output_spirit, slpm_file, output_slpm):
+def repack_spirit(spirit_dir, output_spirit, slpm_file, output_slpm, overrides=None):
     """
     Repacks the spirit.dat file from extracted files and a structure.json.
+    overrides maps file ids to in-memory data that replaces the extracted files.
     """
     with open(os.path.join(spirit_dir, ".structure.json"), 'r', encoding='utf-8') as f:
         structure = json.load(f)
@@ -234,16 +243,14 @@ def repack_spirit(spirit_dir, output_spirit, slpm_file, output_slpm):
             continue
             
         if entry["type"] in TYPE_WITH_FILES and entry.get("files"):
-            entry_data = rebuild_nested_container(entry, spirit_dir)
+            entry_data = rebuild_nested_container(entry, spirit_dir, overrides)
             if entry["type"] == "packed":
                 entry_data += b'\x00' * 4
         else:
-            file_path = os.path.join(spirit_dir, f"file_{entry['id']}{get_file_format(entry)}")
-            if not os.path.exists(file_path):
-                print(f"ERROR: File not found for entry ID {entry['id']}: {file_path}")
+            entry_data = read_file_data(entry, spirit_dir, overrides)
+            if entry_data is None:
+                print(f"ERROR: File not found for entry ID {entry['id']}: file_{entry['id']}{get_file_format(entry)}")
                 continue
-            with open(file_path, 'rb') as f:
-                entry_data = f.read()
 
         rebuilt_entry_length = len(entry_data)
         actual_sector_size = align_sector(rebuilt_entry_length)
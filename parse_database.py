@@ -1,19 +1,52 @@
-import struct, argparse, json, os
+import struct, argparse, json, os, io, contextlib
+from concurrent.futures import ProcessPoolExecutor
 
 from unpack_spirit import align_4
 from font_mapper import FontMapper
 
 import csv
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Alignment
 from unpack_spirit import find_signature
+from parse_script import table_entry_sizes
 
 #from parse_script import export_to_excel_escape#, parse_script_text
 
-keywords = {}
-    
+font_map = None
+
+# Table prefixes of database text keys: <script id>:<table>.<index>.<field>
+DATABASE_TABLES = {
+    "topics": ("topics_table", ("search_key", "title", "pages")),
+    "keywords": ("keywords_table", ("search_key", "text")),
+    "search": ("search_table", ("keys",)),
+}
+
+def database_text_units(data):
+    """
+    Yields (table index, text) for every text field of a parsed database,
+    table index is <table>.<index>.<field>, e.g. topics.12.title
+    """
+    for table, (table_name, fields) in DATABASE_TABLES.items():
+        for i, entry in enumerate(data[table_name]["entries"]):
+            for field in fields:
+                yield f"{table}.{i}.{field}", entry[field]
+
+class DatabaseParseContext:
+    """
+    State of parsing one database file: the font tables and the keyword links
+    ([KEYWORD:(X,Y,Z)] - keyword X is defined by entry Z) found in its text.
+    Every parse gets its own context, so databases can be parsed in parallel.
+    """
+    def __init__(self, font_map: FontMapper):
+        self.font_map = font_map
+        self.keywords = {}
+
+    def parse_text(self, text_bytes, end_break=False):
+        return parse_database_text(text_bytes, self.font_map, end_break, self.keywords)
+
 # Script parsers
-def parse_database_text(text_bytes, font_map: FontMapper, end_break=False):
+def parse_database_text(text_bytes, font_map: FontMapper, end_break=False, keywords=None):
     i = 0
     output = []
 
@@ -84,7 +117,7 @@ def parse_database_text(text_bytes, font_map: FontMapper, end_break=False):
                 keyw_params = read_bracket_content()
                 content = keyw_params.decode('utf-8').strip('()')
                 parts = content.split(',')
-                if len(parts) == 3:
+                if len(parts) == 3 and keywords is not None:
                     x, y, z = parts
                     keywords[int(x.strip())] = int(z.strip())
                 output.append(f"[KEYWORD:{keyw_params.decode('utf-8')}]")
@@ -189,139 +222,130 @@ def get_text_entry_size(data: bytes) -> int:
 def parse_offsets(data):
     return struct.unpack_from('<IIIII', data, 0)
 
+def parse_info_entry(data, entry_offset):
+    return {
+        "id": struct.unpack_from('<H', data, entry_offset + 0)[0],
+        "type": struct.unpack_from('<H', data, entry_offset + 2)[0],
+        "reserved": struct.unpack_from('<H', data, entry_offset + 4)[0],
+        "topics": struct.unpack_from('<HHHHHHHH', data, entry_offset + 6),
+    }
+
 def parse_entries_table(data, start, end):
     entries = []
     for i in range((end - start) // 22):
-        entry_offset = start + i * 22
-        entry = {
-            "id": struct.unpack_from('<H', data, entry_offset + 0)[0],
-            "type": struct.unpack_from('<H', data, entry_offset + 2)[0],
-            "reserved": struct.unpack_from('<H', data, entry_offset + 4)[0],
-            "topics": struct.unpack_from('<HHHHHHHH', data, entry_offset + 6),
-        }
-        entries.append(entry)
+        entries.append(parse_info_entry(data, start + i * 22))
     return entries
 
-def parse_topics_table(data, offset, next_block_offset, font_map):
+def parse_table_offsets(data, offset):
+    """Offset table of a topics/keywords/search table, its first offset gives the table size"""
     table_size = struct.unpack_from('<I', data, offset)[0] - offset
     table_offsets_count = table_size // 4
-    table_offsets = [struct.unpack_from('<I', data, offset + i * 4)[0] for i in range(table_offsets_count)]
+    return [struct.unpack_from('<I', data, offset + i * 4)[0] for i in range(table_offsets_count)]
+
+def sorted_positions(table_offsets):
+    """Maps every offset to its position in the sorted offsets (shared offsets get the first one)"""
+    positions = {}
+    for i, entry_offset in enumerate(sorted(table_offsets)):
+        positions.setdefault(entry_offset, i)
+    return positions
+
+def parse_topic_entry(entry_data, sorted_index, context: DatabaseParseContext):
+    title = entry_data[4:4 + get_text_entry_size(entry_data[4:])]
+    return {
+        "sorted_index": sorted_index,
+        "search_key" : context.parse_text(entry_data[:4]),
+        "title" : context.parse_text(title),
+        "pages" : context.parse_text(entry_data[4 + len(title):], True)
+    }
+
+def parse_keyword_entry(entry_id, entry_data, context: DatabaseParseContext):
+    """Keyword entry without its type, see keyword_type"""
+    return {
+        "id" : entry_id,
+        "search_key" : context.parse_text(entry_data[:4]),
+        "text" : context.parse_text(entry_data[4:])
+    }
+
+def keyword_type(entry, keywords):
+    """Adds type and definition_id of a keyword entry from the collected keyword links"""
+    definition_id = keywords.get(entry["id"], "")
+    return {
+        "id" : entry["id"],
+        "type" : "keyword" if definition_id else "definition",
+        "definition_id" : definition_id,
+        "search_key" : entry["search_key"],
+        "text" : entry["text"]
+    }
+
+def parse_search_entry(entry_data, context: DatabaseParseContext):
+    return {
+        "key_offset" : entry_data[0],
+        "count" : entry_data[1],
+        "keys" : context.parse_text(entry_data[2:])
+    }
+
+def parse_topics_table(data, offset, next_block_offset, context: DatabaseParseContext):
+    table_offsets = parse_table_offsets(data, offset)
 
     print(offset, next_block_offset)
-    print(table_size, table_offsets_count)
+    print(len(table_offsets) * 4, len(table_offsets))
 
     # Вычисляем размеры на основе отсортированных смещений
-    sorted_offsets = sorted(table_offsets)
-    offset_to_size = {}
-    block_size = next_block_offset - offset
-
-    for i, entry_offset in enumerate(sorted_offsets):
-        if i + 1 < len(sorted_offsets):
-            size = sorted_offsets[i + 1] - entry_offset
-        else:
-            size = block_size - (entry_offset - offset)
-        offset_to_size[entry_offset] = size
+    table_sizes = table_entry_sizes(table_offsets, next_block_offset)
+    positions = sorted_positions(table_offsets)
 
     table_entries = []
-    raw_table_entries = []
-
-    for idx, entry_offset in enumerate(table_offsets):
-        size = offset_to_size[entry_offset]
+    for entry_offset, size in zip(table_offsets, table_sizes):
         entry_data = data[entry_offset:entry_offset + size]
-        raw_table_entries.append(entry_data.hex())
-
-        sorted_index = sorted_offsets.index(entry_offset)
-        title = entry_data[4:4 + get_text_entry_size(entry_data[4:])]
-        #print(title)
-        #if sorted_index == 397:
-        #    print(entry_data, title, parse_database_text(entry_data[:4], font_map), parse_database_text(title, font_map))
-            
-        table_entries.append({       
-            "sorted_index": sorted_index+1,         
-            "search_key" : parse_database_text(entry_data[:4], font_map),
-            "title" : parse_database_text(title, font_map),
-            "pages" : parse_database_text(entry_data[4 + len(title):], font_map, True)
-        })
+        table_entries.append(parse_topic_entry(entry_data, positions[entry_offset] + 1, context))
 
     return {
         "offsets": table_offsets,
         "entries": table_entries,
-        #"raw_entries": raw_table_entries
     }
 
-def parse_keyword_table(data, offset, next_block_offset, font_map):
-    table_size = struct.unpack_from('<I', data, offset)[0] - offset
-    table_offsets_count = table_size // 4
-    table_offsets = [struct.unpack_from('<I', data, offset + i * 4)[0] for i in range(table_offsets_count)]
-    block_size = next_block_offset - offset
+def parse_keyword_table(data, offset, next_block_offset, context: DatabaseParseContext):
+    table_offsets = parse_table_offsets(data, offset)
 
     print(offset, next_block_offset)
-    print(table_size, table_offsets_count)
-    print(block_size)
+    print(len(table_offsets) * 4, len(table_offsets))
+    print(next_block_offset - offset)
 
     table_entries = []
-    raw_table_entries = []
+    table_sizes = table_entry_sizes(table_offsets, next_block_offset)
+    for i, (entry_offset, size) in enumerate(zip(table_offsets, table_sizes)):
+        table_entries.append(parse_keyword_entry(i, data[entry_offset:entry_offset + size], context))
 
-    for i, entry_offset in enumerate(table_offsets):
-        if i + 1 < len(table_offsets):
-            size = table_offsets[i + 1] - entry_offset
-        else:
-            size = block_size - (entry_offset - offset)
-        entry_data = data[entry_offset:entry_offset + size]
-        raw_table_entries.append(entry_data.hex())
-        definition_id = keywords.get(i, "")
-        keyword_type = "keyword" if definition_id else "definition"
-        table_entries.append({
-            "id" : i,
-            "type" : keyword_type,
-            "definition_id" : definition_id,
-            "search_key" : parse_database_text(entry_data[:4], font_map),
-            "text" : parse_database_text(entry_data[4:], font_map)
-        })
+    # Links of the keyword texts themselves count too, so types are resolved after the whole table
+    table_entries = [keyword_type(entry, context.keywords) for entry in table_entries]
 
     return {
         "offsets": table_offsets,
         "entries": table_entries,
-        #"raw_entries": raw_table_entries
     }
 
-def parse_search_table(data, offset, next_block_offset, font_map):
-    table_size = struct.unpack_from('<I', data, offset)[0] - offset
-    table_offsets_count = table_size // 4
-    table_offsets = [struct.unpack_from('<I', data, offset + i * 4)[0] for i in range(table_offsets_count)]
-    block_size = next_block_offset - offset
+def parse_search_table(data, offset, next_block_offset, context: DatabaseParseContext):
+    table_offsets = parse_table_offsets(data, offset)
 
     print(offset, next_block_offset)
-    print(table_size, table_offsets_count)
-    print(block_size)
+    print(len(table_offsets) * 4, len(table_offsets))
+    print(next_block_offset - offset)
 
     table_entries = []
-    raw_table_entries = []
-
-    for i, entry_offset in enumerate(table_offsets):
-        if i + 1 < len(table_offsets):
-            size = table_offsets[i + 1] - entry_offset
-        else:
-            size = block_size - (entry_offset - offset)
-        entry_data = data[entry_offset:entry_offset + size]
-        raw_table_entries.append(entry_data.hex())
-
-        print("Search", entry_offset, size, len(data[entry_offset:next_block_offset]))
-
-        table_entries.append({
-            "key_offset" : entry_data[0],
-            "count" : entry_data[1],
-            "keys" : parse_database_text(entry_data[2:], font_map)
-        })
+    table_sizes = table_entry_sizes(table_offsets, next_block_offset)
+    for entry_offset, size in zip(table_offsets, table_sizes):
+        table_entries.append(parse_search_entry(data[entry_offset:entry_offset + size], context))
 
     return {
         "offsets": table_offsets,
         "entries": table_entries,
-        #"raw_entries": raw_table_entries
     }
 
-def parse_database(data, font_map):
+def parse_database(data, font_map, context=None):
     """
+    Parses a database file. Keyword links are collected in context
+    (a new DatabaseParseContext unless given).
+
     Database file structure:
         1. Offsets:
         [16-bytes : 4-bytes] 
@@ -358,6 +382,8 @@ def parse_database(data, font_map):
                 0x01: [8-bit] Count
                 0x02: [ASCII] Keys (String separeted by [END])
     """
+    if context is None:
+        context = DatabaseParseContext(font_map)
 
     offsets = parse_offsets(data)
     print("Offsets:", offsets)
@@ -365,13 +391,13 @@ def parse_database(data, font_map):
     entries_table = parse_entries_table(data, offsets[0], offsets[1])
     print(f"Entries info table count: {len(entries_table)}")
 
-    topics_table = parse_topics_table(data, offsets[1] + 4, offsets[2], font_map)
+    topics_table = parse_topics_table(data, offsets[1] + 4, offsets[2], context)
     print(f"Topics table count: {len(topics_table['offsets'])}")
 
-    keywords_table = parse_keyword_table(data, offsets[2], offsets[3], font_map)
+    keywords_table = parse_keyword_table(data, offsets[2], offsets[3], context)
     print(f"Keywords table count: {len(keywords_table['offsets'])}")
 
-    search_table = parse_search_table(data, offsets[3], offsets[4], font_map)
+    search_table = parse_search_table(data, offsets[3], offsets[4], context)
     print(f"Search table count: {len(search_table['offsets'])}")
 
     return {
@@ -416,41 +442,89 @@ def export_to_excel_escape(data, filename, default_row_height=15):
 
     wb.save(filename)
 
-def main():
-    global keywords
+def export_to_excel_stream(data, filename):
+    """
+    Same sheets as export_to_excel_escape, but written in write-only mode
+    so rows are streamed to disk instead of kept in memory.
+    """
+    wb = Workbook(write_only=True)
 
-    parser = argparse.ArgumentParser(description="Parse database file")
-    parser.add_argument("file", help="Input .database file")
-    parser.add_argument("--json_out", help="Path to save parsed data (.json)")
-    parser.add_argument("--excel_out", help="Path to save Excel entries (.xlsx)")
-    parser.add_argument("--font_table", default="./font/font-table.txt", help="Path to font-table.txt")
-    parser.add_argument("--ascii_table", default="./font/ascii-table.bin", help="Path to ascii-table.bin")
-    args = parser.parse_args()
+    def escaped(ws, text):
+        # Escape line breaks \n -> \\n
+        return WriteOnlyCell(ws, value=text.replace('\n', '\\n'))
 
-    input_dir = os.path.dirname(args.file)
-    base_name = os.path.splitext(os.path.basename(args.file))[0]
-    if not args.json_out:
-        args.json_out = os.path.join(input_dir, base_name + ".json")
-    if not args.excel_out:
-        args.excel_out = os.path.join(input_dir, base_name + ".xlsx")
+    ws_topics = wb.create_sheet("topics")
+    for entry in data["topics_table"]["entries"]:
+        ws_topics.append([entry["search_key"], entry["title"], escaped(ws_topics, entry["pages"])])
 
-    with open(args.file, 'rb') as f1:
-        data = f1.read()
+    ws_keywords = wb.create_sheet("keywords")
+    for entry in data["keywords_table"]["entries"]:
+        ws_keywords.append([entry["search_key"], escaped(ws_keywords, entry["text"])])
+
+    ws_search = wb.create_sheet("search")
+    for entry in data["search_table"]["entries"]:
+        ws_search.append([escaped(ws_search, entry["keys"])])
+
+    wb.save(filename)
+
+def init_worker(ascii_table, font_table):
+    global font_map
+    font_map = FontMapper(ascii_table, font_table)
+
+def export_database_file(path, json_out=None, excel_out=None, quiet=False):
+    """
+    Parses a .database file with the font tables of this process (see init_worker)
+    and saves the JSON dump and Excel entries next to it unless paths are given.
+    Returns (path, json_out, excel_out), outputs are None if the file is not a database.
+    """
+    base_name = os.path.splitext(path)[0]
+    json_out = json_out or base_name + ".json"
+    excel_out = excel_out or base_name + ".xlsx"
 
-    script_type = find_signature(data)
-    if script_type not in ["database"]:
-        print("Wrong file type! Not .database")
-        return
+    with open(path, 'rb') as f:
+        data = f.read()
 
-    parsed_data = parse_database(data, FontMapper(args.ascii_table, args.font_table))
+    if find_signature(data) not in ["database"]:
+        return path, None, None
 
-    with open(args.json_out, 'w', encoding='utf-8') as out:
+    # Table diagnostics of parallel parses would interleave
+    with contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext():
+        parsed_data = parse_database(data, font_map)
+
+    with open(json_out, 'w', encoding='utf-8') as out:
         json.dump(parsed_data, out, indent=2, ensure_ascii=False)
-    print("[+] JSON saved to:", args.json_out)
+    export_to_excel_stream(parsed_data, excel_out)
+    return path, json_out, excel_out
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse database file")
+    parser.add_argument("files", nargs='+', help="Input .database file(s)")
+    parser.add_argument("--json_out", help="Path to save parsed data (.json), single input only")
+    parser.add_argument("--excel_out", help="Path to save Excel entries (.xlsx), single input only")
+    parser.add_argument("--jobs", type=int, help="Number of worker processes for several files (default: CPU count)")
+    parser.add_argument("--font_table", default="./font/font-table.txt", help="Path to font-table.txt")
+    parser.add_argument("--ascii_table", default="./font/ascii-table.bin", help="Path to ascii-table.bin")
+    args = parser.parse_args()
 
-    export_to_excel_escape(parsed_data, args.excel_out)
-    print("[+] Excel saved to:", args.excel_out)
+    if len(args.files) > 1 and (args.json_out or args.excel_out):
+        parser.error("--json_out/--excel_out need a single input file")
+
+    if len(args.files) == 1:
+        init_worker(args.ascii_table, args.font_table)
+        results = [export_database_file(args.files[0], args.json_out, args.excel_out)]
+    else:
+        with ProcessPoolExecutor(max_workers=args.jobs, initializer=init_worker,
+                                 initargs=(args.ascii_table, args.font_table)) as pool:
+            results = list(pool.map(export_database_file, args.files, [None] * len(args.files),
+                                    [None] * len(args.files), [True] * len(args.files)))
+
+    for path, json_out, excel_out in results:
+        if json_out is None:
+            print(f"Wrong file type! Not .database: {path}")
+            continue
+        print("[+] JSON saved to:", json_out)
+        print("[+] Excel saved to:", excel_out)
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -1,5 +1,41 @@
+import io
 import struct, argparse
 
+try:
+    import numpy as np
+except ImportError:
+    # Only the vectorized parser and the functions working on its arrays need numpy
+    np = None
+
+# Vertex block entry: short x, short y, short z, short w_or_padding
+VERTEX_DTYPE = [('x', '<i2'), ('y', '<i2'), ('z', '<i2'), ('w_or_padding', '<i2')]
+
+# Primitive classes with the same layout as the branches of parse_ps1_model_data:
+# name: (commands, size, vertex indices, shader_color_raw slice, texture_raw slice)
+PRIMITIVE_CLASSES = {
+    "mono3": ((0x20, 0x22), 12, 3, None, None),
+    "mono4": ((0x28, 0x2A), 12, 4, None, None),
+    "textured3": ((0x24,), 20, 3, None, (10, 20)),
+    # 0x2E/0x2F are stored like 0x25
+    "raw_textured3": ((0x25, 0x2E, 0x2F), 24, 3, None, (12, 24)),
+    "textured4": ((0x2C, 0x2D), 24, 4, None, (12, 24)),
+    "shaded3": ((0x30, 0x32), 20, 3, (12, 20), None),
+    "shaded4": ((0x38, 0x3A), 24, 4, (12, 24), None),
+    "shaded_textured3": ((0x34, 0x36), 28, 3, (10, 20), (20, 28)),
+    "shaded_textured4": ((0x3C, 0x3E), 36, 4, (12, 24), (24, 36)),
+}
+
+# Stride table: command byte -> primitive size (0 - unknown command)
+PRIMITIVE_STRIDES = [0] * 0x100
+PRIMITIVE_CLASS_IDS = [-1] * 0x100
+for class_id, (commands, size, _, _, _) in enumerate(PRIMITIVE_CLASSES.values()):
+    for command in commands:
+        PRIMITIVE_STRIDES[command] = size
+        PRIMITIVE_CLASS_IDS[command] = class_id
+
+# Corners of the triangles of a primitive, quads are drawn as 0 1 2 + 1 3 2
+PRIMITIVE_TRIANGLES = {3: [[0, 1, 2]], 4: [[0, 1, 2], [1, 3, 2]]}
+
 def parse_ps1_model_data(data):
     """
     Parses PS1 model data based on a specific structure.
@@ -316,6 +352,183 @@ def parse_ps1_model_data(data):
         'primitives': primitives
     }
 
+def scan_primitives(data, offset, num_primitives):
+    """
+    Walks the primitive block with the stride table, only the command bytes are read.
+    Returns (offsets, class ids) of every primitive as numpy arrays.
+    """
+    offsets = []
+    class_ids = []
+    strides = PRIMITIVE_STRIDES
+    ids = PRIMITIVE_CLASS_IDS
+    for i in range(num_primitives):
+        command = data[offset + 3]
+        size = strides[command]
+        if not size:
+            raise Exception(f"Unknown primitive command: {i} | {hex(command)} | {data[offset:offset+4]}")
+        offsets.append(offset)
+        class_ids.append(ids[command])
+        offset += size
+    if offset > len(data):
+        raise Exception(f"Primitive block ends past the data: {offset} > {len(data)}")
+    return np.array(offsets, dtype=np.int64), np.array(class_ids, dtype=np.int8)
+
+def parse_ps1_model_arrays(data):
+    """
+    Vectorized version of parse_ps1_model_data.
+
+    Returns a dict with:
+        vertices   - structured array of VERTEX_DTYPE
+        primitives - class name -> dict of arrays for the primitives of that class:
+                     positions (index in the primitive block), command, header_raw (n, 4),
+                     rgb_color (n, 3), vertex_indices (n, 3|4) and shader_color_raw/texture_raw (n, m)
+        num_vertices, num_primitives
+    """
+    if np is None:
+        raise ImportError("parse_ps1_model_arrays requires numpy")
+    buffer = np.frombuffer(data, dtype=np.uint8)
+
+    num_vertices = struct.unpack_from('<I', data, 0)[0]
+    if 4 + num_vertices * 8 > len(data):
+        raise Exception(f"Wrong num parsed vertices: {(len(data) - 4) // 8} < {num_vertices}")
+    vertices = np.frombuffer(data, dtype=VERTEX_DTYPE, count=num_vertices, offset=4)
+
+    offset = 4 + num_vertices * 8
+    num_primitives = struct.unpack_from('<I', data, offset)[0]
+    offsets, class_ids = scan_primitives(data, offset + 4, num_primitives)
+
+    primitives = {}
+    for class_id, (name, (_, size, vertex_count, shader_slice, texture_slice)) in enumerate(PRIMITIVE_CLASSES.items()):
+        positions = np.flatnonzero(class_ids == class_id)
+        if not len(positions):
+            continue
+        # Gather every primitive of the class into one contiguous (n, size) block
+        rows = buffer[offsets[positions, None] + np.arange(size)]
+        primitive = {
+            "positions": positions,
+            "command": rows[:, 3].copy(),
+            "header_raw": rows[:, 0:4],
+            "rgb_color": rows[:, 0:3],
+            "vertex_indices": np.ascontiguousarray(rows[:, 4:4 + vertex_count * 2]).view('<u2'),
+        }
+        if shader_slice:
+            primitive["shader_color_raw"] = rows[:, shader_slice[0]:shader_slice[1]]
+        if texture_slice:
+            primitive["texture_raw"] = rows[:, texture_slice[0]:texture_slice[1]]
+        primitives[name] = primitive
+
+    return {
+        'num_vertices': num_vertices,
+        'vertices': vertices,
+        'num_primitives': num_primitives,
+        'primitives': primitives
+    }
+
+def texture_words(name, primitive):
+    """
+    Texture words of a primitive class of parse_ps1_model_arrays, laid out like the GP0 words:
+    u0 v0 clut u1 v1 tpage u2 v2 [u3 v3].
+    Returns (texcoords (n, vertices, 2), clut (n,), tpage (n,)) or None for untextured classes.
+    """
+    if 'texture_raw' not in primitive:
+        return None
+    block = primitive['texture_raw']
+    if name == "shaded_textured3":
+        # texture_raw of 0x34/0x36 is [20:28], the words start at 18 with the last 2 bytes of shader_color_raw
+        block = np.hstack((primitive['shader_color_raw'][:, -2:], block))
+    vertex_count = primitive['vertex_indices'].shape[1]
+    texcoords = np.stack([block[:, o:o + 2] for o in (0, 4, 8, 10)[:vertex_count]], axis=1)
+    clut = block[:, 2].astype(np.uint16) | (block[:, 3].astype(np.uint16) << 8)
+    tpage = block[:, 6].astype(np.uint16) | (block[:, 7].astype(np.uint16) << 8)
+    return texcoords, clut, tpage
+
+def vertex_colors(primitive):
+    """
+    RGB of every vertex of a primitive class (n, vertices, 3): the first color is rgb_color,
+    shaded primitives store the others in shader_color_raw as RGB + padding.
+    """
+    count, vertex_count = primitive['vertex_indices'].shape
+    colors = np.repeat(primitive['rgb_color'][:, None, :], vertex_count, axis=1)
+    if 'shader_color_raw' in primitive:
+        shaded = primitive['shader_color_raw'][:, :(vertex_count - 1) * 4].reshape(count, vertex_count - 1, 4)
+        colors[:, 1:] = shaded[:, :, :3]
+    return colors
+
+def model_triangles(model):
+    """
+    Splits the primitives of a model parsed by parse_ps1_model_arrays into triangles.
+    Returns a dict of arrays over the triangles in primitive order:
+        vertices (m, 3) vertex indices, colors (m, 3, 3) RGB, texcoords (m, 3, 2) texels,
+        textured, raw_texture (m,) flags, clut, tpage (m,) words
+    """
+    parts = []
+    for name, primitive in model['primitives'].items():
+        indices = primitive['vertex_indices']
+        count, vertex_count = indices.shape
+        corners = np.array(PRIMITIVE_TRIANGLES[vertex_count])
+        repeat = len(corners)
+
+        words = texture_words(name, primitive)
+        if words:
+            texcoords, clut, tpage = words
+        else:
+            texcoords = np.zeros((count, vertex_count, 2), dtype=np.uint8)
+            clut = tpage = np.zeros(count, dtype=np.uint16)
+        # Bit 0 of a textured command - raw texture, the color is ignored
+        raw_texture = (primitive['command'] & 1).astype(bool) & (words is not None)
+
+        parts.append({
+            "position": np.repeat(primitive['positions'], repeat),
+            "vertices": indices[:, corners].reshape(-1, 3),
+            "colors": vertex_colors(primitive)[:, corners].reshape(-1, 3, 3),
+            "texcoords": texcoords[:, corners].reshape(-1, 3, 2),
+            "textured": np.full(count * repeat, words is not None),
+            "raw_texture": np.repeat(raw_texture, repeat),
+            "clut": np.repeat(clut, repeat),
+            "tpage": np.repeat(tpage, repeat),
+        })
+
+    if not parts:
+        return None
+    order = np.argsort(np.concatenate([part["position"] for part in parts]), kind='stable')
+    return {key: np.concatenate([part[key] for part in parts])[order] for key in parts[0] if key != "position"}
+
+def triangle_group_keys(triangles):
+    """Texpage/CLUT group of every triangle of model_triangles: tpage << 16 | clut, -1 for untextured ones"""
+    return np.where(triangles["textured"], (triangles["tpage"].astype(np.int64) << 16) | triangles["clut"], -1)
+
+def triangle_groups(keys):
+    """(key, triangle indices) of every group of triangle_group_keys in key order, triangles stay in primitive order"""
+    group_keys, groups, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    order = np.argsort(groups.reshape(-1), kind='stable')
+    bounds = np.concatenate(([0], np.cumsum(counts)))
+    return [(key, order[bounds[i]:bounds[i + 1]]) for i, key in enumerate(group_keys.tolist())]
+
+def model_arrays_to_data(model):
+    """Converts the result of parse_ps1_model_arrays to the dicts of parse_ps1_model_data"""
+    vertices = [{'x': int(v['x']), 'y': int(v['y']), 'z': int(v['z']), 'w_or_padding': int(v['w_or_padding'])}
+                for v in model['vertices']]
+    primitives = [None] * model['num_primitives']
+    for primitive in model['primitives'].values():
+        for i, position in enumerate(primitive['positions']):
+            entry = {
+                'header_raw': primitive['header_raw'][i].tobytes(),
+                'command': hex(primitive['command'][i]),
+                'rgb_color': tuple(int(c) for c in primitive['rgb_color'][i]),
+                'vertex_indices': tuple(int(v) for v in primitive['vertex_indices'][i]),
+            }
+            if 'shader_color_raw' in primitive:
+                entry['shader_color_raw'] = primitive['shader_color_raw'][i].tobytes()
+            if 'texture_raw' in primitive:
+                entry['texture_raw'] = primitive['texture_raw'][i].tobytes()
+            primitives[position] = entry
+    return {
+        'num_vertices': model['num_vertices'],
+        'vertices': vertices,
+        'num_primitives': model['num_primitives'],
+        'primitives': primitives
+    }
+
 def convert_to_obj(model_data, output_filepath):
     """
     Converts parsed PS1 model data to OBJ format.
@@ -351,17 +564,55 @@ def convert_to_obj(model_data, output_filepath):
 
         print(f"The model has been successfully saved in {output_filepath}")
     
+def model_arrays_to_obj(model):
+    """
+    OBJ text of a model parsed by parse_ps1_model_arrays, same content as convert_to_obj.
+    Vertices are formatted in one np.savetxt call, faces per primitive class.
+    """
+    out = io.StringIO()
+    out.write(f"# Vertices: {model['num_vertices']}\n")
+    out.write(f"# Primitives: {model['num_primitives']}\n\n")
+
+    vertices = model['vertices']
+    if len(vertices):
+        np.savetxt(out, np.column_stack((vertices['x'], vertices['y'], vertices['z'])), fmt="v %d %d %d")
+    out.write("\n")
+
+    # Faces are written in primitive order, quads as 1 2 4 3
+    faces = [None] * model['num_primitives']
+    for primitive in model['primitives'].values():
+        indices = primitive['vertex_indices'].astype(np.int64) + 1
+        if indices.shape[1] == 4:
+            lines = [f"f {a} {b} {d} {c}\n" for a, b, c, d in indices.tolist()]
+        else:
+            lines = [f"f {a} {b} {c}\n" for a, b, c in indices.tolist()]
+        for position, line in zip(primitive['positions'].tolist(), lines):
+            faces[position] = line
+    out.write(''.join(faces))
+    return out.getvalue()
+
+def write_obj(model, output_filepath):
+    """Writes a model parsed by parse_ps1_model_arrays as OBJ in one write"""
+    with open(output_filepath, 'w') as f:
+        f.write(model_arrays_to_obj(model))
+
 def main():
     parser = argparse.ArgumentParser(
         description="Parse .model file"
     )
     parser.add_argument("file", help="Input .model file")
     parser.add_argument("out", help="Path to write parsed .obj model")
+    parser.add_argument("--vectorized", help="Parse with numpy (parse_ps1_model_arrays)", action="store_true")
     args = parser.parse_args()
     
     with open(args.file, 'rb') as f1:
         data = f1.read()
 
+    if args.vectorized:
+        write_obj(parse_ps1_model_arrays(data), args.out)
+        print(f"The model has been successfully saved in {args.out}")
+        return
+
     parsed_model = parse_ps1_model_data(data)
     
     convert_to_obj(parsed_model, args.out)
@@ -1,13 +1,42 @@
-import struct, argparse, json, os
+import struct, argparse, json, os, re
 
 from unpack_spirit import align_4
 from font_mapper import FontMapper
 
 import csv
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Alignment
 from unpack_spirit import find_signature
 
+SCRIPT_ID_RE = re.compile(r'file_(\d+)')
+
+def script_id_from_path(path):
+    """
+    Returns the script id of a file_<id>.* path, or the file base name for other paths.
+    """
+    base_name = os.path.splitext(os.path.basename(path))[0]
+    match = SCRIPT_ID_RE.fullmatch(base_name)
+    return match.group(1) if match else base_name
+
+def make_text_key(script_id, index):
+    """Stable text entry key: <script id>:<table index>"""
+    return f"{script_id}:{index}"
+
+def split_text_key(key):
+    """Splits <script id>:<table index> key, numeric indexes are returned as int"""
+    script_id, index = key.split(':', 1)
+    return script_id, int(index) if index.isdigit() else index
+
+def table_entry_sizes(table_offsets, end):
+    """
+    Sizes of text table entries: every entry runs to the next greater offset (or end).
+    Entries sharing an offset (pooled strings) get the size of the shared copy.
+    """
+    bounds = sorted(set(table_offsets)) + [end]
+    next_bound = dict(zip(bounds, bounds[1:]))
+    return [next_bound[table_offset] - table_offset for table_offset in table_offsets]
+
 # Excel export
 def export_to_csv(entries, filename):
     with open(filename, mode='w', newline='', encoding='shift_jis', errors='replace') as file:
@@ -47,6 +76,41 @@ def export_to_excel_escape(entries, filename, default_row_height=15):
 
     wb.save(filename)
 
+def export_to_excel_stream(entries, filename):
+    """
+    Same layout as export_to_excel_escape, but written in write-only mode
+    so rows are streamed to disk instead of kept in memory.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    alignment = Alignment(wrap_text=True, vertical='top')
+
+    for item in entries:
+        # Escape line breaks \n -> \\n
+        cell = WriteOnlyCell(ws, value=item.replace('\n', '\\n'))
+        cell.alignment = alignment
+        ws.append([cell])
+
+    wb.save(filename)
+
+def export_scripts_to_excel(scripts, filename):
+    """
+    Writes several scripts into one workbook in write-only mode.
+    scripts maps script id -> text entries, every script gets its own sheet
+    with the stable key (<script id>:<table index>) in column A and text in column B.
+    """
+    wb = Workbook(write_only=True)
+    alignment = Alignment(wrap_text=True, vertical='top')
+
+    for script_id, entries in scripts.items():
+        ws = wb.create_sheet(str(script_id))
+        for idx, item in enumerate(entries):
+            cell = WriteOnlyCell(ws, value=item.replace('\n', '\\n'))
+            cell.alignment = alignment
+            ws.append([make_text_key(script_id, idx), cell])
+
+    wb.save(filename)
+
 
 # Script parsers
 def parse_script_text(text_bytes, font_map: FontMapper):
@@ -207,11 +271,9 @@ def parse_dialog(data, font_map: FontMapper):
     table_entries = []
     table_raw_entries = []
     
+    table_sizes = table_entry_sizes(table_offsets, block_3_size - 4)
     for i in range(len(table_offsets)):
-        if i+1 < len(table_offsets):
-            size = table_offsets[i+1] - table_offsets[i]
-        else:
-            size = block_3_size - table_offsets[i] - 4
+        size = table_sizes[i]
         entry_offset = offset + table_offsets[i]
         table_entry = data[entry_offset:entry_offset+size]
         table_raw_entries.append(table_entry.hex())
@@ -288,12 +350,9 @@ def parse_scenario(data, font_map: FontMapper):
     
     table_entries = []
     table_raw_entries = []
+    table_sizes = table_entry_sizes(table_offsets, block_3_size - 4)
     for i in range(len(table_offsets)):
-        if i+1 < len(table_offsets):
-            size = table_offsets[i+1] - table_offsets[i]
-        else:
-            size = block_3_size - table_offsets[i] - 4
-            print("Size:", size, block_3_size, table_offsets[i])
+        size = table_sizes[i]
         entry_offset = offset + table_offsets[i]
         table_entry = data[entry_offset:entry_offset+size]
         table_raw_entries.append(table_entry.hex())
@@ -333,41 +392,52 @@ def parse_scenario(data, font_map: FontMapper):
 
 def main():
     parser = argparse.ArgumentParser(description="Parse script file")
-    parser.add_argument("file", help="Input script file (.dialog/.scenario)")
+    parser.add_argument("file", nargs='+', help="Input script file(s) (.dialog/.scenario)")
     parser.add_argument("--json_out", help="Path to save parsed data (.json)")
     parser.add_argument("--excel_out", help="Path to save Excel entries (.xlsx)")
+    parser.add_argument("--workbook_out", help="Path to save entries of all scripts into one workbook, one sheet per script (.xlsx)")
     parser.add_argument("--font_table", default="./font/font-table.txt", help="Path to font-table.txt")
     parser.add_argument("--ascii_table", default="./font/ascii-table.bin", help="Path to ascii-table.bin")
     args = parser.parse_args()
 
-    input_dir = os.path.dirname(args.file)
-    base_name = os.path.splitext(os.path.basename(args.file))[0]
-    if not args.json_out:
-        args.json_out = os.path.join(input_dir, base_name + ".json")
-    if not args.excel_out:
-        args.excel_out = os.path.join(input_dir, base_name + ".xlsx")
+    if len(args.file) > 1 and (args.json_out or args.excel_out):
+        parser.error("--json_out/--excel_out can only be used with a single input file")
+
+    font_map = FontMapper(args.ascii_table, args.font_table)
+    scripts = {}
 
-    with open(args.file, 'rb') as f1:
-        data = f1.read()
+    for file in args.file:
+        input_dir = os.path.dirname(file)
+        base_name = os.path.splitext(os.path.basename(file))[0]
+        json_out = args.json_out or os.path.join(input_dir, base_name + ".json")
+        excel_out = args.excel_out or os.path.join(input_dir, base_name + ".xlsx")
 
-    script_type = find_signature(data)
-    if script_type not in ["dialog", "scenario"]:
-        print("Wrong file type! Not .dialog/.scenario")
-        return
+        with open(file, 'rb') as f1:
+            data = f1.read()
 
-    font_map = FontMapper(args.ascii_table, args.font_table)
+        script_type = find_signature(data)
+        if script_type not in ["dialog", "scenario"]:
+            print(f"Wrong file type! Not .dialog/.scenario: {file}")
+            continue
 
-    if script_type == "dialog":
-        parsed_data = parse_dialog(data, font_map)
-    elif script_type == "scenario":
-        parsed_data = parse_scenario(data, font_map)
+        if script_type == "dialog":
+            parsed_data = parse_dialog(data, font_map)
+        elif script_type == "scenario":
+            parsed_data = parse_scenario(data, font_map)
 
-    with open(args.json_out, 'w', encoding='utf-8') as out:
-        json.dump(parsed_data, out, indent=2, ensure_ascii=False)
-    print("[+] JSON saved to:", args.json_out)
+        with open(json_out, 'w', encoding='utf-8') as out:
+            json.dump(parsed_data, out, indent=2, ensure_ascii=False)
+        print("[+] JSON saved to:", json_out)
+
+        if args.workbook_out:
+            scripts[script_id_from_path(file)] = parsed_data["block_3"]["table_entries"]
+        else:
+            export_to_excel_stream(parsed_data["block_3"]["table_entries"], excel_out)
+            print("[+] Excel saved to:", excel_out)
 
-    export_to_excel_escape(parsed_data["block_3"]["table_entries"], args.excel_out)
-    print("[+] Excel saved to:", args.excel_out)
+    if args.workbook_out:
+        export_scripts_to_excel(scripts, args.workbook_out)
+        print("[+] Workbook saved to:", args.workbook_out)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
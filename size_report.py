@@ -0,0 +1,238 @@
+import os
+import io
+import re
+import json
+import argparse
+import contextlib
+
+from font_mapper import FontMapper
+from unpack_spirit import SECTOR_SIZE, align_4, align_sector, TYPE_WITH_FILES
+from parse_script import make_text_key
+from parse_database import database_text_units
+from pack_script import pack_script_text, build_script, reflow_entries
+from pack_database import pack_database_text, build_database, load_database_texts, apply_database_texts
+from translation_store import is_store, open_store, store_texts
+from batch_pack_scripts import load_translation_map, make_jobs, load_job_texts
+from dialog_layout import load_glyph_widths
+
+DATABASE_FILE_RE = re.compile(r'^file_(\d+)\.database$')
+
+def predict_length(entry, lengths, sizes):
+    """
+    Length of an entry as rebuilt by pack_spirit, without reading any data.
+    lengths maps file ids to new file lengths, other files keep the length of .structure.json.
+    The predicted length of every container is stored in sizes (id -> length).
+    """
+    if not (entry["type"] in ("packed", "archive", "map") and entry.get("files")):
+        return lengths.get(entry["id"], entry["length"])
+
+    files = entry["files"]
+    if entry["type"] == "packed":
+        size = 4 if entry["tabed"] else 0
+        for i, file_entry in enumerate(files):
+            if i + 1 == len(files) and entry["last_tabed"]:
+                size += 4
+            size += 4 + align_4(predict_length(file_entry, lengths, sizes))
+
+    elif entry["type"] == "archive":
+        header = 4 + entry["segments"] * 4 + (4 if entry["archive_length"] else 0) + (4 if entry["sectored"] else 0)
+        size = max(header, 0x800) if entry["sectored"] else header
+        sorted_files = sorted(files, key=lambda x: x["offset"])
+        for i, file_entry in enumerate(sorted_files):
+            if i != 0 and file_entry["offset"] == sorted_files[i - 1]["offset"]:
+                continue
+            length = predict_length(file_entry, lengths, sizes)
+            size += length + align_4(length) - length
+            if entry["sectored"]:
+                size += align_sector(length) - length
+
+    else:
+        size = max(8 + 4 * len(files), 0x18) + sum(predict_length(f, lengths, sizes) for f in files)
+
+    sizes[entry["id"]] = size
+    return size
+
+def leaf_ids(entry):
+    """Ids of the regular files of an entry in layout order"""
+    if entry.get("files") and entry["type"] in TYPE_WITH_FILES:
+        files = entry["files"]
+        if entry["type"] == "archive":
+            files = sorted(files, key=lambda x: x["offset"])
+        for file_entry in files:
+            yield from leaf_ids(file_entry)
+    else:
+        yield entry["id"]
+
+def script_entry_sizes(job, font_map: FontMapper):
+    """
+    Packs the translated script of a job in memory.
+    Returns (packed data, [(key, original size, new size), ...]).
+    """
+    with open(job["json"], 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    original = data['block_3']['table_entries']
+    raw_entries = data['block_3'].get('raw_table_entries')
+    texts = load_job_texts(job, original)
+    if job.get("reflow"):
+        texts = reflow_entries(texts, original, load_glyph_widths(job["widths"]) if job.get("widths") else None)
+
+    entries = []
+    for index, text in enumerate(texts):
+        if raw_entries:
+            old_size = len(bytes.fromhex(raw_entries[index]))
+        else:
+            old_size = len(pack_script_text(original[index], font_map))
+        entries.append((make_text_key(job["id"], index), old_size, len(pack_script_text(text, font_map))))
+
+    data['block_3']['table_entries'] = texts
+    with contextlib.redirect_stdout(io.StringIO()):
+        bin_data = build_script(data, font_map, fixes=job.get("fixes", False), pool=job.get("pool", False))
+    return bin_data, entries
+
+def database_entry_sizes(dump_file, script_id, text_source, font_map: FontMapper, pool=False):
+    """
+    Packs a translated database in memory.
+    Returns (packed data, [(key, original size, new size), ...]).
+    """
+    with open(dump_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    original = dict(database_text_units(data))
+    if is_store(text_source):
+        conn = open_store(text_source)
+        texts = store_texts(conn, script_id)
+        conn.close()
+    else:
+        texts = load_database_texts(text_source, script_id)
+    apply_database_texts(data, texts)
+
+    entries = []
+    for index, text in database_text_units(data):
+        old_size = len(pack_database_text(original[index], font_map))
+        entries.append((make_text_key(script_id, index), old_size, len(pack_database_text(text, font_map))))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        bin_data = build_database(data, font_map, pool)
+    return bin_data, entries
+
+def find_database_files(spirit_dir):
+    databases = {}
+    for root, _, files in os.walk(spirit_dir):
+        for name in files:
+            match = DATABASE_FILE_RE.match(name)
+            if match:
+                databases[int(match.group(1))] = os.path.join(root, name)
+    return databases
+
+def size_report(spirit_dir, mapping, font_map: FontMapper, database_text=None, pool=False):
+    """
+    Encodes every translated script (and database) without writing files and propagates
+    the new file lengths through the containers of .structure.json.
+
+    Returns a dict with:
+        files      - id -> (original length, new length, entries)
+        containers - id -> (original length, new length) of nested containers
+        sectors    - list of top-level entries that changed:
+                     (id, spirit sector, original length, new length, crossing entries)
+    crossing entries are the (key, cumulative growth) at which the growth of a sector
+    first exceeds the padding left in its last 2048-byte sector, and every further sector.
+    With pool=True scripts and databases are packed with string pooling (entry sizes stay unpooled).
+    """
+    with open(os.path.join(spirit_dir, ".structure.json"), 'r', encoding='utf-8') as f:
+        structure = json.load(f)
+
+    original_lengths = {}
+    def collect_lengths(entries):
+        for entry in entries:
+            original_lengths[entry["id"]] = entry["length"]
+            collect_lengths(entry.get("files", []))
+    collect_lengths(structure)
+
+    files = {}
+    for job in make_jobs(spirit_dir, mapping, pool=pool):
+        bin_data, entries = script_entry_sizes(job, font_map)
+        files[job["id"]] = (original_lengths[job["id"]], len(bin_data), entries)
+
+    if database_text:
+        for file_id, path in find_database_files(spirit_dir).items():
+            dump_file = os.path.splitext(path)[0] + ".json"
+            if os.path.exists(dump_file):
+                bin_data, entries = database_entry_sizes(dump_file, str(file_id), database_text, font_map, pool)
+                files[file_id] = (original_lengths[file_id], len(bin_data), entries)
+
+    lengths = {file_id: new for file_id, (_, new, _) in files.items()}
+
+    containers = {}
+    sectors = []
+    for entry in sorted(structure, key=lambda x: x["spirit_sector"]):
+        if entry["type"] == "Empty":
+            continue
+        base_sizes, new_sizes = {}, {}
+        base = predict_length(entry, {}, base_sizes)
+        new = predict_length(entry, lengths, new_sizes)
+        if entry["type"] == "packed" and entry.get("files"):
+            base += 4
+            new += 4
+        for container_id, size in new_sizes.items():
+            if container_id != entry["id"] and size != base_sizes[container_id]:
+                containers[container_id] = (base_sizes[container_id], size)
+        if new == base:
+            continue
+
+        # Walk the growing entries in layout order and note where each sector boundary is crossed
+        crossings = []
+        boundary = align_sector(base) - base
+        growth = 0
+        for file_id in leaf_ids(entry):
+            for key, old_size, new_size in files.get(file_id, (0, 0, []))[2]:
+                growth += new_size - old_size
+                while growth > boundary:
+                    crossings.append((key, growth))
+                    boundary += SECTOR_SIZE
+        sectors.append((entry["id"], entry["spirit_sector"], base, new, crossings))
+
+    return {"files": files, "containers": containers, "sectors": sectors}
+
+def main():
+    parser = argparse.ArgumentParser(description="Predict packed sizes of translated scripts and their SPIRIT sectors")
+    parser.add_argument("spirit_dir", help="Extracted SPIRIT directory")
+    parser.add_argument("translations", help="JSON mapping of script ids to translation sources (see batch_pack_scripts.py)")
+    parser.add_argument("--database_text", help="Translated database text (.po/.xlf/.tsv/.sqlite)")
+    parser.add_argument("--pool", help="Pack with identical entries written only once", action="store_true")
+    parser.add_argument("--top", type=int, default=5, help="Number of most grown entries to list per file")
+    parser.add_argument("--font_table", default="./font/font-table.txt", help="Path to font-table.txt")
+    parser.add_argument("--ascii_table", default="./font/ascii-table.bin", help="Path to ascii-table.bin")
+    args = parser.parse_args()
+
+    report = size_report(args.spirit_dir, load_translation_map(args.translations),
+                         FontMapper(args.ascii_table, args.font_table), args.database_text, args.pool)
+
+    print("[+] Files:")
+    for file_id, (old, new, entries) in sorted(report["files"].items()):
+        print(f"    file_{file_id}: {old} -> {new} ({new - old:+d})")
+        grown = sorted(entries, key=lambda e: e[1] - e[2])[:args.top]
+        for key, old_size, new_size in grown:
+            if new_size > old_size:
+                print(f"        {key}: {old_size} -> {new_size} ({new_size - old_size:+d})")
+
+    if report["containers"]:
+        print("[+] Containers:")
+        for container_id, (old, new) in sorted(report["containers"].items()):
+            print(f"    {container_id}: {old} -> {new} ({new - old:+d})")
+
+    print("[+] Sectors:")
+    total = 0
+    for entry_id, sector, old, new, crossings in report["sectors"]:
+        old_sectors = align_sector(old) // SECTOR_SIZE
+        new_sectors = align_sector(new) // SECTOR_SIZE
+        total += new_sectors - old_sectors
+        mark = "!" if new_sectors > old_sectors else " "
+        print(f"  {mark} entry {entry_id} @ sector {sector}: {old} -> {new} ({new - old:+d}) | "
+              f"sectors {old_sectors} -> {new_sectors}")
+        for key, growth in crossings:
+            print(f"        crosses a sector boundary at {key} (growth {growth:+d})")
+    print(f"[+] SPIRIT.DAT grows by {total} sector(s)")
+
+if __name__ == '__main__':
+    main()
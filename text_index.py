@@ -0,0 +1,200 @@
+import os
+import io
+import re
+import time
+import argparse
+import sqlite3
+import unicodedata
+import contextlib
+
+from font_mapper import FontMapper
+from parse_script import parse_dialog, parse_scenario, script_id_from_path, make_text_key
+from parse_database import parse_database
+from translation_formats import dump_text_units
+
+TEXT_FILE_RE = re.compile(r'^file_(\d+)\.(dialog|scenario|database)$')
+TOKEN_RE = re.compile(r'\[[^\]]*\]')
+WORD_RE = re.compile(r"[a-z0-9']+|[^\x00-\x7f\s]+")
+
+PARSERS = {
+    "dialog": parse_dialog,
+    "scenario": parse_scenario,
+    "database": parse_database,
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    script_id TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS docs (
+    doc_id INTEGER PRIMARY KEY,
+    script_id TEXT NOT NULL,
+    entry_index TEXT NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS docs_script ON docs (script_id);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    doc_id INTEGER NOT NULL,
+    PRIMARY KEY (term, doc_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id);
+"""
+
+def plain_text(text):
+    """Text without [TOKEN] markup, line breaks as spaces"""
+    return TOKEN_RE.sub(' ', text).replace('\n', ' ')
+
+def tokenize(text, unigrams=True):
+    """
+    Index terms of a text: lowercase words for Latin text, characters and
+    character bigrams for Japanese. Queries pass unigrams=False to look up
+    longer Japanese runs by their bigrams only.
+    """
+    text = unicodedata.normalize('NFKC', plain_text(text)).lower()
+    text = ''.join(ch if ch.isalnum() or ch == "'" else ' ' for ch in text)
+    terms = set()
+    for run in WORD_RE.findall(text):
+        if run[0].isascii() or len(run) == 1:
+            terms.add(run)
+            continue
+        terms.update(run[i:i + 2] for i in range(len(run) - 1))
+        if unigrams:
+            terms.update(run)
+    return terms
+
+def open_index(filename):
+    conn = sqlite3.connect(filename)
+    conn.executescript(SCHEMA)
+    return conn
+
+def find_text_files(root):
+    text_files = {}
+    for dir_path, _, files in os.walk(root):
+        for name in files:
+            match = TEXT_FILE_RE.match(name)
+            if match:
+                text_files[os.path.join(dir_path, name)] = match.group(2)
+    return text_files
+
+def remove_script(conn, script_id):
+    conn.execute("DELETE FROM postings WHERE doc_id IN (SELECT doc_id FROM docs WHERE script_id = ?)", (script_id,))
+    conn.execute("DELETE FROM docs WHERE script_id = ?", (script_id,))
+
+def index_file(conn, path, file_type, font_map):
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    # Parsers print their block layout, it is of no use while indexing
+    with contextlib.redirect_stdout(io.StringIO()):
+        parsed = PARSERS[file_type](data, font_map)
+
+    script_id = script_id_from_path(path)
+    remove_script(conn, script_id)
+    for key, text in dump_text_units(parsed, script_id):
+        entry_index = key.split(':', 1)[1]
+        cursor = conn.execute("INSERT INTO docs (script_id, entry_index, text) VALUES (?, ?, ?)",
+                              (script_id, entry_index, text))
+        conn.executemany("INSERT OR IGNORE INTO postings (term, doc_id) VALUES (?, ?)",
+                         ((term, cursor.lastrowid) for term in tokenize(text)))
+
+def update_index(conn, root, font_map):
+    """
+    Indexes new and changed script/database files of the unpacked tree
+    and drops files that no longer exist. Returns (indexed, removed) counts.
+    """
+    text_files = find_text_files(root)
+    known = {path: (mtime, size) for path, mtime, size in conn.execute("SELECT path, mtime, size FROM files")}
+
+    indexed = 0
+    with conn:
+        for path, file_type in sorted(text_files.items()):
+            stat = os.stat(path)
+            if known.get(path) == (stat.st_mtime, stat.st_size):
+                continue
+            index_file(conn, path, file_type, font_map)
+            conn.execute("INSERT OR REPLACE INTO files (path, script_id, mtime, size) VALUES (?, ?, ?, ?)",
+                         (path, script_id_from_path(path), stat.st_mtime, stat.st_size))
+            indexed += 1
+
+        removed = [path for path in known if path not in text_files]
+        for path in removed:
+            remove_script(conn, script_id_from_path(path))
+            conn.execute("DELETE FROM files WHERE path = ?", (path,))
+
+    return indexed, len(removed)
+
+def make_snippet(text, query, width=30):
+    text = plain_text(text)
+    position = text.lower().find(query.lower())
+    if position == -1:
+        position = 0
+    start = max(0, position - width // 2)
+    snippet = ' '.join(text[start:start + width + len(query)].split())
+    return ('...' if start else '') + snippet + ('...' if start + width + len(query) < len(text) else '')
+
+def search(conn, query, limit=20):
+    """
+    Returns (key, snippet) of entries containing every term of the query.
+    Japanese phrases are matched through their bigrams and then checked as substrings.
+    """
+    terms = tokenize(query, unigrams=False)
+    if not terms:
+        return []
+
+    placeholders = ','.join('?' * len(terms))
+    cursor = conn.execute(f"""
+        SELECT docs.script_id, docs.entry_index, docs.text FROM postings
+        JOIN docs ON docs.doc_id = postings.doc_id
+        WHERE postings.term IN ({placeholders})
+        GROUP BY postings.doc_id HAVING COUNT(*) = ?
+        ORDER BY CAST(docs.script_id AS INTEGER), docs.doc_id
+    """, (*terms, len(terms)))
+
+    needle = unicodedata.normalize('NFKC', query).lower()
+    phrase = not needle.isascii()
+    results = []
+    for script_id, entry_index, text in cursor:
+        if phrase and needle not in unicodedata.normalize('NFKC', plain_text(text)).lower():
+            continue
+        results.append((make_text_key(script_id, entry_index), make_snippet(text, query)))
+        if len(results) >= limit:
+            break
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Full-text search index over all game text")
+    parser.add_argument("index", help="Path to the index file (.sqlite)")
+    subparsers = parser.add_subparsers(dest="command", required=True, help="Action to perform")
+
+    p_update = subparsers.add_parser("update", help="Index new and changed files of the unpacked tree")
+    p_update.add_argument("spirit_dir", help="Extracted SPIRIT directory")
+    p_update.add_argument("--font_table", default="./font/font-table.txt", help="Path to font-table.txt")
+    p_update.add_argument("--ascii_table", default="./font/ascii-table.bin", help="Path to ascii-table.bin")
+
+    p_query = subparsers.add_parser("query", help="Search indexed text")
+    p_query.add_argument("text", help="Words or Japanese phrase to search")
+    p_query.add_argument("--limit", type=int, default=20, help="Maximum number of results")
+    args = parser.parse_args()
+
+    conn = open_index(args.index)
+
+    if args.command == "update":
+        indexed, removed = update_index(conn, args.spirit_dir, FontMapper(args.ascii_table, args.font_table))
+        print(f"[+] Indexed files: {indexed} | removed: {removed}")
+
+    elif args.command == "query":
+        start = time.perf_counter()
+        results = search(conn, args.text, args.limit)
+        elapsed = (time.perf_counter() - start) * 1000
+        for key, snippet in results:
+            print(f"{key:>24}  {snippet}")
+        print(f"[+] {len(results)} result(s) in {elapsed:.1f} ms")
+
+    conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+import os
+import re
+import argparse
+import json
+from functools import lru_cache
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape, quoteattr
+
+from parse_script import make_text_key, split_text_key, script_id_from_path
+from parse_database import database_text_units
+
+# Translation units are (key, source, target) tuples,
+# key is <script id>:<table index>, source is the original Japanese text.
+
+FORMAT_EXTENSIONS = {
+    '.po': "po",
+    '.xlf': "xliff",
+    '.xliff': "xliff",
+    '.tsv': "tsv",
+}
+
+XLIFF_NS = "urn:oasis:names:tc:xliff:document:1.2"
+RAW_ENTRY_RE = re.compile(r'^\[RAW:[0-9a-fA-F]*\]$')
+
+def get_format(filename):
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in FORMAT_EXTENSIONS:
+        raise ValueError(f"Unsupported translation format: {filename}")
+    return FORMAT_EXTENSIONS[ext]
+
+
+# Units from parsed JSON dumps
+DUMP_FILE_RE = re.compile(r'^file_\d+\.json$')
+
+def find_dump_files(root):
+    """
+    Finds every file_<id>.json dump of parse_script.py/parse_database.py under root.
+    """
+    dump_files = []
+    for dir_path, _, files in os.walk(root):
+        for name in sorted(files):
+            if DUMP_FILE_RE.match(name):
+                dump_files.append(os.path.join(dir_path, name))
+    return dump_files
+
+def dump_text_units(data, script_id):
+    """
+    Yields (key, text) of every translatable entry of a parse_script/parse_database JSON dump.
+    Entries that only hold [RAW:..] data are skipped.
+    """
+    if "topics_table" in data:
+        for index, text in database_text_units(data):
+            yield make_text_key(script_id, index), text
+    else:
+        for index, text in enumerate(data["block_3"]["table_entries"]):
+            if not RAW_ENTRY_RE.match(text):
+                yield make_text_key(script_id, index), text
+
+
+# gettext PO
+def po_quote(text):
+    text = text.replace('\\', '\\\\').replace('"', '\\"').replace('\t', '\\t')
+    lines = text.split('\n')
+    if len(lines) == 1:
+        return f'"{lines[0]}"'
+    # Multi-line strings start with an empty line, every line keeps its \n
+    parts = [line + '\\n' for line in lines[:-1]]
+    if lines[-1]:
+        parts.append(lines[-1])
+    return '""\n' + '\n'.join(f'"{part}"' for part in parts)
+
+def po_unquote(text):
+    text = text.strip()[1:-1]
+    return re.sub(r'\\(.)', lambda m: {'n': '\n', 't': '\t'}.get(m.group(1), m.group(1)), text)
+
+def write_po(units, filename):
+    with open(filename, 'w', encoding='utf-8', newline='\n') as f:
+        f.write('msgid ""\nmsgstr ""\n"Content-Type: text/plain; charset=UTF-8\\n"\n"Language: en\\n"\n\n')
+        for key, source, target in units:
+            f.write(f'msgctxt {po_quote(key)}\nmsgid {po_quote(source)}\nmsgstr {po_quote(target or "")}\n\n')
+
+def read_po(filename):
+    """
+    Yields (key, source, target) for every entry with a msgctxt key.
+    Like msgfmt, entries flagged "#, fuzzy" are not translations yet, their target is empty.
+    """
+    fields = {}
+    fuzzy = False
+    current = None
+
+    def flush():
+        if "msgctxt" in fields:
+            return fields["msgctxt"], fields.get("msgid", ""), "" if fuzzy else fields.get("msgstr", "")
+        return None
+
+    with open(filename, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('#,') and "fuzzy" in (flag.strip() for flag in line[2:].split(',')):
+                if fields:
+                    # Flags start the next entry
+                    unit = flush()
+                    if unit:
+                        yield unit
+                    fields = {}
+                fuzzy = True
+                continue
+            if not line or line.startswith('#'):
+                if not line and fields:
+                    unit = flush()
+                    if unit:
+                        yield unit
+                    fields = {}
+                    fuzzy = False
+                continue
+            if line.startswith('"'):
+                fields[current] += po_unquote(line)
+                continue
+            keyword, value = line.split(' ', 1)
+            if keyword in fields:
+                # New entry without a separating empty line
+                unit = flush()
+                if unit:
+                    yield unit
+                fields = {}
+                fuzzy = False
+            current = keyword
+            fields[current] = po_unquote(value)
+
+    unit = flush()
+    if unit:
+        yield unit
+
+
+# XLIFF 1.2
+def write_xliff(units, filename):
+    with open(filename, 'w', encoding='utf-8', newline='\n') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write(f'<xliff version="1.2" xmlns="{XLIFF_NS}">\n')
+        f.write('<file original="reikoku" datatype="plaintext" source-language="ja" target-language="en">\n<body>\n')
+        for key, source, target in units:
+            f.write(f'<trans-unit id={quoteattr(key)} xml:space="preserve">'
+                    f'<source>{escape(source)}</source>'
+                    f'<target>{escape(target or "")}</target></trans-unit>\n')
+        f.write('</body>\n</file>\n</xliff>\n')
+
+def read_xliff(filename):
+    """Yields (key, source, target) for every trans-unit"""
+    unit_tag = f"{{{XLIFF_NS}}}trans-unit"
+    for _, elem in ElementTree.iterparse(filename, events=("end",)):
+        if elem.tag != unit_tag:
+            continue
+        source = elem.find(f"{{{XLIFF_NS}}}source")
+        target = elem.find(f"{{{XLIFF_NS}}}target")
+        yield (elem.get("id"),
+               source.text or "" if source is not None else "",
+               target.text or "" if target is not None else "")
+        elem.clear()
+
+
+# Plain TSV
+def tsv_escape(text):
+    return text.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
+def tsv_unescape(text):
+    return re.sub(r'\\(.)', lambda m: {'n': '\n', 't': '\t'}.get(m.group(1), m.group(1)), text)
+
+def write_tsv(units, filename):
+    with open(filename, 'w', encoding='utf-8', newline='\n') as f:
+        f.write("key\tsource\ttarget\n")
+        for key, source, target in units:
+            f.write(f"{tsv_escape(key)}\t{tsv_escape(source)}\t{tsv_escape(target or '')}\n")
+
+def read_tsv(filename):
+    """Yields (key, source, target) for every row after the header"""
+    with open(filename, 'r', encoding='utf-8') as f:
+        next(f, None)
+        for line in f:
+            line = line.rstrip('\n')
+            if not line:
+                continue
+            key, source, target = (line.split('\t') + ['', ''])[:3]
+            yield tsv_unescape(key), tsv_unescape(source), tsv_unescape(target)
+
+
+WRITERS = {"po": write_po, "xliff": write_xliff, "tsv": write_tsv}
+READERS = {"po": read_po, "xliff": read_xliff, "tsv": read_tsv}
+
+def write_units(units, filename):
+    WRITERS[get_format(filename)](units, filename)
+
+def read_units(filename):
+    return READERS[get_format(filename)](filename)
+
+@lru_cache(maxsize=4)
+def _load_translations(filename, mtime):
+    scripts = {}
+    for key, source, target in read_units(filename):
+        if not target:
+            continue
+        script_id, index = split_text_key(key)
+        scripts.setdefault(script_id, {})[index] = target
+    return scripts
+
+def load_translations(filename):
+    """
+    Loads translated units of an interchange file.
+    Returns a mapping of script id -> {table index: text}, untranslated units are skipped.
+    Cached per file modification time, so packing many scripts reads the file once per process.
+    """
+    return _load_translations(os.path.abspath(filename), os.path.getmtime(filename))
+
+
+def export_dumps(dump_files, filename, targets_file=None):
+    """
+    Streams every entry of the JSON dumps into one interchange file.
+    Targets are taken from an existing interchange file when given.
+    """
+    targets = {}
+    if targets_file:
+        targets = {key: target for key, _, target in read_units(targets_file)}
+
+    def units():
+        for dump_file in dump_files:
+            with open(dump_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            script_id = script_id_from_path(dump_file)
+            for key, text in dump_text_units(data, script_id):
+                yield key, text, targets.get(key, "")
+
+    write_units(units(), filename)
+
+def main():
+    parser = argparse.ArgumentParser(description="Export/convert game text to PO, XLIFF 1.2 or TSV")
+    subparsers = parser.add_subparsers(dest="command", required=True, help="Action to perform")
+
+    p_export = subparsers.add_parser("export", help="Export JSON dumps into one interchange file")
+    p_export.add_argument("dumps", nargs='+', help="JSON dumps of parse_script.py/parse_database.py (file_<id>.json)")
+    p_export.add_argument("out", help="Output file (.po/.xlf/.tsv)")
+    p_export.add_argument("--targets", help="Interchange file to take existing translations from")
+
+    p_convert = subparsers.add_parser("convert", help="Convert between interchange formats")
+    p_convert.add_argument("input", help="Input file (.po/.xlf/.tsv)")
+    p_convert.add_argument("out", help="Output file (.po/.xlf/.tsv)")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_dumps(args.dumps, args.out, args.targets)
+    elif args.command == "convert":
+        write_units(read_units(args.input), args.out)
+
+    print(f"[+] Translation units saved to: {args.out}")
+
+if __name__ == '__main__':
+    main()
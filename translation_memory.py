@@ -0,0 +1,158 @@
+import re
+import argparse
+import json
+import hashlib
+import unicodedata
+from collections import defaultdict, Counter
+
+from parse_script import script_id_from_path
+from translation_formats import find_dump_files, dump_text_units
+
+TOKEN_RE = re.compile(r'\[[^\]]*\]')
+
+def normalize_source(text):
+    """
+    Normalized form used to compare source texts:
+    control tokens and whitespace removed, full/half width folded by NFKC.
+    """
+    text = TOKEN_RE.sub('', text)
+    text = unicodedata.normalize('NFKC', text)
+    return ''.join(text.split())
+
+def token_skeleton(text):
+    """Sequence of control tokens of a text, translations can only be shared between equal skeletons"""
+    return tuple(TOKEN_RE.findall(text))
+
+def text_ngrams(text, n):
+    if len(text) < n:
+        return {text} if text else set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+class TranslationMemory:
+    """
+    Index of source texts across the whole game.
+    Exact duplicates are grouped by the hash of the normalized text,
+    near matches are found through a character n-gram index.
+    """
+    def __init__(self, n=3):
+        self.n = n
+        self.sources = {}
+        self.key_hash = {}
+        self.groups = {}
+        self.normalized = {}
+        self.gram_count = {}
+        self.ngram_index = defaultdict(set)
+
+    def add(self, key, source):
+        normalized = normalize_source(source)
+        if not normalized:
+            # Control-only entries ([END], [RAW:..]) have nothing to translate
+            return
+
+        source_hash = hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+        self.sources[key] = source
+        self.key_hash[key] = source_hash
+
+        if source_hash not in self.groups:
+            self.groups[source_hash] = []
+            self.normalized[source_hash] = normalized
+            grams = text_ngrams(normalized, self.n)
+            self.gram_count[source_hash] = len(grams)
+            for gram in grams:
+                self.ngram_index[gram].add(source_hash)
+        self.groups[source_hash].append(key)
+
+    def add_dump(self, dump_file):
+        with open(dump_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for key, text in dump_text_units(data, script_id_from_path(dump_file)):
+            self.add(key, text)
+
+    def duplicates(self):
+        """Groups of keys sharing the same normalized source, largest first"""
+        groups = [keys for keys in self.groups.values() if len(keys) > 1]
+        return sorted(groups, key=len, reverse=True)
+
+    def near_matches(self, source, threshold=0.6, limit=5):
+        """
+        Returns up to limit (score, keys) of groups similar to source,
+        scored by the Dice coefficient of their n-gram sets.
+        """
+        normalized = normalize_source(source)
+        grams = text_ngrams(normalized, self.n)
+        if not grams:
+            return []
+
+        shared = Counter()
+        for gram in grams:
+            for source_hash in self.ngram_index.get(gram, ()):
+                shared[source_hash] += 1
+
+        matches = []
+        for source_hash, count in shared.items():
+            if self.normalized[source_hash] == normalized:
+                continue
+            score = 2 * count / (len(grams) + self.gram_count[source_hash])
+            if score >= threshold:
+                matches.append((score, self.groups[source_hash]))
+        matches.sort(key=lambda match: match[0], reverse=True)
+        return matches[:limit]
+
+    def fill(self, translations):
+        """
+        translations maps keys of translated entries to their text.
+        Returns key -> text for untranslated duplicates of translated entries
+        that have the same control token skeleton.
+        """
+        filled = {}
+        for keys in self.groups.values():
+            if len(keys) < 2:
+                continue
+            translated = [key for key in keys if key in translations]
+            if not translated:
+                continue
+            for key in keys:
+                if key in translations:
+                    continue
+                skeleton = token_skeleton(self.sources[key])
+                for other in translated:
+                    if token_skeleton(self.sources[other]) == skeleton:
+                        filled[key] = translations[other]
+                        break
+        return filled
+
+def build_memory(root):
+    memory = TranslationMemory()
+    for dump_file in find_dump_files(root):
+        memory.add_dump(dump_file)
+    return memory
+
+def main():
+    parser = argparse.ArgumentParser(description="Translation memory of repeated source strings")
+    parser.add_argument("root", help="Directory with file_<id>.json dumps (unpacked SPIRIT directory)")
+    parser.add_argument("--top", type=int, default=20, help="Number of duplicate groups to show")
+    parser.add_argument("--near", help="Show near matches for an entry key (<script id>:<table index>)")
+    parser.add_argument("--threshold", type=float, default=0.6, help="Minimum near match score")
+    args = parser.parse_args()
+
+    memory = build_memory(args.root)
+    duplicates = memory.duplicates()
+    repeated = sum(len(keys) - 1 for keys in duplicates)
+    print(f"[+] Entries: {len(memory.sources)} | unique sources: {len(memory.groups)} | "
+          f"duplicate groups: {len(duplicates)} | repeated entries: {repeated}")
+
+    for keys in duplicates[:args.top]:
+        text = memory.sources[keys[0]].replace('\n', '\\n')
+        print(f"{len(keys):4} x {text[:60]}")
+        print(f"       {', '.join(keys[:8])}{' ...' if len(keys) > 8 else ''}")
+
+    if args.near:
+        if args.near not in memory.sources:
+            print(f"Unknown entry key: {args.near}")
+            return
+        print(f"\nNear matches for {args.near}: {memory.sources[args.near]!r}")
+        for score, keys in memory.near_matches(memory.sources[args.near], args.threshold):
+            print(f"  {score:.2f} {memory.sources[keys[0]]!r} ({', '.join(keys[:5])})")
+
+if __name__ == '__main__':
+    main()
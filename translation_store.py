@@ -0,0 +1,222 @@
+import os
+import argparse
+import json
+import hashlib
+import sqlite3
+
+from font_mapper import FontMapper
+from parse_script import SCRIPT_ID_RE, split_text_key, script_id_from_path
+from pack_script import load_text_entries, merge_text_entries, build_script, import_scripts_from_excel
+from pack_database import build_database, apply_database_texts, is_database_workbook, load_database_texts
+from translation_formats import FORMAT_EXTENSIONS, dump_text_units, read_units
+
+STORE_EXTENSIONS = ('.sqlite', '.db')
+
+# status: new - no translation, translated - has a translation,
+#         fuzzy - the source text changed after it was translated
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    script_id TEXT NOT NULL,
+    entry_index TEXT NOT NULL,
+    source_hash TEXT NOT NULL,
+    source_text TEXT NOT NULL,
+    target_text TEXT,
+    status TEXT NOT NULL DEFAULT 'new',
+    PRIMARY KEY (script_id, entry_index)
+);
+CREATE INDEX IF NOT EXISTS entries_source_hash ON entries (source_hash);
+CREATE INDEX IF NOT EXISTS entries_source_text ON entries (source_text);
+CREATE INDEX IF NOT EXISTS entries_status ON entries (script_id, status);
+"""
+
+def is_store(filename):
+    return os.path.splitext(filename)[1].lower() in STORE_EXTENSIONS
+
+def open_store(filename):
+    conn = sqlite3.connect(filename)
+    conn.executescript(SCHEMA)
+    return conn
+
+def source_hash(data, index, text):
+    """
+    SHA-1 of the original entry bytes for scripts (raw_table_entries),
+    of the UTF-8 text for databases which don't keep raw entries.
+    """
+    raw_entries = data.get("block_3", {}).get("raw_table_entries")
+    if raw_entries and isinstance(index, int):
+        return hashlib.sha1(bytes.fromhex(raw_entries[index])).hexdigest()
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def import_dump(conn, dump_file, text_source=None):
+    """
+    Imports every entry of a parse_script/parse_database JSON dump.
+    Existing translations are kept, entries whose source changed are marked fuzzy.
+    Targets are taken from text_source (.xlsx/.po/.xlf/.tsv) when given.
+    Returns the number of imported entries.
+    """
+    with open(dump_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    script_id = script_id_from_path(dump_file)
+
+    rows = []
+    for key, text in dump_text_units(data, script_id):
+        index = split_text_key(key)[1]
+        rows.append((script_id, str(index), source_hash(data, index, text), text))
+
+    with conn:
+        conn.executemany("""
+            INSERT INTO entries (script_id, entry_index, source_hash, source_text) VALUES (?, ?, ?, ?)
+            ON CONFLICT (script_id, entry_index) DO UPDATE SET
+                status = CASE WHEN entries.source_hash != excluded.source_hash AND entries.target_text IS NOT NULL
+                              THEN 'fuzzy' ELSE entries.status END,
+                source_hash = excluded.source_hash,
+                source_text = excluded.source_text
+        """, rows)
+
+    if text_source:
+        if "block_3" in data:
+            texts = load_text_entries(text_source, script_id)
+            if isinstance(texts, list):
+                texts = dict(enumerate(texts))
+        else:
+            texts = load_database_texts(text_source, script_id)
+        sources = {row[1]: row[3] for row in rows}
+        # Rows equal to the Japanese source are untranslated copies from the parser
+        set_targets(conn, ((script_id, index, text) for index, text in texts.items()
+                           if str(index) in sources and text != sources[str(index)]))
+
+    return len(rows)
+
+def set_targets(conn, targets):
+    """
+    Stores translations, targets are (script id, table index, text) tuples.
+    """
+    with conn:
+        conn.executemany("""
+            UPDATE entries SET target_text = ?, status = 'translated'
+            WHERE script_id = ? AND entry_index = ?
+        """, ((text, str(script_id), str(index)) for script_id, index, text in targets))
+
+def import_units(conn, filename):
+    """Imports translated units of a PO/XLIFF/TSV file"""
+    set_targets(conn, (split_text_key(key) + (target,) for key, _, target in read_units(filename) if target))
+
+def store_texts(conn, script_id):
+    """
+    Returns the translations of a script as a mapping of table index -> text,
+    ready for pack_script.merge_text_entries or pack_database.apply_database_texts.
+    """
+    cursor = conn.execute("""
+        SELECT entry_index, target_text FROM entries
+        WHERE script_id = ? AND target_text IS NOT NULL AND target_text != ''
+    """, (str(script_id),))
+    return {int(index) if index.isdigit() else index: text for index, text in cursor}
+
+def build_from_store(conn, dump_file, font_map: FontMapper, fixes=False):
+    """
+    Builds a .dialog/.scenario/.database file from a JSON dump and the translations in the store.
+    """
+    with open(dump_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    texts = store_texts(conn, script_id_from_path(dump_file))
+
+    if "topics_table" in data:
+        apply_database_texts(data, texts)
+        return build_database(data, font_map)
+
+    data['block_3']['table_entries'] = merge_text_entries(data['block_3']['table_entries'], texts)
+    return build_script(data, font_map, fixes=fixes)
+
+def iter_source_texts(filename):
+    """
+    Yields (script id, table index, text) of every translated entry of a translation source:
+    a translation store, a PO/XLIFF/TSV file, a file_<id>.xlsx (script or database) or a multi-script workbook.
+    Database entries have <table>.<index>.<field> indexes.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if is_store(filename):
+        conn = open_store(filename)
+        script_ids = [row[0] for row in conn.execute("SELECT DISTINCT script_id FROM entries")]
+        scripts = {script_id: store_texts(conn, script_id) for script_id in script_ids}
+        conn.close()
+    elif ext in FORMAT_EXTENSIONS:
+        scripts = {}
+        for key, _, target in read_units(filename):
+            if target:
+                script_id, index = split_text_key(key)
+                scripts.setdefault(script_id, {})[index] = target
+    elif SCRIPT_ID_RE.fullmatch(os.path.splitext(os.path.basename(filename))[0]):
+        script_id = script_id_from_path(filename)
+        if is_database_workbook(filename):
+            texts = load_database_texts(filename, script_id)
+        else:
+            texts = load_text_entries(filename, script_id)
+        scripts = {script_id: dict(enumerate(texts)) if isinstance(texts, list) else texts}
+    else:
+        scripts = import_scripts_from_excel(filename)
+
+    for script_id, texts in scripts.items():
+        for index, text in texts.items():
+            if text:
+                yield script_id, index, text
+
+def script_digest(conn, script_id):
+    """Hash of the translations of one script, changes only when they do"""
+    hasher = hashlib.sha1()
+    for index, text in conn.execute("""
+        SELECT entry_index, target_text FROM entries WHERE script_id = ? ORDER BY entry_index
+    """, (str(script_id),)):
+        hasher.update(f"{index}\0{text}\0".encode('utf-8'))
+    return hasher.hexdigest()
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite translation store")
+    parser.add_argument("store", help="Path to the store (.sqlite/.db)")
+    subparsers = parser.add_subparsers(dest="command", required=True, help="Action to perform")
+
+    p_import = subparsers.add_parser("import", help="Import JSON dumps (and sibling .xlsx translations)")
+    p_import.add_argument("dumps", nargs='+', help="JSON dumps of parse_script.py/parse_database.py")
+    p_import.add_argument("--with_excel", action="store_true",
+                          help="Take translations from file_<id>.xlsx next to each dump")
+
+    p_units = subparsers.add_parser("import-units", help="Import translations from PO/XLIFF/TSV")
+    p_units.add_argument("file", help="Input file (.po/.xlf/.tsv)")
+
+    p_build = subparsers.add_parser("build", help="Build a script/database file from the store")
+    p_build.add_argument("dump", help="JSON dump of the file to build")
+    p_build.add_argument("out_file", help="Output file")
+    p_build.add_argument("--fixes", help="Apply various font fixes to the scripts", action="store_true")
+    p_build.add_argument("--font_table", default="./font/font-table.txt", help="Path to font-table.txt")
+    p_build.add_argument("--ascii_table", default="./font/ascii-table.bin", help="Path to ascii-table.bin")
+
+    subparsers.add_parser("stats", help="Show translation progress per status")
+    args = parser.parse_args()
+
+    conn = open_store(args.store)
+
+    if args.command == "import":
+        total = 0
+        for dump_file in args.dumps:
+            excel = os.path.splitext(dump_file)[0] + ".xlsx"
+            text_source = excel if args.with_excel and os.path.exists(excel) else None
+            total += import_dump(conn, dump_file, text_source)
+        print(f"[+] Imported {total} entries from {len(args.dumps)} dumps")
+
+    elif args.command == "import-units":
+        import_units(conn, args.file)
+        print(f"[+] Translations imported from: {args.file}")
+
+    elif args.command == "build":
+        bin_data = build_from_store(conn, args.dump, FontMapper(args.ascii_table, args.font_table), args.fixes)
+        with open(args.out_file, 'wb') as f:
+            f.write(bin_data)
+        print(f"[+] File written to: {args.out_file}")
+
+    elif args.command == "stats":
+        for status, count in conn.execute("SELECT status, COUNT(*) FROM entries GROUP BY status ORDER BY status"):
+            print(f"{status}: {count}")
+
+    conn.close()
+
+if __name__ == '__main__':
+    main()